@@ -1,3 +1,5 @@
+from .registry import PLATFORMS, PlatformInfo, list_platforms, get_platform_info, get_platform
+
 APOLLO_PLATFORMS = {
     (254, 1): 'luna_boards.amalthea:AmaltheaPlatformRev0D1',
     (255, 0): 'luna_boards.daisho:DaishoPlatform',
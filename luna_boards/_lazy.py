@@ -0,0 +1,58 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Helpers for deferring heavy LUNA gateware imports until they're actually needed. """
+
+import importlib
+
+
+def lazy_module_attributes(module_globals, attributes):
+    """ Creates a PEP 562 module ``__getattr__`` that imports module attributes on first access.
+
+    Parameters
+    ----------
+    module_globals: dict
+        The ``globals()`` of the module that will use the returned ``__getattr__``.
+    attributes: dict
+        Maps attribute names to the modules that define them; relative to the module's package,
+        if they start with a dot. Each attribute is imported at most once, and then cached in the
+        module's globals.
+    """
+
+    def __getattr__(name):
+        module = attributes.get(name)
+        if module is None:
+            raise AttributeError(f"module {module_globals['__name__']!r} has no attribute {name!r}")
+
+        value = module_globals[name] = getattr(importlib.import_module(module, module_globals["__package__"]), name)
+        return value
+
+    return __getattr__
+
+
+class LazySuperSpeedPHY:
+    """ Stands in for a platform's ``default_usb3_phy`` until a PHY is actually created.
+
+    Calling this object resolves the real PHY class -- importing whatever SerDes/PIPE gateware
+    it needs -- and then instantiates it with the provided arguments.
+    """
+
+    def __init__(self, module, name):
+        self.module = module
+        self.name   = name
+
+
+    def resolve(self):
+        """ Returns the PHY class this object stands in for. """
+        return getattr(importlib.import_module(self.module), self.name)
+
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+
+    def __repr__(self):
+        return f"<lazy {self.module}.{self.name}>"
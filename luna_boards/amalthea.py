@@ -11,6 +11,12 @@ from amaranth_boards.resources import *
 from luna.gateware.platform.core import LUNAPlatform
 from luna.gateware.architecture.car import LunaECP5DomainGenerator
 
+from .buildcache import cached_build_plan
+from .buildstats import BuildStatsMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+from .ecppack    import ECP5BitstreamMixin, ECP5BitstreamProfile
+from .apollo     import ApolloSessionMixin
+
 
 __all__ = ["AmaltheaPlatformRev0D1"]
 
@@ -20,7 +26,7 @@ __all__ = ["AmaltheaPlatformRev0D1"]
 # This is supported by a PHY feature that allows you to swap pins 13 + 14.
 #
 
-class AmaltheaPlatformRev0D1(LatticeECP5Platform, LUNAPlatform):
+class AmaltheaPlatformRev0D1(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, ApolloSessionMixin, LatticeECP5Platform, LUNAPlatform):
     name                   = "Amalthea r0.1"
 
     device                 = "LFE5U-12F"
@@ -31,6 +37,12 @@ class AmaltheaPlatformRev0D1(LatticeECP5Platform, LUNAPlatform):
     clock_domain_generator = LunaECP5DomainGenerator
     default_usb_connection = "host_phy"
 
+    # Find our boards by their Apollo debuggers, when programming many at once.
+    fleet_usb_ids          = ((0x1d50, 0x615c),)
+
+    # Compress our bitstreams, and load them with a 38.8 MHz configuration clock.
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_modes=("fast-read", "dual-spi"))
+
     #
     # Default clock frequencies for each of our clock domains.
     #
@@ -153,58 +165,42 @@ class AmaltheaPlatformRev0D1(LatticeECP5Platform, LUNAPlatform):
     connectors = []
 
     def toolchain_prepare(self, fragment, name, **kwargs):
-        overrides = {
-            'ecppack_opts': '--compress --freq 38.8'
-        }
+        plan = super().toolchain_prepare(fragment, name, **kwargs)
+        return cached_build_plan(self, plan, name, kwargs)
 
-        return super().toolchain_prepare(fragment, name, **overrides, **kwargs)
 
+    def toolchain_program(self, products, name, serial=None):
+        """ Programs the relevant LUNA board via its sideband connection.
 
-    def toolchain_program(self, products, name):
-        """ Programs the relevant LUNA board via its sideband connection. """
+        If ``serial`` is given, the board whose debugger has that USB serial number is programmed.
+        """
 
-        from apollo_fpga import ApolloDebugger
         from apollo_fpga.ecp5 import ECP5_JTAGProgrammer
 
-        # Create our connection to the debug module.
-        debugger = ApolloDebugger()
-
-        # Grab our generated bitstream, and upload it to the FPGA.
+        # Grab our generated bitstream, and upload it to the FPGA; over any open debugger session.
         bitstream =  products.get("{}.bit".format(name))
-        with debugger.jtag as jtag:
-            programmer = ECP5_JTAGProgrammer(jtag)
-            programmer.configure(bitstream)
+        with self.apollo_session(serial=serial) as session:
+            session.configure(bitstream, programmer=ECP5_JTAGProgrammer)
 
 
     def toolchain_flash(self, products, name="top"):
-        """ Programs the LUNA board's flash via its sideband connection. """
+        """ Programs the LUNA board's flash via its sideband connection.
 
-        from apollo_fpga import ApolloDebugger
-        from apollo_fpga.flash import ensure_flash_gateware_loaded
+        If ``LUNA_FLASH_MANIFESTS`` is set, only the flash sectors that changed are rewritten. The board
+        is reset once done; or, inside an :meth:`apollo_session`, once the session ends.
+        """
 
-        # Create our connection to the debug module.
-        debugger = ApolloDebugger()
-        ensure_flash_gateware_loaded(debugger, platform=self.__class__())
-
-        # Grab our generated bitstream, and upload it to the .
+        # Grab our generated bitstream, and upload it to the flash.
         bitstream =  products.get("{}.bit".format(name))
-        with debugger.flash as flash:
-            flash.program(bitstream)
-
-        debugger.soft_reset()
+        with self.apollo_session() as session:
+            session.program_flash(bitstream)
 
 
     def toolchain_erase(self):
-        """ Erases the LUNA board's flash. """
-
-        from apollo_fpga import ApolloDebugger
-        from apollo_fpga.flash import ensure_flash_gateware_loaded
-
-        # Create our connection to the debug module.
-        debugger = ApolloDebugger()
-        ensure_flash_gateware_loaded(debugger, platform=self.__class__())
+        """ Erases the LUNA board's flash.
 
-        with debugger.flash as flash:
-            flash.erase()
+        The board is reset once done; or, inside an :meth:`apollo_session`, once the session ends.
+        """
 
-        debugger.soft_reset()
+        with self.apollo_session() as session:
+            session.erase_flash()
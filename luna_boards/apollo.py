@@ -0,0 +1,397 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Reusable Apollo debugger sessions for the luna_boards platforms with Apollo debug controllers.
+
+Each program, flash or erase operation normally opens its own connection to the board's Apollo
+debugger; and each flash operation reloads the FPGA's flash-bridge gateware, then resets the board.
+A session opens the debugger once, keeps the flash bridge loaded between flash operations, and
+defers the reset until it's asked for -- or until the session ends:
+
+    platform = AmaltheaPlatformRev0D1()
+    with platform.apollo_session() as session:
+        platform.toolchain_flash(products)
+        if not session.verify_flash(products.get("top.bit")):
+            raise RuntimeError("flash verification failed")
+        session.reset()
+
+Platform operations performed while a session is open use that session's connection.
+
+Differential flashing: when ``LUNA_FLASH_MANIFESTS`` names a directory, flash operations keep a manifest
+there of the image last written to each board -- by platform and debugger serial number -- holding a
+hash of each of its flash sectors. Writing an image a board already holds is then skipped entirely;
+and writing a new one only erases and rewrites the sectors that changed:
+
+    > LUNA_FLASH_MANIFESTS=~/.cache/luna-flash python my_design.py
+
+Boards without a manifest -- or whose debugger's serial number can't be read -- have their current
+contents read back for comparison, instead. Partial writes use Apollo's JTAG programmer for the board's
+FPGA, where it can read and write the flash at an offset (as its ECP5 programmer can); with any other,
+changed images are written in full.
+"""
+
+import os
+import json
+import inspect
+import hashlib
+import logging
+import contextlib
+
+
+__all__ = ["ApolloSession", "ApolloSessionMixin", "FlashManifests"]
+
+
+# The granularity of differential flash writes; the smallest erase unit common to our SPI flashes.
+SECTOR_SIZE = 4096
+
+
+def _sector_hashes(data, sector_size=SECTOR_SIZE):
+    """ Returns the SHA-256 of each sector-sized chunk of an image. """
+    return [hashlib.sha256(data[offset:offset + sector_size]).hexdigest()
+        for offset in range(0, len(data), sector_size)]
+
+
+def _sector_runs(indices):
+    """ Groups a sorted list of sector indices into runs of consecutive sectors; as (start, end) pairs. """
+
+    runs = []
+    for index in indices:
+        if runs and runs[-1][1] == index:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+    return [tuple(run) for run in runs]
+
+
+def _supports_partial_writes(programmer):
+    """ Returns True iff an Apollo JTAG programmer can read and write its flash at an offset. """
+    try:
+        return all("offset" in inspect.signature(getattr(programmer, method)).parameters
+            for method in ("flash", "read_flash"))
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+class FlashManifests:
+    """ A directory of manifests; each recording the image last written to one board's flash.
+
+    Parameters
+    ----------
+    root: str
+        The directory manifests are kept in.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(os.path.expanduser(root))
+
+
+    def path(self, platform, serial):
+        """ Returns the path of a board's manifest. """
+        return os.path.join(self.root, type(platform).__name__, f"{serial}.json")
+
+
+    def load(self, platform, serial):
+        """ Returns the manifest of the image last written to a board; or None if it isn't known. """
+        try:
+            with open(self.path(platform, serial)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        return manifest if manifest.get("sector_size") == SECTOR_SIZE else None
+
+
+    def store(self, platform, serial, image):
+        """ Records that a board's flash now holds the given image. """
+
+        path = self.path(platform, serial)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write the manifest atomically; so an interrupted write leaves no manifest, rather than a wrong one.
+        temporary = f"{path}.tmp-{os.getpid()}"
+        with open(temporary, "w") as f:
+            json.dump({
+                "sector_size": SECTOR_SIZE,
+                "length":      len(image),
+                "sha256":      hashlib.sha256(image).hexdigest(),
+                "sectors":     _sector_hashes(image),
+            }, f, indent=2)
+        os.replace(temporary, path)
+
+
+    def forget(self, platform, serial):
+        """ Discards a board's manifest; e.g. once its flash no longer holds a known image. """
+        try:
+            os.remove(self.path(platform, serial))
+        except FileNotFoundError:
+            pass
+
+
+def _open_debugger(serial=None):
+    """ Opens a connection to an Apollo debugger; optionally, only to the one with the given serial number. """
+
+    from apollo_fpga import ApolloDebugger, DebuggerNotFound
+
+    if serial is None:
+        return ApolloDebugger()
+
+    import usb.core
+
+    def has_serial(device):
+        try:
+            return device.serial_number == serial
+        except (usb.core.USBError, ValueError):
+            # We can't read the serial numbers of devices we don't have permission to open.
+            return False
+
+    for vendor_id, product_id in ApolloDebugger.APOLLO_USB_IDS:
+        device = usb.core.find(idVendor=vendor_id, idProduct=product_id, custom_match=has_serial)
+        if device is not None:
+            return ApolloDebugger(device=device)
+
+    raise DebuggerNotFound(f"No Apollo debugger with serial number {serial} found.")
+
+
+class ApolloSession:
+    """ A connection to a board's Apollo debugger; shared between operations.
+
+    Sessions are context managers, and can be entered more than once; the connection is opened when
+    the session is first entered, and closed -- after any pending reset -- once it's left.
+
+    Parameters
+    ----------
+    platform:
+        The platform whose board we're connected to.
+    debugger: ApolloDebugger
+        An already-open debugger connection to use; or None to open one.
+    serial: str
+        The USB serial number of the debugger to open; or None to use the first one found.
+    """
+
+    def __init__(self, platform, debugger=None, *, serial=None):
+        self.platform = platform
+        self.debugger = debugger
+
+        self._serial         = serial
+
+        self._owns_debugger  = debugger is None
+        self._depth          = 0
+        self._bridge_loaded  = False
+        self._reset_pending  = False
+
+
+    def __enter__(self):
+        if self.debugger is None:
+            self.debugger = _open_debugger(self._serial)
+
+        self._depth += 1
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth:
+            return
+
+        try:
+            # Start the board running from its new flash contents; as a lone flash operation would.
+            if self._reset_pending and exc_type is None:
+                self.reset()
+        finally:
+            if self._owns_debugger:
+                close = getattr(self.debugger, "close", None)
+                if close is not None:
+                    close()
+                self.debugger = None
+
+
+    def configure(self, bitstream, programmer):
+        """ Loads a bitstream directly into the FPGA, over JTAG.
+
+        Parameters
+        ----------
+        bitstream: bytes
+            The bitstream to load.
+        programmer: type
+            The Apollo JTAG programmer class for the board's FPGA; e.g. ``ECP5_JTAGProgrammer``.
+        """
+
+        with self.debugger.jtag as jtag:
+            programmer(jtag).configure(bitstream)
+
+        # Our new configuration has replaced any flash bridge.
+        self._bridge_loaded = False
+
+
+    def _ensure_flash_bridge(self):
+        """ Loads the flash-bridge gateware into the FPGA; unless it's already there. """
+
+        if self._bridge_loaded:
+            return
+
+        from apollo_fpga.flash import ensure_flash_gateware_loaded
+        ensure_flash_gateware_loaded(self.debugger, platform=self.platform.__class__())
+        self._bridge_loaded = True
+
+
+    def program_flash(self, bitstream):
+        """ Writes a bitstream to the board's configuration flash.
+
+        Writes are differential if ``LUNA_FLASH_MANIFESTS`` is set; see :meth:`program_flash_differential`.
+        """
+
+        manifests = self._manifests()
+        if manifests is not None:
+            self.program_flash_differential(bitstream, manifests)
+            return
+
+        self._ensure_flash_bridge()
+        with self.debugger.flash as flash:
+            flash.program(bitstream)
+
+        self._reset_pending = True
+
+
+    def erase_flash(self):
+        """ Erases the board's configuration flash. """
+
+        manifests = self._manifests()
+        if manifests is not None and self.serial is not None:
+            manifests.forget(self.platform, self.serial)
+
+        self._ensure_flash_bridge()
+        with self.debugger.flash as flash:
+            flash.erase()
+
+        self._reset_pending = True
+
+
+    @property
+    def serial(self):
+        """ The serial number of the board's debugger, which identifies the board; or None if it can't be read. """
+
+        if self._serial is not None:
+            return self._serial
+
+        serial = getattr(self.debugger, "serial_number", None)
+        if serial is None:
+            serial = getattr(getattr(self.debugger, "device", None), "serial_number", None)
+        return serial or None
+
+
+    def _manifests(self):
+        """ Returns the FlashManifests named by ``LUNA_FLASH_MANIFESTS``; or None if there aren't any. """
+        root = os.environ.get("LUNA_FLASH_MANIFESTS")
+        return FlashManifests(root) if root else None
+
+
+    def program_flash_differential(self, bitstream, manifests=None):
+        """ Writes a bitstream to the board's configuration flash; rewriting only the sectors that changed.
+
+        Parameters
+        ----------
+        bitstream: bytes
+            The bitstream to write.
+        manifests: FlashManifests
+            The manifests of the images last written to each board; or None to use ``LUNA_FLASH_MANIFESTS``.
+
+        Returns the number of sectors written; which is zero if the board already held the bitstream.
+        """
+
+        bitstream = bytes(bitstream)
+        manifests = manifests or self._manifests()
+        serial    = self.serial
+        sectors   = _sector_hashes(bitstream)
+
+        # Without a serial number, we can't tell which manifest is this board's; so we don't use any.
+        if serial is None and manifests is not None:
+            logging.warning("Couldn't read the board's debugger serial number; not using a flash manifest.")
+            manifests = None
+
+        # If we know the board already holds this image, there's nothing to do.
+        manifest = manifests.load(self.platform, serial) if manifests is not None else None
+        if manifest is not None and manifest["sha256"] == hashlib.sha256(bitstream).hexdigest():
+            logging.info(f"Board {serial} already holds this bitstream; skipping flash programming.")
+            return 0
+
+        with self.debugger.jtag as jtag:
+            programmer = self.debugger.create_jtag_programmer(jtag)
+            partial    = _supports_partial_writes(programmer)
+
+            if partial:
+                # Our programmer reaches the flash over JTAG; which needs the FPGA unconfigured.
+                programmer.unconfigure()
+                self._bridge_loaded = False
+
+                # Find out what the board holds now; from our manifest, or by reading it back.
+                if manifest is not None:
+                    current = manifest["sectors"]
+                else:
+                    current = _sector_hashes(bytes(programmer.read_flash(len(bitstream))))
+
+                changed = [index for index, digest in enumerate(sectors)
+                    if index >= len(current) or current[index] != digest]
+
+                # Each write erases the sectors it covers; so rewrite each run of changed sectors at once.
+                for start, end in _sector_runs(changed):
+                    programmer.flash(bitstream[start * SECTOR_SIZE:end * SECTOR_SIZE], offset=start * SECTOR_SIZE)
+
+        if not partial:
+            changed = list(range(len(sectors)))
+            self._ensure_flash_bridge()
+            with self.debugger.flash as flash:
+                flash.program(bitstream)
+
+        logging.info(f"Wrote {len(changed)} of {len(sectors)} flash sectors to board {serial or '(unknown)'}.")
+        if manifests is not None:
+            manifests.store(self.platform, serial, bitstream)
+
+        self._reset_pending = True
+        return len(changed)
+
+
+    def verify_flash(self, bitstream):
+        """ Returns True iff the board's configuration flash starts with the given bitstream. """
+
+        self._ensure_flash_bridge()
+        with self.debugger.flash as flash:
+            contents = flash.readback()
+
+        return bytes(contents[:len(bitstream)]) == bytes(bitstream)
+
+
+    def reset(self):
+        """ Resets the board; reconfiguring its FPGA from flash. """
+
+        self.debugger.soft_reset()
+
+        self._bridge_loaded = False
+        self._reset_pending = False
+
+
+class ApolloSessionMixin:
+    """ Platform mixin that lets operations on an Apollo-equipped board share a debugger connection. """
+
+    _apollo_session = None
+
+    @contextlib.contextmanager
+    def apollo_session(self, debugger=None, *, serial=None):
+        """ Opens an :class:`ApolloSession` for this board; or re-enters the one that's already open.
+
+        If ``serial`` is given, the session connects to the board whose debugger has that USB serial number.
+        """
+
+        if self._apollo_session is not None:
+            with self._apollo_session as session:
+                yield session
+            return
+
+        self._apollo_session = ApolloSession(self, debugger, serial=serial)
+        try:
+            with self._apollo_session as session:
+                yield session
+        finally:
+            self._apollo_session = None
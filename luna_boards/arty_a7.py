@@ -23,14 +23,33 @@ from amaranth_boards.resources import *
 
 from luna.gateware.platform.core import LUNAPlatform
 
+from .pll import domain_frequencies, shared_clocks, solve_xilinx_pll, xilinx_pll_parameters
+from .buildcache import cached_build_plan
+from .buildstats import BuildStatsMixin
+from .vivado     import VivadoBitstreamMixin, VivadoBitstreamProfile, VivadoIncrementalMixin, merge_overrides
+
+
 class ArtyA7ClockDomainGenerator(Elaboratable):
     """ Clock/Reset Controller for the Arty A7. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our full-speed PHY needs a 48 MHz usb_io clock and a 12 MHz usb clock; sync can run at any
+    # frequency our PLL can reach.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "sync":   100,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("usb_io", "usb"))
 
         # Create our domains; but don't do anything else for them, for now.
         m.domains.usb     = ClockDomain()
@@ -40,47 +59,34 @@ class ArtyA7ClockDomainGenerator(Elaboratable):
         # Grab our main clock.
         clk100 = platform.request(platform.default_clk)
 
-        # USB2 PLL connections.
-        clk12         = Signal()
-        clk48         = Signal()
+        # PLL connections; sync shares a clock with usb_io if they run at the same frequency.
+        requests, aliases = shared_clocks(frequencies, ("usb", "usb_io", "sync"))
+        clocks = {domain: Signal(name=f"clk_{domain}") for domain, _ in requests}
+
         usb2_locked   = Signal()
         usb2_feedback = Signal()
-        m.submodules.usb2_pll = Instance("PLLE2_ADV",
-            p_BANDWIDTH            = "OPTIMIZED",
-            p_COMPENSATION         = "ZHOLD",
-            p_STARTUP_WAIT         = "FALSE",
-            p_DIVCLK_DIVIDE        = 1,
-            p_CLKFBOUT_MULT        = 12,
-            p_CLKFBOUT_PHASE       = 0.000,
-            p_CLKOUT0_DIVIDE       = 100,
-            p_CLKOUT0_PHASE        = 0.000,
-            p_CLKOUT0_DUTY_CYCLE   = 0.500,
-            p_CLKOUT1_DIVIDE       = 25,
-            p_CLKOUT1_PHASE        = 0.000,
-            p_CLKOUT1_DUTY_CYCLE   = 0.500,
-            p_CLKIN1_PERIOD        = 10.000,
-            i_CLKFBIN              = usb2_feedback,
-            o_CLKFBOUT             = usb2_feedback,
-            i_CLKIN1               = clk100,
-            o_CLKOUT0              = clk12,
-            o_CLKOUT1              = clk48,
-            o_LOCKED               = usb2_locked,
-        )
+        usb2_pll_config = solve_xilinx_pll(platform.default_clk_frequency, requests, speed_grade=platform.speed)
+        m.submodules.usb2_pll = Instance(f"{usb2_pll_config.primitive}_ADV", **xilinx_pll_parameters(usb2_pll_config,
+            clkin    = clk100,
+            clocks   = clocks,
+            feedback = usb2_feedback,
+            locked   = usb2_locked,
+        ))
 
         # Connect up our clock domains.
+        m.d.comb += [ClockSignal(domain).eq(clocks[domain]) for domain, _ in requests]
+        m.d.comb += [ClockSignal(domain).eq(clocks[source]) for domain, source in aliases.items()]
         m.d.comb += [
-            ClockSignal("usb")      .eq(clk12),
-            ClockSignal("usb_io")   .eq(clk48),
-
             ResetSignal("usb")      .eq(~usb2_locked),
             ResetSignal("usb_io")   .eq(~usb2_locked),
+            ResetSignal("sync")     .eq(~usb2_locked),
         ]
 
         return m
 
 
 
-class ArtyA7Platform(_CoreArtyA7Platform, LUNAPlatform):
+class ArtyA7Platform(BuildStatsMixin, VivadoIncrementalMixin, VivadoBitstreamMixin, _CoreArtyA7Platform, LUNAPlatform):
     """ Board description for the Arty A7. """
 
     name        = "Arty A7"
@@ -91,6 +97,9 @@ class ArtyA7Platform(_CoreArtyA7Platform, LUNAPlatform):
     # Use our direct USB connection for USB2
     default_usb_connection = "usb_pmod_b"
 
+    # Boot quickly from our 16 MiB quad-SPI flash (S25FL128S).
+    bitstream_profile      = VivadoBitstreamProfile(bus_width=4, config_rate=33, flash_size=16)
+
     #
     # I/O resources.
     #
@@ -118,13 +127,11 @@ class ArtyA7Platform(_CoreArtyA7Platform, LUNAPlatform):
     def toolchain_prepare(self, fragment, name, **kwargs):
 
         overrides = {
-            "script_before_bitstream":
-                "set_property BITSTREAM.CONFIG.SPI_BUSWIDTH 4 [current_design]",
-            "script_after_bitstream":
-                "write_cfgmem -force -format bin -interface spix4 -size 16 "
-                "-loadbit \"up 0x0 {name}.bit\" -file {name}.bin".format(name=name),
             "add_constraints":
                 "set_clock_groups -asynchronous -group [get_clocks -of_objects [get_pins -regexp .*/pll/CLKOUT0]] -group [get_clocks -of_objects [get_pins -regexp .*/pll/CLKOUT1]]",
         }
 
-        return super().toolchain_prepare(fragment, name, **overrides, **kwargs)
+        overrides = merge_overrides(overrides, kwargs)
+
+        plan = super().toolchain_prepare(fragment, name, **overrides)
+        return cached_build_plan(self, plan, name, overrides)
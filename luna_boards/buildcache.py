@@ -0,0 +1,235 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Content-addressed cache for luna_boards builds.
+
+Rebuilding the same gateware for the same board repeats the whole synthesis, place-and-route and
+bitstream generation flow. When a cache directory is provided in ``LUNA_BUILD_CACHE``, platforms
+instead key each build on everything that can affect its output -- the generated RTLIL/Verilog,
+constraint files and build scripts, the toolchain overrides used, and the version of every tool
+in the flow -- and reuse the products of any earlier build with the same key:
+
+    > LUNA_BUILD_CACHE=~/.cache/luna-builds python my_design.py
+
+Platforms opt in by passing the plan returned by ``toolchain_prepare`` through :func:`cached_build_plan`.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import functools
+import subprocess
+
+
+__all__ = ["BuildCache", "cached_build_plan", "toolchain_versions"]
+
+
+# Most tools report their version when given --version; these are the exceptions.
+VERSION_ARGUMENTS = {
+    "vivado":     ["-version"],
+    "yosys":      ["-V"],
+    "quartus_sh": ["--version"],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _tool_version(tool):
+    """ Returns the version string reported by a toolchain executable; memoized per process. """
+
+    name       = os.path.basename(tool)
+    arguments  = VERSION_ARGUMENTS.get(name, ["--version"])
+
+    try:
+        result = subprocess.run([tool, *arguments], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return "unavailable"
+
+    return result.stdout.decode("utf-8", errors="replace").strip()
+
+
+def toolchain_versions(platform):
+    """ Returns a dictionary mapping each tool a platform's toolchain runs onto its reported version.
+
+    Tools are located as Amaranth locates them; so an environment variable such as ``NEXTPNR_ECP5``
+    overrides the executable used.
+    """
+
+    versions = {}
+    for tool in getattr(platform, "required_tools", ()):
+        executable     = os.environ.get(tool.upper().replace("-", "_"), tool)
+        versions[tool] = _tool_version(executable)
+
+    return versions
+
+
+class BuildCache:
+    """ A directory of build products, addressed by the hash of everything that went into them.
+
+    Each entry is a subdirectory named for its key, containing the files produced by the build.
+    Entries are written to a temporary directory first, and then moved into place; so concurrent
+    builds sharing a cache never see partial entries.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(os.path.expanduser(root))
+
+
+    @staticmethod
+    def key(plan, name, *, overrides=None, versions=None):
+        """ Computes the cache key for a build plan.
+
+        Parameters
+        ----------
+        plan: BuildPlan
+            The plan to be executed; its files include the design, its constraints and build scripts.
+        name: str
+            The name of the design being built.
+        overrides: dict
+            The toolchain overrides passed to ``toolchain_prepare``.
+        versions: dict
+            The versions of the tools that will execute the plan; as from :func:`toolchain_versions`.
+        """
+
+        hasher = hashlib.sha256()
+
+        def update(label, content):
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            hasher.update(f"{label}\0{len(content)}\0".encode("utf-8"))
+            hasher.update(content)
+
+        update("name", name)
+        update("script", plan.script)
+        for filename in sorted(plan.files):
+            update(f"file:{filename}", plan.files[filename])
+        for override, value in sorted((overrides or {}).items()):
+            update(f"override:{override}", repr(value))
+        for tool, version in sorted((versions or {}).items()):
+            update(f"tool:{tool}", version)
+
+        return hasher.hexdigest()
+
+
+    def path(self, key):
+        """ Returns the directory holding the entry with the given key. """
+        return os.path.join(self.root, key[:2], key)
+
+
+    def contains(self, key):
+        return os.path.isdir(self.path(key))
+
+
+    def restore(self, key, build_dir):
+        """ Copies a cached entry's files into a build directory. """
+        os.makedirs(build_dir, exist_ok=True)
+        shutil.copytree(self.path(key), build_dir, dirs_exist_ok=True)
+
+
+    def store(self, key, build_dir, filenames):
+        """ Adds the given files from a completed build directory to the cache, under the given key. """
+
+        entry     = self.path(key)
+        temporary = f"{entry}.tmp-{os.getpid()}"
+
+        os.makedirs(temporary, exist_ok=True)
+        try:
+            for filename in filenames:
+                shutil.copy2(os.path.join(build_dir, filename), os.path.join(temporary, filename))
+
+            try:
+                os.replace(temporary, entry)
+            except OSError:
+                # Another build stored the same entry first; theirs is just as good as ours.
+                if not self.contains(key):
+                    raise
+        finally:
+            shutil.rmtree(temporary, ignore_errors=True)
+
+
+    def _seed_path(self, key):
+        return os.path.join(self.root, "seeds", f"{key}.json")
+
+
+    def load_seed(self, key):
+        """ Returns the place-and-route seed recorded for the build with the given key; or None. """
+        try:
+            with open(self._seed_path(key)) as f:
+                return json.load(f)["seed"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+    def store_seed(self, key, seed, slack):
+        """ Records the place-and-route seed that gave the build with the given key its best timing. """
+
+        path      = self._seed_path(key)
+        temporary = f"{path}.tmp-{os.getpid()}"
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, "w") as f:
+            json.dump({"seed": seed, "worst_slack": slack}, f)
+        os.replace(temporary, path)
+
+
+def _build_outputs(build_dir, name):
+    """ Returns the files in a build directory that belong to the design with the given name. """
+    return sorted(
+        filename for filename in os.listdir(build_dir)
+        if filename.startswith(name) and os.path.isfile(os.path.join(build_dir, filename))
+    )
+
+
+def cached_build_plan(platform, plan, name, overrides=None):
+    """ Wraps a BuildPlan so that executing it reuses cached build products where possible.
+
+    Returns the plan unchanged unless ``LUNA_BUILD_CACHE`` names a cache directory.
+
+    Parameters
+    ----------
+    platform:
+        The platform the plan was prepared by.
+    plan: BuildPlan
+        The plan returned by the platform's ``toolchain_prepare``.
+    name: str
+        The name of the design being built.
+    overrides: dict
+        The toolchain overrides the plan was prepared with; these are part of the cache key.
+    """
+
+    cache_dir = os.environ.get("LUNA_BUILD_CACHE")
+    if not cache_dir:
+        return plan
+
+    from amaranth.build.run import BuildPlan, LocalBuildProducts
+
+    class CachedBuildPlan(BuildPlan):
+        """ A BuildPlan that reuses the products of an identical, earlier build when executed locally.
+
+        Builds are delegated to the wrapped plan; so this composes with other plan wrappers.
+        """
+
+        def execute_local(self, root="build", *, run_script=True, **kwargs):
+            if not run_script:
+                return plan.execute_local(root, run_script=run_script, **kwargs)
+
+            cache = BuildCache(cache_dir)
+            key   = cache.key(self, name, overrides=overrides, versions=toolchain_versions(platform))
+
+            if cache.contains(key):
+                logging.info(f"Using cached build {key[:16]} of '{name}' for the {platform.name}.")
+                cache.restore(key, root)
+                return LocalBuildProducts(os.path.abspath(root))
+
+            products = plan.execute_local(root, run_script=run_script, **kwargs)
+            cache.store(key, root, _build_outputs(root, name))
+            return products
+
+    cached = CachedBuildPlan(plan.script)
+    cached.files = plan.files
+    return cached
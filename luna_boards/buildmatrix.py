@@ -0,0 +1,282 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Builds a single gateware design for many luna_boards platforms at once.
+
+Each board is built in its own worker process and its own build directory, in a bounded process pool;
+the machine's cores are shared out between the concurrent builds, according to how many threads each
+toolchain can make use of. Progress is reported per board as builds start and finish:
+
+    > python -m luna_boards.buildmatrix my_design:Device "all ECP5" "all iCE40" TinyFPGABxPlatform
+    > python -m luna_boards.buildmatrix my_design:Device all --jobs 4 --build-dir build-matrix
+
+Designs are given as ``module:name``, where ``name`` is an Elaboratable class (or any other callable
+that returns an Elaboratable) that can be called without arguments. Platforms can be given by class
+name or ``module:Class`` path; or selected by family, with "all", "all ECP5", "all iCE40", "all Xilinx"
+or "all Intel".
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import traceback
+import multiprocessing
+
+from collections        import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .registry import list_platforms, get_platform_info, get_platform
+
+
+__all__ = ["BuildResult", "select_platforms", "allocate_threads", "build_matrix"]
+
+
+#: The FPGA families selected by each "all <family>" selector.
+FAMILY_SELECTORS = {
+    "ecp5":     ["ecp5"],
+    "ice40":    ["ice40"],
+    "xilinx":   ["xc7", "spartan6"],
+    "xc7":      ["xc7"],
+    "spartan6": ["spartan6"],
+    "intel":    ["cyclone4"],
+    "cyclone4": ["cyclone4"],
+}
+
+
+# How many threads each toolchain can make use of; and the Amaranth override used to tell it so.
+#   (toolchain:  (max threads, override,            setting))
+TOOLCHAIN_THREADS = {
+    "Trellis":   (4,  "nextpnr_opts",      "--threads {threads}"),
+    "IceStorm":  (4,  "nextpnr_opts",      "--threads {threads}"),
+    "Vivado":    (8,  "script_after_read", "set_param general.maxThreads {threads}"),
+    "Quartus":   (16, "add_settings",      "set_global_assignment -name NUM_PARALLEL_PROCESSORS {threads}"),
+    "ISE":       (1,  None,                None),
+}
+
+
+class BuildResult(namedtuple("BuildResult", ["platform", "success", "duration", "build_dir", "log", "error"])):
+    """ The outcome of building a design for a single platform.
+
+    Attributes
+    ----------
+    platform: str
+        The class name of the platform built for.
+    success: bool
+        True iff the build completed.
+    duration: float
+        How long the build took, in seconds.
+    build_dir: str
+        The directory the build was run in.
+    log: str
+        The file that captured the build's output.
+    error: str
+        A short description of why the build failed; or None.
+    """
+
+
+def select_platforms(selectors):
+    """ Resolves a list of platform selectors into a list of PlatformInfo, without duplicates.
+
+    Each selector is a platform class name or ``module:Class`` path, "all", or "all <family>"; where
+    family is one of ECP5, iCE40, Xilinx, XC7, Spartan6, Intel or Cyclone4.
+    """
+
+    selected = {}
+    for selector in selectors:
+        words = selector.split()
+
+        if words == ["all"]:
+            matches = list_platforms()
+        elif len(words) == 2 and words[0] == "all":
+            families = FAMILY_SELECTORS.get(words[1].lower())
+            if families is None:
+                raise KeyError(f"unknown platform family {words[1]!r}; "
+                    f"expected one of {', '.join(FAMILY_SELECTORS)}")
+            matches = [info for family in families for info in list_platforms(family)]
+        else:
+            matches = [get_platform_info(selector)]
+
+        for info in matches:
+            selected.setdefault(info.class_name, info)
+
+    return list(selected.values())
+
+
+def allocate_threads(toolchain, jobs, cores=None):
+    """ Returns the number of threads a build using the given toolchain should use.
+
+    Cores are shared evenly between the ``jobs`` concurrent builds; but no build is given more
+    threads than its toolchain can make use of.
+    """
+    cores = cores or os.cpu_count() or 1
+    max_threads, _, _ = TOOLCHAIN_THREADS.get(toolchain, (1, None, None))
+    return max(1, min(max_threads, cores // jobs))
+
+
+def _load_design(design):
+    """ Returns the callable named by a ``module:name`` design specification. """
+    if callable(design):
+        return design
+
+    module_name, _, attribute = design.partition(":")
+    if not attribute:
+        raise ValueError(f"designs are specified as module:name; got {design!r}")
+
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _build(design, spec, build_dir, name, threads, events):
+    """ Builds a design for a single platform; run in a worker process. """
+
+    info = get_platform_info(spec)
+    events.put(("started", info.class_name, threads))
+
+    os.makedirs(build_dir, exist_ok=True)
+    log_path = os.path.join(build_dir, f"{name}-build.log")
+
+    # Tell the toolchain how many threads it has, as a keyword override; which each platform merges
+    # with its own overrides. (As always, an ``AMARANTH_<override>`` environment variable wins.)
+    _, override, setting = TOOLCHAIN_THREADS.get(info.toolchain, (1, None, None))
+    overrides = {override: setting.format(threads=threads)} if override else {}
+
+    # Capture everything the build prints -- including its toolchain's output -- in its log.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = os.dup(1), os.dup(2)
+
+    start = time.monotonic()
+    error = None
+    with open(log_path, "w") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+
+        try:
+            platform = get_platform(spec)()
+            platform.build(_load_design(design)(), name=name, build_dir=build_dir, do_program=False,
+                **overrides)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            for fd in saved_fds:
+                os.close(fd)
+
+    return BuildResult(info.class_name, error is None, time.monotonic() - start, build_dir, log_path, error)
+
+
+def _print_progress(event, platform, *details):
+    if event == "started":
+        threads, = details
+        print(f"{platform}: started ({threads} thread{'s' if threads != 1 else ''})", file=sys.stderr)
+    else:
+        result, = details
+        if result.success:
+            print(f"{platform}: built in {result.duration:.0f}s", file=sys.stderr)
+        else:
+            print(f"{platform}: FAILED after {result.duration:.0f}s ({result.error}); see {result.log}", file=sys.stderr)
+
+
+def build_matrix(design, platforms, *, build_dir="build", name="top", jobs=None, progress=_print_progress):
+    """ Builds a design for many platforms concurrently.
+
+    Parameters
+    ----------
+    design: str
+        The design to build, as a ``module:name`` specification; see the module documentation.
+        Any picklable callable that returns an Elaboratable is also accepted.
+    platforms: list
+        The platforms to build for; as platform selectors (see :func:`select_platforms`) or PlatformInfo.
+    build_dir: str
+        The directory in which each platform gets its own build directory.
+    name: str
+        The name of the top-level design; and thus of its build products.
+    jobs: int
+        The number of builds to run at once; by default, one for every four cores.
+    progress: callable
+        Called as ``progress("started", platform, threads)`` and ``progress("finished", platform, result)``
+        as each build progresses.
+
+    Returns a list of BuildResult, in the order the platforms were provided.
+    """
+
+    infos = [info if hasattr(info, "class_name") else get_platform_info(info) for info in platforms]
+
+    cores = os.cpu_count() or 1
+    jobs  = max(1, min(jobs or max(1, cores // 4), len(infos) or 1))
+
+    results = {}
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(jobs) as executor:
+        events = manager.Queue()
+
+        futures = {}
+        for info in infos:
+            directory = os.path.join(build_dir, info.class_name)
+            threads   = allocate_threads(info.toolchain, jobs, cores)
+            future    = executor.submit(_build, design, info.class_name, directory, name, threads, events)
+            futures[future] = info
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+
+            while not events.empty():
+                progress(*events.get())
+
+            for future in done:
+                info = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker itself died; e.g. because the design couldn't be pickled.
+                    result = BuildResult(info.class_name, False, 0.0,
+                        os.path.join(build_dir, info.class_name), None, f"{type(e).__name__}: {e}")
+
+                results[info.class_name] = result
+                progress("finished", info.class_name, result)
+
+    return [results[info.class_name] for info in infos]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a gateware design for many luna_boards platforms at once.")
+    parser.add_argument("design", help="the design to build, as module:name")
+    parser.add_argument("platforms", nargs="+",
+        help="platforms to build for: class names, module:Class paths, 'all' or 'all <family>'")
+    parser.add_argument("--jobs", "-j", type=int, help="the number of builds to run at once")
+    parser.add_argument("--build-dir", default="build", help="where to put each platform's build directory")
+    parser.add_argument("--name", default="top", help="the name of the top-level design")
+    args = parser.parse_args()
+
+    try:
+        platforms = select_platforms(args.platforms)
+    except KeyError as e:
+        parser.error(e.args[0])
+
+    results = build_matrix(args.design, platforms, build_dir=args.build_dir, name=args.name, jobs=args.jobs)
+
+    # Leave a summary of the whole run next to the builds.
+    os.makedirs(args.build_dir, exist_ok=True)
+    with open(os.path.join(args.build_dir, "matrix.json"), "w") as f:
+        json.dump([result._asdict() for result in results], f, indent=2)
+
+    failures = [result for result in results if not result.success]
+    print(f"{len(results) - len(failures)} of {len(results)} builds succeeded.", file=sys.stderr)
+    for result in failures:
+        print(f"  {result.platform}: {result.error}", file=sys.stderr)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
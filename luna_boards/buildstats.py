@@ -0,0 +1,340 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Per-stage timing and memory statistics for luna_boards builds.
+
+Every local build records the wall time, peak RSS and exit status of each toolchain stage -- yosys,
+nextpnr and ecppack/icepack for Lattice parts; quartus_map, quartus_fit and quartus_asm for Intel parts;
+synth_design, place_design, route_design and write_bitstream for Vivado -- in ``<name>.stats.json``,
+alongside its build products.
+
+Each tool is run through a small recorder script, which measures it as a child process; Vivado runs all of
+its stages in one process, so its per-stage figures are taken from the log it writes. Records from
+many builds can then be aggregated:
+
+    > python -m luna_boards.buildstats summarize build/ build-matrix/
+    > python -m luna_boards.buildstats summarize --json build-matrix/ > stages.json
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import shlex
+import argparse
+import datetime
+import tempfile
+import statistics
+import subprocess
+
+from collections import defaultdict
+
+
+__all__ = ["BuildStatsMixin", "instrumented_build_plan", "load_build_stats", "summarize_build_stats"]
+
+
+#: The file, in the build directory, that each build's statistics are written to.
+STATS_FILENAME = "{name}.stats.json"
+
+# The file the recorder appends its per-process records to while a build runs.
+RECORDS_FILENAME = "{name}.stages.jsonl"
+
+# Vivado reports each command's resource usage in its log; e.g.
+#   "route_design: Time (s): cpu = 00:01:02 ; elapsed = 00:00:48 . Memory (MB): peak = 2510.340 ; ..."
+VIVADO_USAGE = re.compile(
+    r"^(?P<command>\w+): Time \(s\): cpu = (?P<cpu>[\d:]+) ; elapsed = (?P<elapsed>[\d:]+) \. "
+    r"Memory \(MB\): peak = (?P<peak>[\d.]+)", re.MULTILINE)
+
+
+def _stage_name(tool):
+    """ Returns the stage name used for a toolchain executable; e.g. "nextpnr" for nextpnr-ecp5. """
+    tool = os.path.basename(tool)
+    if tool.startswith("quartus_"):
+        return tool[len("quartus_"):]
+    if tool.startswith("nextpnr"):
+        return "nextpnr"
+    return tool
+
+
+def _seconds(timestamp):
+    """ Converts a Vivado HH:MM:SS timestamp into seconds. """
+    seconds = 0
+    for part in timestamp.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def _exit_status(status):
+    """ Converts a wait status into an exit status; which is negative if a signal killed the process. """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def record(records_path, stage, command):
+    """ Runs a single toolchain command, appending its wall time, peak RSS and exit status to a record file.
+
+    Returns the command's exit status.
+    """
+
+    started = time.time()
+    process = subprocess.Popen(command)
+
+    # wait4() gives us the child's peak RSS; it's not available on Windows.
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = _exit_status(status)
+
+        # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere.
+        peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    else:
+        process.wait()
+        peak_rss = None
+
+    entry = {
+        "stage":       stage,
+        "command":     command,
+        "started":     started,
+        "wall_time":   time.time() - started,
+        "peak_rss":    peak_rss,
+        "exit_status": process.returncode,
+    }
+
+    with open(records_path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+    return process.returncode
+
+
+def _vivado_stages(log_path):
+    """ Returns stage records for each timed command in a Vivado log. """
+
+    try:
+        with open(log_path, errors="replace") as f:
+            log = f.read()
+    except OSError:
+        return []
+
+    return [{
+        "stage":       match.group("command"),
+        "wall_time":   _seconds(match.group("elapsed")),
+        "cpu_time":    _seconds(match.group("cpu")),
+        "peak_rss":    int(float(match.group("peak")) * 1024 * 1024),
+        "exit_status": 0,
+    } for match in VIVADO_USAGE.finditer(log)]
+
+
+def _write_recorder(directory, tool, records_path, real_tool):
+    """ Writes an executable script that runs a tool through our recorder; and returns its path. """
+
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command      = [sys.executable, "-m", "luna_boards.buildstats", "record", records_path, _stage_name(tool),
+        "--", real_tool]
+
+    if os.name == "nt":
+        path   = os.path.join(directory, f"{tool}.bat")
+        script = (f"@set PYTHONPATH={package_root};%PYTHONPATH%\r\n"
+            f"@{subprocess.list2cmdline(command)} %*\r\n")
+    else:
+        path   = os.path.join(directory, tool)
+        script = (f"#!/bin/sh\n"
+            f"PYTHONPATH={shlex.quote(package_root)}${{PYTHONPATH:+:$PYTHONPATH}} "
+            f"exec {' '.join(shlex.quote(part) for part in command)} \"$@\"\n")
+
+    with open(path, "w") as f:
+        f.write(script)
+    os.chmod(path, 0o755)
+
+    return path
+
+
+def instrumented_build_plan(platform, plan, name):
+    """ Wraps a BuildPlan so that executing it locally records per-stage build statistics.
+
+    Parameters
+    ----------
+    platform:
+        The platform the plan was prepared by.
+    plan: BuildPlan
+        The plan returned by the platform's ``toolchain_prepare``.
+    name: str
+        The name of the design being built.
+    """
+
+    from amaranth.build.run import BuildPlan
+
+    class InstrumentedBuildPlan(BuildPlan):
+        """ A BuildPlan that records the statistics of each toolchain stage when executed locally.
+
+        Builds are delegated to the wrapped plan; so this composes with other plan wrappers.
+        """
+
+        def execute_local(self, root="build", *, run_script=True, **kwargs):
+            if not run_script:
+                return plan.execute_local(root, run_script=run_script, **kwargs)
+
+            os.makedirs(root, exist_ok=True)
+            records_path = os.path.abspath(os.path.join(root, RECORDS_FILENAME.format(name=name)))
+            if os.path.exists(records_path):
+                os.remove(records_path)
+
+            # Amaranth runs each tool as named in its environment variable (e.g. NEXTPNR_ECP5), quoted;
+            # point each of those at a wrapper script that runs the real tool through our recorder.
+            environment = dict(os.environ)
+            wrappers    = tempfile.TemporaryDirectory(prefix="luna-buildstats-")
+            for tool in getattr(platform, "required_tools", ()):
+                variable  = tool.upper().replace("-", "_")
+                real_tool = os.environ.get(variable, tool)
+                os.environ[variable] = _write_recorder(wrappers.name, tool, records_path, real_tool)
+
+            started = time.time()
+            error   = None
+            try:
+                return plan.execute_local(root, run_script=run_script, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                os.environ.clear()
+                os.environ.update(environment)
+                wrappers.cleanup()
+                _write_build_stats(platform, name, root, records_path, started, error)
+
+    instrumented = InstrumentedBuildPlan(plan.script)
+    instrumented.files = plan.files
+    return instrumented
+
+
+def _write_build_stats(platform, name, root, records_path, started, error):
+    """ Collects the records of a completed (or failed) build into its statistics file. """
+
+    stages = []
+    try:
+        with open(records_path) as f:
+            stages = [json.loads(line) for line in f if line.strip()]
+        os.remove(records_path)
+    except OSError:
+        pass
+
+    # Vivado runs all of its stages in a single process; so break that process down using its log.
+    vivado_stages = _vivado_stages(os.path.join(root, f"{name}.log"))
+    vivado_failed = any(stage["exit_status"] != 0 for stage in stages if stage["stage"] == "vivado")
+    if vivado_stages and not vivado_failed:
+        stages = [stage for stage in stages if stage["stage"] != "vivado"] + vivado_stages
+
+    stats = {
+        "name":        name,
+        "platform":    platform.name,
+        "class":       type(platform).__name__,
+        "toolchain":   getattr(platform, "toolchain", None),
+        "started":     datetime.datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+        "wall_time":   time.time() - started,
+        "success":     error is None,
+        "error":       None if error is None else f"{type(error).__name__}: {error}",
+        "stages":      stages,
+    }
+
+    with open(os.path.join(root, STATS_FILENAME.format(name=name)), "w") as f:
+        json.dump(stats, f, indent=2)
+
+
+class BuildStatsMixin:
+    """ Platform mixin that records per-stage statistics for every local build. """
+
+    def toolchain_prepare(self, fragment, name, **kwargs):
+        plan = super().toolchain_prepare(fragment, name, **kwargs)
+        return instrumented_build_plan(self, plan, name)
+
+
+def load_build_stats(paths):
+    """ Loads every build statistics file found in the given files or directories (recursively). """
+
+    runs = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames = sorted(glob.glob(os.path.join(path, "**", STATS_FILENAME.format(name="*")), recursive=True))
+        else:
+            filenames = [path]
+
+        for filename in filenames:
+            with open(filename) as f:
+                runs.append(json.load(f))
+
+    return runs
+
+
+def summarize_build_stats(runs):
+    """ Aggregates build statistics by platform and stage.
+
+    Returns a list of dictionaries; one for each (platform, stage) pair, ordered by total wall time.
+    """
+
+    groups = defaultdict(list)
+    for run in runs:
+        for stage in run["stages"]:
+            groups[(run["class"], stage["stage"])].append(stage)
+
+    summary = []
+    for (platform, stage), entries in groups.items():
+        wall_times = [entry["wall_time"] for entry in entries]
+        peak_rss   = [entry["peak_rss"] for entry in entries if entry.get("peak_rss") is not None]
+        summary.append({
+            "platform":        platform,
+            "stage":           stage,
+            "runs":            len(entries),
+            "failures":        sum(1 for entry in entries if entry["exit_status"] != 0),
+            "total_wall_time": sum(wall_times),
+            "mean_wall_time":  statistics.mean(wall_times),
+            "max_wall_time":   max(wall_times),
+            "max_peak_rss":    max(peak_rss) if peak_rss else None,
+        })
+
+    summary.sort(key=lambda entry: entry["total_wall_time"], reverse=True)
+    return summary
+
+
+def _format_summary(summary):
+    lines = [f"{'platform':28} {'stage':18} {'runs':>5} {'fails':>5} {'total':>10} {'mean':>9} {'max':>9} {'peak RSS':>10}"]
+    for entry in summary:
+        rss = f"{entry['max_peak_rss'] / 2**20:.0f} MiB" if entry["max_peak_rss"] is not None else "-"
+        lines.append(f"{entry['platform']:28} {entry['stage']:18} {entry['runs']:5} {entry['failures']:5} "
+            f"{entry['total_wall_time']:9.1f}s {entry['mean_wall_time']:8.1f}s {entry['max_wall_time']:8.1f}s {rss:>10}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and aggregate luna_boards build statistics.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    summarize = commands.add_parser("summarize", help="aggregate the statistics of many builds")
+    summarize.add_argument("paths", nargs="+", help="build directories (searched recursively) or statistics files")
+    summarize.add_argument("--json", action="store_true", help="emit the summary as JSON")
+
+    # Used by instrumented builds; not intended to be run by hand.
+    recorder = commands.add_parser("record", help="run a toolchain command, recording its statistics")
+    recorder.add_argument("records_path")
+    recorder.add_argument("stage")
+    recorder.add_argument("tool_command", nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        command = args.tool_command[1:] if args.tool_command[:1] == ["--"] else args.tool_command
+        status = record(args.records_path, args.stage, command)
+        sys.exit(status if status >= 0 else 128 - status)
+
+    summary = summarize_build_stats(load_build_stats(args.paths))
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        print(_format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Offline clock-tree reports for the luna_boards platforms.
+
+A platform's clock domain generator is elaborated on its own -- without the rest of a design, and
+without running any vendor tools -- and the PLLs it instantiates (EHXPLLL, PLLE2/MMCME2, SB_PLL40
+and ALTPLL) are evaluated from their parameters. The result lists the frequency, phase, source and
+reset of every clock domain:
+
+    > python -m luna_boards.clocktree ULX3S_85F_Platform
+    > python -m luna_boards.clocktree OrangeCrabPlatformR0D2 --clock-frequency sync=60
+    > python -m luna_boards.clocktree --all --json
+
+This requires Amaranth, amaranth-boards and LUNA; but no toolchain.
+"""
+
+import sys
+import json
+import argparse
+
+from collections import namedtuple
+
+from .registry import PLATFORMS, get_platform, get_platform_info
+from .pll      import PLLConfigurationError
+from .pll      import evaluate_ehxplll, evaluate_xilinx_pll, evaluate_sb_pll40, evaluate_altpll
+
+
+__all__ = ["PLLReport", "DomainReport", "ClockTreeReport", "clock_tree", "format_clock_tree"]
+
+
+# The PLL primitives we know how to evaluate:
+#   (type prefix,  evaluator,           input clock ports)
+PLL_PRIMITIVES = [
+    ("EHXPLLL",    evaluate_ehxplll,    ("CLKI",)),
+    ("PLLE2_",     evaluate_xilinx_pll, ("CLKIN1",)),
+    ("MMCME2_",    evaluate_xilinx_pll, ("CLKIN1",)),
+    ("SB_PLL40_",  evaluate_sb_pll40,   ("PACKAGEPIN", "REFERENCECLK")),
+    ("ALTPLL",     evaluate_altpll,     ("inclk",)),
+]
+
+
+class PLLReport(namedtuple("PLLReport",
+        ["name", "primitive", "input_frequency", "input_source", "vco_frequency", "outputs", "warnings"])):
+    """ The evaluated configuration of a single PLL instance.
+
+    Attributes
+    ----------
+    name: str
+        The PLL's hierarchical name within the domain generator; e.g. "usb2_pll".
+    primitive: str
+        The instantiated primitive; e.g. "PLLE2_ADV".
+    input_frequency: float
+        The frequency of the PLL's input clock, in Hz; or None if it couldn't be determined.
+    input_source: str
+        Where the PLL's input clock comes from.
+    vco_frequency: float
+        The PLL's VCO frequency, in Hz; or None if it isn't known.
+    outputs: dict
+        Maps each of the PLL's output ports onto the ``(frequency, phase)`` it produces.
+    warnings: list of str
+        Any inconsistencies found; e.g. an input frequency parameter that doesn't match the input clock.
+    """
+
+
+class DomainReport(namedtuple("DomainReport", ["name", "frequency", "phase", "source", "reset"])):
+    """ The clock and reset of a single clock domain.
+
+    Attributes
+    ----------
+    name: str
+        The domain's name.
+    frequency, phase: float
+        The domain clock's frequency (in Hz) and phase (in degrees); or None if it's driven from
+        outside the domain generator (e.g. by a ULPI or PIPE PHY).
+    source: str
+        Where the domain's clock comes from; e.g. "pll.CLKOS".
+    reset: str
+        A description of what drives the domain's reset; e.g. "~pll.LOCK".
+    """
+
+
+class ClockTreeReport(namedtuple("ClockTreeReport", ["platform", "generator", "plls", "domains"])):
+    """ The clock tree produced by a platform's domain generator; as returned by :func:`clock_tree`. """
+
+    def domain(self, name):
+        """ Returns the DomainReport for the domain with the given name. """
+        for domain in self.domains:
+            if domain.name == name:
+                return domain
+
+        raise KeyError(name)
+
+
+def _pll_primitive(instance_type):
+    """ Returns the PLL_PRIMITIVES entry for an instance type; or None if it isn't a PLL we know. """
+    for prefix, evaluator, input_ports in PLL_PRIMITIVES:
+        if instance_type.upper().startswith(prefix):
+            return evaluator, input_ports
+    return None
+
+
+def _declared_input_frequency(instance):
+    """ Returns the input frequency an instance's own parameters claim it receives; or None. """
+
+    parameters = {name.upper(): value for name, value in instance.parameters.items()}
+    if "CLKIN1_PERIOD" in parameters:
+        return 1e9 / float(parameters["CLKIN1_PERIOD"])
+    if "INCLK0_INPUT_FREQUENCY" in parameters:
+        return 1e12 / float(parameters["INCLK0_INPUT_FREQUENCY"])
+    if "FREQUENCY_PIN_CLKI" in instance.attrs:
+        return float(instance.attrs["FREQUENCY_PIN_CLKI"]) * 1e6
+    return None
+
+
+def _walk(fragment, path=()):
+    """ Yields each fragment in a hierarchy, along with its path. """
+    yield path, fragment
+
+    # Newer versions of Amaranth also record where each subfragment was added.
+    for index, entry in enumerate(fragment.subfragments):
+        subfragment, name = entry[0], entry[1]
+        yield from _walk(subfragment, path + (name or f"U${index}",))
+
+
+def _statements(statements):
+    """ Yields every assignment in a list of statements; including those nested in conditionals. """
+
+    # Newer versions of Amaranth group statements by domain.
+    if isinstance(statements, dict):
+        statements = [statement for group in statements.values() for statement in group]
+
+    for statement in statements:
+        if hasattr(statement, "cases"):
+            for case in statement.cases.values():
+                yield from _statements(case)
+        elif hasattr(statement, "lhs"):
+            yield statement
+
+
+def _key(value):
+    """ Returns a hashable key identifying a clock, reset or signal; or None for other values. """
+
+    from amaranth.hdl import Signal, ClockSignal, ResetSignal
+
+    if isinstance(value, ClockSignal):
+        return ("clk", value.domain)
+    if isinstance(value, ResetSignal):
+        return ("rst", value.domain)
+    if isinstance(value, Signal):
+        return ("sig", id(value))
+    return None
+
+
+def _leaves(value):
+    """ Splits a composite value (a Cat, or a Record from ``platform.request``) into its parts. """
+
+    from amaranth.hdl import Cat
+
+    if isinstance(value, Cat):
+        parts = value.parts
+    elif hasattr(value, "fields"):
+        parts = list(value.fields.values())
+    else:
+        return [value]
+
+    return [leaf for part in parts for leaf in _leaves(part)]
+
+
+def _output_names(port, value):
+    """ Yields each part of the value an instance port drives; along with the name of its output.
+
+    The parts of a composite value are named by the port bit they start at -- e.g. ``clk[1]`` --
+    which is how the PLL evaluators key the outputs of their vector ports.
+    """
+    leaves = _leaves(value)
+    if len(leaves) == 1 and leaves[0] is value:
+        yield port, value
+        return
+
+    offset = 0
+    for leaf in leaves:
+        yield f"{port}[{offset}]", leaf
+        offset += len(leaf)
+
+
+def _clock_constraints(platform):
+    """ Yields each signal the platform has a clock constraint for; along with its frequency. """
+
+    # Templated platforms only report the clocks of signals in the design they're building; and
+    # outside of a build, there's no such design. Our domain generator is elaborated on its own --
+    # and clocks are only ever looked up by its signals -- so every constrained clock is reported.
+    had_name_map = "_name_map" in vars(platform)
+    if not had_name_map:
+        platform._name_map = _EverySignal()
+
+    try:
+        # Newer versions of Amaranth report signal constraints separately from port constraints.
+        if hasattr(platform, "iter_signal_clock_constraints"):
+            yield from platform.iter_signal_clock_constraints()
+            return
+
+        for net_signal, port_signal, frequency in platform.iter_clock_constraints():
+            yield net_signal, frequency
+    finally:
+        if not had_name_map:
+            del platform._name_map
+
+
+class _EverySignal:
+    """ Stands in for a platform's name map; containing every signal. """
+
+    def __contains__(self, signal):
+        return True
+
+
+def clock_tree(platform, clock_frequencies=None):
+    """ Elaborates a platform's clock domain generator; and reports on the clock tree it creates.
+
+    Parameters
+    ----------
+    platform:
+        An instance of the platform to report on.
+    clock_frequencies: dict
+        If provided, passed to the domain generator; mapping domain names to frequencies in MHz.
+
+    Returns a ClockTreeReport.
+    """
+
+    from amaranth.hdl import Const, Fragment, Instance, ResetSignal
+
+    generator = platform.clock_domain_generator(clock_frequencies=clock_frequencies)
+    top       = Fragment.get(generator, platform)
+
+    drivers      = {}  # key -> (value driving it, path, fragment)
+    outputs      = {}  # key -> (instance path, port name)
+    instances    = {}  # path -> Instance
+    synchronizes = {}  # id(fragment) -> the asynchronous reset its flops are synchronized from
+    domains      = []
+
+    for path, fragment in _walk(top):
+        local = set()
+        for name, domain in fragment.domains.items():
+            if domain.local:
+                local.add(name)
+            elif name not in domains:
+                domains.append(name)
+
+        if isinstance(fragment, Instance):
+            instances[path] = fragment
+
+            for port, (value, direction) in fragment.named_ports.items():
+                if direction == "i":
+                    continue
+
+                for output, leaf in _output_names(port, value):
+                    key = _key(leaf)
+                    if key is not None:
+                        outputs[key] = (path, output)
+            continue
+
+        for statement in _statements(fragment.statements):
+            key = _key(statement.lhs)
+            if key is None:
+                continue
+
+            # A reset synchronizer clocks its flops in a local domain, whose (asynchronous) reset
+            # is the one being synchronized; so we note what drives it, rather than the domain.
+            if key[0] in ("clk", "rst") and key[1] in local:
+                if key[0] == "rst" and fragment.domains[key[1]].async_reset:
+                    synchronizes[id(fragment)] = statement.rhs
+                continue
+
+            drivers.setdefault(key, (statement.rhs, path, fragment))
+
+    # The clocks that are constrained by the platform; e.g. those of its clock pins.
+    constrained = {id(signal): frequency for signal, frequency in _clock_constraints(platform)}
+
+    # If our generator doesn't create a sync domain, the platform creates one from its default clock.
+    if "sync" not in domains:
+        domains.insert(0, "sync")
+        default_sync = True
+    else:
+        default_sync = False
+
+    plls = {}
+
+    def evaluate_pll(path, instance):
+        """ Evaluates a single PLL; memoizing the result. """
+        name = ".".join(path)
+        if name in plls:
+            return plls[name]
+
+        # Guard against (pathological) feedback loops between PLLs.
+        plls[name] = None
+
+        evaluator, input_ports = _pll_primitive(instance.type)
+        warnings = []
+
+        input_value = next((instance.named_ports[port][0] for port in input_ports if port in instance.named_ports), None)
+        traced      = resolve_clock(_key(_leaves(input_value)[0])) if input_value is not None else None
+        declared    = _declared_input_frequency(instance)
+
+        if traced is not None:
+            input_frequency, _, input_source = traced
+            if declared is not None and abs(declared - input_frequency) / input_frequency > 1e-3:
+                warnings.append(f"parameters declare a {declared / 1e6:g} MHz input, "
+                    f"but it's clocked at {input_frequency / 1e6:g} MHz")
+        elif declared is not None:
+            input_frequency, input_source = declared, "external (as declared)"
+        else:
+            input_frequency, input_source = platform.default_clk_frequency, "unknown (assuming the default clock)"
+            warnings.append(f"couldn't trace the input clock; assuming {input_frequency / 1e6:g} MHz")
+
+        parameters = {name: value for name, value in instance.parameters.items()}
+        vco_frequency, pll_outputs = evaluator(parameters, input_frequency)
+
+        plls[name] = PLLReport(name, instance.type, input_frequency, input_source, vco_frequency,
+            pll_outputs, warnings)
+        return plls[name]
+
+
+    def resolve_clock(key, seen=()):
+        """ Returns the (frequency, phase, source) of a clock; or None if it's driven externally. """
+
+        if key is None or key in seen:
+            return None
+
+        if key in outputs:
+            path, port = outputs[key]
+            instance   = instances[path]
+            if _pll_primitive(instance.type):
+                report = evaluate_pll(path, instance)
+                if report is not None and port in report.outputs:
+                    frequency, phase = report.outputs[port]
+                    return frequency, phase, f"{report.name}.{port}"
+            return None
+
+        if key in drivers:
+            value, _, _ = drivers[key]
+            resolved = resolve_clock(_key(value), seen + (key,))
+            if resolved is not None:
+                return resolved
+
+        if key[0] == "sig" and key[1] in constrained:
+            return constrained[key[1]], 0.0, "constrained clock"
+
+        if key == ("clk", "sync") and default_sync:
+            return platform.default_clk_frequency, 0.0, f"{platform.default_clk} (default clock)"
+
+        return None
+
+
+    def describe(value, seen=()):
+        """ Returns a short, human-readable description of a reset (or other) signal. """
+
+        if isinstance(value, Const):
+            return str(value.value)
+        operands = getattr(value, "operands", ())
+        if hasattr(value, "operator") and len(operands) == 1:
+            return f"{value.operator}{describe(operands[0], seen)}"
+        if hasattr(value, "operator") and len(operands) == 2:
+            left, right = (describe(operand, seen) for operand in operands)
+            return f"({left} {value.operator} {right})"
+
+        key = _key(value)
+        if key is None:
+            return repr(value)
+        if key in seen:
+            return "<loop>"
+
+        if key in outputs:
+            path, port = outputs[key]
+            return f"{'.'.join(path)}.{port}"
+
+        if key in drivers:
+            driver, path, fragment = drivers[key]
+
+            synchronized = synchronizes.get(id(fragment))
+            if synchronized is not None:
+                return f"ResetSynchronizer({describe(synchronized, seen + (key,))})"
+
+            # Follow clock and reset aliases; but name signals by where they're driven.
+            if key[0] in ("clk", "rst"):
+                return describe(driver, seen + (key,))
+
+            return ".".join(path + (value.name,))
+
+        if key[0] == "rst":
+            return "none"
+        if key[0] == "clk":
+            return f"{key[1]} clock"
+        return f"{value.name} (undriven)"
+
+
+    domain_reports = []
+    for name in domains:
+        resolved = resolve_clock(("clk", name))
+        if resolved is None:
+            frequency, phase, source = None, None, "external"
+        else:
+            frequency, phase, source = resolved
+
+        reset = describe(ResetSignal(name))
+        domain_reports.append(DomainReport(name, frequency, phase, source, reset))
+
+    # Evaluate any PLLs that don't feed a domain, too; so they're still reported.
+    for path, instance in instances.items():
+        if _pll_primitive(instance.type):
+            evaluate_pll(path, instance)
+
+    return ClockTreeReport(platform.name, type(generator).__name__,
+        [report for report in plls.values() if report is not None], domain_reports)
+
+
+def format_clock_tree(report):
+    """ Formats a ClockTreeReport as a human-readable table. """
+
+    lines = [f"{report.platform} ({report.generator})"]
+
+    for pll in report.plls:
+        vco = f", VCO {pll.vco_frequency / 1e6:g} MHz" if pll.vco_frequency else ""
+        lines.append(f"  {pll.name:14} {pll.primitive:16} {pll.input_frequency / 1e6:g} MHz "
+            f"from {pll.input_source}{vco}")
+        for warning in pll.warnings:
+            lines.append(f"  {'':14} warning: {warning}")
+
+    lines.append(f"  {'domain':14} {'frequency':>14} {'phase':>9}  {'source':24} reset")
+    for domain in report.domains:
+        frequency = f"{domain.frequency / 1e6:10.4f} MHz" if domain.frequency is not None else "-"
+        phase     = f"{domain.phase:7.2f}deg" if domain.phase is not None else "-"
+        lines.append(f"  {domain.name:14} {frequency:>14} {phase:>9}  {domain.source:24} {domain.reset}")
+
+    return "\n".join(lines)
+
+
+def _parse_clock_frequency(text):
+    domain, _, frequency = text.partition("=")
+    try:
+        return domain, float(frequency)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected DOMAIN=MHZ; got {text!r}") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the clock tree of luna_boards platforms, without synthesis.")
+    parser.add_argument("platforms", nargs="*", help="platforms to report on; by class name or module:Class path")
+    parser.add_argument("--all", action="store_true", help="report on every platform in luna_boards")
+    parser.add_argument("--clock-frequency", "-f", metavar="DOMAIN=MHZ", action="append",
+        type=_parse_clock_frequency, default=[], help="request a domain frequency from the domain generator")
+    parser.add_argument("--json", action="store_true", help="emit the reports as JSON")
+    args = parser.parse_args()
+
+    specs = list(PLATFORMS) if args.all else args.platforms
+    if not specs:
+        parser.error("specify one or more platforms, or --all")
+
+    clock_frequencies = dict(args.clock_frequency) or None
+
+    reports  = []
+    failures = 0
+    for spec in specs:
+        name = get_platform_info(spec).class_name
+        # Report any platform we can't evaluate; but carry on with the rest of them.
+        try:
+            report = clock_tree(get_platform(spec)(), clock_frequencies=clock_frequencies)
+        except PLLConfigurationError as e:
+            print(f"{name}: {e}", file=sys.stderr)
+            failures += 1
+            continue
+        except Exception as e:
+            print(f"{name}: couldn't elaborate its domain generator: {type(e).__name__}: {e}", file=sys.stderr)
+            failures += 1
+            continue
+
+        reports.append((name, report))
+        if not args.json:
+            print(format_clock_tree(report))
+            print()
+
+    if args.json:
+        json.dump({
+            name: {
+                "platform":  report.platform,
+                "generator": report.generator,
+                "plls":      [pll._asdict() for pll in report.plls],
+                "domains":   [domain._asdict() for domain in report.domains],
+            } for name, report in reports
+        }, sys.stdout, indent=2)
+        print()
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,11 @@ from amaranth_boards.resources import *
 from luna.gateware.platform.core import LUNAPlatform
 from luna.gateware.architecture.car import PHYResetController
 
+from .pll import domain_frequencies, solve_altpll, altpll_parameters
+from .buildstats import BuildStatsMixin
+from .quartus    import QuartusProfileMixin
+from .apollo     import ApolloSessionMixin
+
 
 __all__ = ["DaishoPlatform"]
 
@@ -24,9 +29,27 @@ __all__ = ["DaishoPlatform"]
 class DaishoClockAndResetController(Elaboratable):
     """ Controller for Daisho's clocking and global resets. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # None of these can currently be changed: sync and fast run directly from our 50 MHz oscillator,
+    # and usb is clocked by the PHY.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast": 50,
+        "sync": 50,
+        "usb":  60,
+    }
+
+    def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
+        self.clock_frequencies = clock_frequencies
+
     def elaborate(self, platform):
         m = Module()
 
+        # Reject any request for a frequency we can't provide.
+        domain_frequencies(self, platform, fixed=self.DEFAULT_CLOCK_FREQUENCIES_MHZ)
+
         # Standard LUNA domains.
         m.domains.usb     = ClockDomain()
         m.domains.fast    = ClockDomain()
@@ -60,87 +83,26 @@ class DaishoClockAndResetController(Elaboratable):
         )
 
         # PLL for our USB3 domains.
+        # Our PLL is driven from the I/O domain, which is typically set from the PHY's 250 MHz PCLK.
+        pll_config = solve_altpll(250e6, (
+            ("clk_62M5",   62.5e6),
+            ("pipe_rx",    125e6),
+            ("pipe_tx",    125e6, 220),
+            ("clk_250",    250e6),
+            ("pipe_io_tx", 250e6, 180),
+        ), speed_grade=platform.speed)
         m.submodules.pll = Instance("ALTPLL",
-            # PLL configuration parameters; copied from the Daisho USB3 Core.
-            p_bandwidth_type = "AUTO",
-            p_clk0_divide_by = 4,
-            p_clk0_duty_cycle = 50,
-            p_clk0_multiply_by = 1,
-            p_clk0_phase_shift = "0",
-            p_clk1_divide_by = 2,
-            p_clk1_duty_cycle = 50,
-            p_clk1_multiply_by = 1,
-            p_clk1_phase_shift = "0",
-            p_clk2_divide_by = 2,
-            p_clk2_duty_cycle = 50,
-            p_clk2_multiply_by = 1,
-            p_clk2_phase_shift = "4889",
-            p_clk3_divide_by = 1,
-            p_clk3_duty_cycle = 50,
-            p_clk3_multiply_by = 1,
-            p_clk3_phase_shift = "0",
-            p_clk4_divide_by = 1,
-            p_gate_lock_signal="YES",
-            p_clk4_duty_cycle = 50,
-            p_clk4_multiply_by = 1,
-            p_clk4_phase_shift = "2000",
-            p_compensate_clock = "CLK1",
-            p_inclk0_input_frequency = 4000,
-            p_intended_device_family = "Cyclone IV E",
-            p_lpm_hint = "CBX_MODULE_PREFIX=mf_usb3_pll",
-            p_lpm_type = "altpll",
-            p_operation_mode = "NORMAL",
-            p_pll_type = "AUTO",
-            p_port_activeclock = "PORT_UNUSED",
-            p_port_areset = "PORT_UNUSED",
-            p_port_clkbad0 = "PORT_USED",
-            p_port_clkbad1 = "PORT_UNUSED",
-            p_port_clkloss = "PORT_UNUSED",
-            p_port_clkswitch = "PORT_UNUSED",
-            p_port_configupdate = "PORT_UNUSED",
-            p_port_fbin = "PORT_UNUSED",
-            p_port_inclk0 = "PORT_USED",
-            p_port_inclk1 = "PORT_UNUSED",
-            p_port_locked = "PORT_USED",
-            p_port_pfdena = "PORT_UNUSED",
-            p_port_phasecounterselect = "PORT_UNUSED",
-            p_port_phasedone = "PORT_UNUSED",
-            p_port_phasestep = "PORT_UNUSED",
-            p_port_phaseupdown = "PORT_UNUSED",
-            p_port_pllena = "PORT_UNUSED",
-            p_port_scanaclr = "PORT_UNUSED",
-            p_port_scanclk = "PORT_UNUSED",
-            p_port_scanclkena = "PORT_UNUSED",
-            p_port_scandata = "PORT_UNUSED",
-            p_port_scandataout = "PORT_UNUSED",
-            p_port_scandone = "PORT_UNUSED",
-            p_port_scanread = "PORT_UNUSED",
-            p_port_scanwrite = "PORT_UNUSED",
-            p_port_clk0 = "PORT_USED",
-            p_port_clk1 = "PORT_USED",
-            p_port_clk2 = "PORT_USED",
-            p_port_clk3 = "PORT_USED",
-            p_port_clk4 = "PORT_USED",
-            p_port_clk5 = "PORT_UNUSED",
-            p_port_clkena0 = "PORT_UNUSED",
-            p_port_clkena1 = "PORT_UNUSED",
-            p_port_clkena2 = "PORT_UNUSED",
-            p_port_clkena3 = "PORT_UNUSED",
-            p_port_clkena4 = "PORT_UNUSED",
-            p_port_clkena5 = "PORT_UNUSED",
-            p_port_extclk0 = "PORT_UNUSED",
-            p_port_extclk1 = "PORT_UNUSED",
-            p_port_extclk2 = "PORT_UNUSED",
-            p_port_extclk3 = "PORT_UNUSED",
-            p_self_reset_on_loss_lock = "ON",
-            p_width_clock = 5,
-
-            # Drive our clock from the I/O domain, which is typically set from the PHY's PCLK.
-            i_inclk = ClockSignal("pipe_io_rx"),
-
-            # Grab all of our output clocks in one go.
-            o_clk    = composite_clock,
-            o_locked = locked,
+            **altpll_parameters(pll_config,
+                inclk                   = ClockSignal("pipe_io_rx"),
+                clk                     = composite_clock,
+                locked                  = locked,
+                compensate_clock        = "pipe_rx",
+                self_reset_on_loss_lock = True,
+            ),
+
+            # Additional settings; copied from the Daisho USB3 Core.
+            p_gate_lock_signal = "YES",
+            p_lpm_hint         = "CBX_MODULE_PREFIX=mf_usb3_pll",
         )
 
 
@@ -166,7 +128,7 @@ class DaishoClockAndResetController(Elaboratable):
 
 
 
-class DaishoPlatform(IntelPlatform, LUNAPlatform):
+class DaishoPlatform(BuildStatsMixin, QuartusProfileMixin, ApolloSessionMixin, IntelPlatform, LUNAPlatform):
     """ Board description for Daisho boards."""
 
     name        = "Daisho"
@@ -180,6 +142,12 @@ class DaishoPlatform(IntelPlatform, LUNAPlatform):
     clock_domain_generator = DaishoClockAndResetController
     default_usb_connection = "ulpi"
 
+    # Find our boards by their Apollo debuggers, when programming many at once.
+    fleet_usb_ids          = ((0x1d50, 0x615c),)
+
+    # When compiling incrementally, keep our ULPI and PIPE interface logic in its own partition.
+    quartus_partitions = {"usb_io": ("*ulpi*", "*pipe*")}
+
     # The TI1310A requires strap values to be present on ULPI DATA{4, 5, 6, 7}
     # during PHY startup. We'll provide these strap values here.
     # Their meaning:
@@ -350,9 +318,6 @@ class DaishoPlatform(IntelPlatform, LUNAPlatform):
         # Set our Cyclone-III configuration scheme to avoid an I/IO bank conflict.
         templates = super().file_templates
         templates["{{name}}.qsf"] += r"""
-            set_global_assignment -name OPTIMIZATION_MODE "Aggressive Performance"
-            set_global_assignment -name FITTER_EFFORT "Standard Fit"
-            set_global_assignment -name PHYSICAL_SYNTHESIS_EFFORT "Extra"
             set_global_assignment -name CYCLONEIII_CONFIGURATION_SCHEME "PASSIVE SERIAL"
             set_global_assignment -name ON_CHIP_BITSTREAM_DECOMPRESSION OFF
             set_instance_assignment -name DECREASE_INPUT_DELAY_TO_INPUT_REGISTER OFF -to *ulpi*
@@ -373,22 +338,22 @@ class DaishoPlatform(IntelPlatform, LUNAPlatform):
                                    "--operation", "P;" + bitstream_filename])
 
 
-    def toolchain_program(self, products, name):
-        """ Programs the relevant Daisho board via its sideband connection. """
+    def toolchain_program(self, products, name, serial=None):
+        """ Programs the relevant Daisho board via its sideband connection.
+
+        If ``serial`` is given, the board whose debugger has that USB serial number is programmed.
+        """
 
-        from apollo_fpga import ApolloDebugger
         from apollo_fpga.intel import IntelJTAGProgrammer
 
         # If the user has opted to use their own programming cable, use it instead.
         if os.environ.get("PROGRAM_WITH_QUARTUS", False):
+            if serial is not None:
+                raise ValueError("boards can't be selected by serial number when programming with Quartus")
             self._toolchain_program_quartus(products, name)
             return
 
-        # Create our connection to the debug module.
-        debugger = ApolloDebugger()
-
-        # Grab our generated bitstream, and upload it to the FPGA.
+        # Grab our generated bitstream, and upload it to the FPGA; over any open debugger session.
         bitstream =  products.get("{}.rbf".format(name))
-        with debugger.jtag as jtag:
-            programmer = IntelJTAGProgrammer(jtag)
-            programmer.configure(bitstream)
+        with self.apollo_session(serial=serial) as session:
+            session.configure(bitstream, programmer=IntelJTAGProgrammer)
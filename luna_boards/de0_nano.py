@@ -26,46 +26,55 @@ from amaranth_boards.resources import *
 from luna.gateware.platform.core import LUNAPlatform
 from luna.gateware.architecture.car import PHYResetController
 
+from .pll import domain_frequencies, shared_clocks, solve_altpll, altpll_parameters
+from .buildstats import BuildStatsMixin
+from .quartus    import QuartusProfileMixin
+
 
 __all__ = ["DE0NanoPlatform"]
 
 
 class DE0NanoClockAndResetController(Elaboratable):
     """ Controller for de0_nano's clocking and global resets. """
+
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our usb domain is clocked by the USB3300; everything else is generated from it.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast": 60,
+        "sync": 60,
+        "usb":  60,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("usb",))
 
         # Create our domains; but don't do anything else for them, for now.
         m.domains.sync = ClockDomain()
         m.domains.usb  = ClockDomain()
         m.domains.fast = ClockDomain()
 
-        main_clock = Signal()
+        requests, aliases = shared_clocks(frequencies, ("sync", "fast"))
+        clocks = {domain: Signal(name=f"clk_{domain}") for domain, _ in requests}
         locked = Signal()
 
-        m.submodules.pll = Instance("ALTPLL",
-            p_BANDWIDTH_TYPE         = "AUTO",
-            p_CLK0_DIVIDE_BY         = 1,
-            p_CLK0_DUTY_CYCLE        = 50,
-            p_CLK0_MULTIPLY_BY       = 1,
-            p_CLK0_PHASE_SHIFT       = 0,
-            p_INCLK0_INPUT_FREQUENCY = 16666,
-            p_OPERATION_MODE         = "NORMAL",
-
-            # Drive our clock from the USB clock
-            # coming from the USB clock pin of the USB3300
-            i_inclk  = ClockSignal("usb"),
-            o_clk    = main_clock,
-            o_locked = locked,
-        )
-
-        m.d.comb += [
-            ClockSignal("sync").eq(main_clock),
-            ClockSignal("fast").eq(main_clock)
-        ]
+        # Drive our clock from the USB clock
+        # coming from the USB clock pin of the USB3300
+        pll_config = solve_altpll(frequencies["usb"], requests, speed_grade=platform.speed)
+        m.submodules.pll = Instance("ALTPLL", **altpll_parameters(pll_config,
+            inclk  = ClockSignal("usb"),
+            clk    = Cat(*clocks.values()),
+            locked = locked,
+        ))
+
+        m.d.comb += [ClockSignal(domain).eq(clock) for domain, clock in clocks.items()]
+        m.d.comb += [ClockSignal(domain).eq(clocks[source]) for domain, source in aliases.items()]
 
         # Use a blinky to see if the clock signal works
         # from amaranth_boards.test.blinky import Blinky
@@ -73,7 +82,7 @@ class DE0NanoClockAndResetController(Elaboratable):
 
         return m
 
-class DE0NanoPlatform(IntelPlatform, LUNAPlatform):
+class DE0NanoPlatform(BuildStatsMixin, QuartusProfileMixin, IntelPlatform, LUNAPlatform):
     """ This is a de0_nano board with an USB3300 PHY attached to JP_2 """
 
     name        = "de0_nano"
@@ -86,6 +95,9 @@ class DE0NanoPlatform(IntelPlatform, LUNAPlatform):
     default_usb_connection = "ulpi"
     ignore_phy_vbus = True
 
+    # When compiling incrementally, keep our ULPI interface logic in its own partition.
+    quartus_partitions = {"usb_io": ("*ulpi*",)}
+
     def __init__(self, *args, **kwargs):
         logging.warning("This platform is not officially supported, and thus not tested. Your results may vary.")
         logging.warning("Note also that this platform does not use the DE0 nano's main USB port!")
@@ -169,12 +181,8 @@ class DE0NanoPlatform(IntelPlatform, LUNAPlatform):
     def file_templates(self):
         templates = super().file_templates
         templates["{{name}}.qsf"] += r"""
-            set_global_assignment -name OPTIMIZATION_MODE "Aggressive Performance"
-            set_global_assignment -name FITTER_EFFORT "Standard Fit"
-            set_global_assignment -name PHYSICAL_SYNTHESIS_EFFORT "Extra"
             set_instance_assignment -name DECREASE_INPUT_DELAY_TO_INPUT_REGISTER OFF -to *ulpi*
             set_instance_assignment -name INCREASE_DELAY_TO_OUTPUT_PIN OFF -to *ulpi*
-            set_global_assignment -name NUM_PARALLEL_PROCESSORS ALL
         """
         templates["{{name}}.sdc"] += r"""
             create_clock -name "clk_60MHz" -period 16.667 [get_ports "ulpi_0__clk__io"]
@@ -21,11 +21,14 @@ from amaranth_boards.resources import *
 from amaranth_boards.ecpix5 import ECPIX545Platform as _ECPIX545Platform
 from amaranth_boards.ecpix5 import ECPIX585Platform as _ECPIX585Platform
 
-from luna.gateware.interface.pipe       import AsyncPIPEInterface
-from luna.gateware.interface.serdes_phy import ECP5SerDesPIPE
-
 from luna.gateware.platform.core import LUNAPlatform
 
+from ._lazy import LazySuperSpeedPHY, lazy_module_attributes
+from .pll  import domain_frequencies, shared_clocks, solve_ehxplll, ehxplll_parameters
+from .buildstats import BuildStatsMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+from .ecppack    import ECP5BitstreamMixin, ECP5BitstreamProfile
+
 
 __all__ = ["ECPIX5_45F_Platform", "ECPIX5_85F_Platform"]
 
@@ -33,11 +36,27 @@ __all__ = ["ECPIX5_45F_Platform", "ECPIX5_85F_Platform"]
 class ECPIX5DomainGenerator(Elaboratable):
     """ Clock generator for ECPIX5 boards. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our SuperSpeed PHY expects a 125 MHz ss domain and a 250 MHz fast (SerDes reference) domain;
+    # by default, our sync domain shares the ss clock. Our full-speed USB domains are generated by a
+    # separate PLL.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   250,
+        "sync":   125,
+        "ss":     125,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("fast", "ss", "usb_io", "usb"))
 
         # Create our domains.
         m.domains.ss     = ClockDomain()
@@ -51,162 +70,42 @@ class ECPIX5DomainGenerator(Elaboratable):
         clk100 = platform.request(platform.default_clk)
         reset  = platform.request(platform.default_rst)
 
-        # Generate the clocks we need for running our SerDes.
+        # Generate the clocks we need for running our SerDes; our sync domain only gets its own output
+        # if it doesn't share the ss frequency.
+        requests, aliases = shared_clocks(frequencies, ("fast", "ss", "sync"))
+
         feedback = Signal()
         locked   = Signal()
-        m.submodules.pll = Instance("EHXPLLL",
-
-                # Clock in.
-                i_CLKI=clk100,
-
-                # Generated clock outputs.
-                o_CLKOP=feedback,
-                o_CLKOS= ClockSignal("sync"),
-                o_CLKOS2=ClockSignal("fast"),
-
-                # Status.
-                o_LOCK=locked,
-
-                # PLL parameters...
-                p_CLKI_DIV=1,
-                p_PLLRST_ENA="ENABLED",
-                p_INTFB_WAKE="DISABLED",
-                p_STDBY_ENABLE="DISABLED",
-                p_DPHASE_SOURCE="DISABLED",
-                p_CLKOS3_FPHASE=0,
-                p_CLKOS3_CPHASE=0,
-                p_CLKOS2_FPHASE=0,
-                p_CLKOS2_CPHASE=5,
-                p_CLKOS_FPHASE=0,
-                p_CLKOS_CPHASE=5,
-                p_CLKOP_FPHASE=0,
-                p_CLKOP_CPHASE=4,
-                p_PLL_LOCK_MODE=0,
-                p_CLKOS_TRIM_DELAY="0",
-                p_CLKOS_TRIM_POL="FALLING",
-                p_CLKOP_TRIM_DELAY="0",
-                p_CLKOP_TRIM_POL="FALLING",
-                p_OUTDIVIDER_MUXD="DIVD",
-                p_CLKOS3_ENABLE="DISABLED",
-                p_OUTDIVIDER_MUXC="DIVC",
-                p_CLKOS2_ENABLE="ENABLED",
-                p_OUTDIVIDER_MUXB="DIVB",
-                p_CLKOS_ENABLE="ENABLED",
-                p_OUTDIVIDER_MUXA="DIVA",
-                p_CLKOP_ENABLE="ENABLED",
-                p_CLKOS3_DIV=1,
-                p_CLKOS2_DIV=2,
-                p_CLKOS_DIV=4,
-                p_CLKOP_DIV=5,
-                p_CLKFB_DIV=1,
-                p_FEEDBK_PATH="CLKOP",
-
-                # Internal feedback.
-                i_CLKFB=feedback,
-
-                # Control signals.
-                i_RST=reset,
-                i_PHASESEL0=0,
-                i_PHASESEL1=0,
-                i_PHASEDIR=1,
-                i_PHASESTEP=1,
-                i_PHASELOADREG=1,
-                i_STDBY=0,
-                i_PLLWAKESYNC=0,
-
-                # Output Enables.
-                i_ENCLKOP=0,
-                i_ENCLKOS=0,
-                i_ENCLKOS2=0,
-                i_ENCLKOS3=0,
-
-                # Synthesis attributes.
-                a_ICP_CURRENT="12",
-                a_LPF_RESISTOR="8"
-        )
+        pll_config = solve_ehxplll(platform.default_clk_frequency, requests)
+        m.submodules.pll = Instance("EHXPLLL", **ehxplll_parameters(pll_config,
+            clki=clk100,
+            clocks={domain: ClockSignal(domain) for domain, _ in requests},
+            feedback=feedback,
+            locked=locked,
+            reset=reset,
+        ))
+        m.d.comb += [ClockSignal(domain).eq(ClockSignal(source)) for domain, source in aliases.items()]
 
         # Temporary: USB FS PLL
         feedback    = Signal()
         usb2_locked = Signal()
-        m.submodules.fs_pll = Instance("EHXPLLL",
-
-                # Status.
-                o_LOCK=usb2_locked,
-
-                # PLL parameters...
-                p_PLLRST_ENA="ENABLED",
-                p_INTFB_WAKE="DISABLED",
-                p_STDBY_ENABLE="DISABLED",
-                p_DPHASE_SOURCE="DISABLED",
-                p_OUTDIVIDER_MUXA="DIVA",
-                p_OUTDIVIDER_MUXB="DIVB",
-                p_OUTDIVIDER_MUXC="DIVC",
-                p_OUTDIVIDER_MUXD="DIVD",
-
-                p_CLKI_DIV = 20,
-                p_CLKOP_ENABLE = "ENABLED",
-                p_CLKOP_DIV = 16,
-                p_CLKOP_CPHASE = 15,
-                p_CLKOP_FPHASE = 0,
-
-                p_CLKOS_DIV = 12,
-                p_CLKOS_CPHASE = 0,
-                p_CLKOS_FPHASE = 0,
-
-
-                p_CLKOS2_ENABLE = "ENABLED",
-                p_CLKOS2_DIV = 10,
-                p_CLKOS2_CPHASE = 0,
-                p_CLKOS2_FPHASE = 0,
-
-                p_CLKOS3_ENABLE = "ENABLED",
-                p_CLKOS3_DIV = 40,
-                p_CLKOS3_CPHASE = 5,
-                p_CLKOS3_FPHASE = 0,
-
-                p_FEEDBK_PATH = "CLKOP",
-                p_CLKFB_DIV = 6,
-
-                # Clock in.
-                i_CLKI=clk100,
-
-                # Internal feedback.
-                i_CLKFB=feedback,
-
-                # Control signals.
-                i_RST=reset,
-                i_PHASESEL0=0,
-                i_PHASESEL1=0,
-                i_PHASEDIR=1,
-                i_PHASESTEP=1,
-                i_PHASELOADREG=1,
-                i_STDBY=0,
-                i_PLLWAKESYNC=0,
-
-                # Output Enables.
-                i_ENCLKOP=0,
-                i_ENCLKOS2=0,
-
-                # Generated clock outputs.
-                o_CLKOP=feedback,
-                o_CLKOS2=ClockSignal("usb_io"),
-                o_CLKOS3=ClockSignal("usb"),
-
-                # Synthesis attributes.
-                a_FREQUENCY_PIN_CLKI="25",
-                a_FREQUENCY_PIN_CLKOP="48",
-                a_FREQUENCY_PIN_CLKOS="48",
-                a_FREQUENCY_PIN_CLKOS2="12",
-                a_ICP_CURRENT="12",
-                a_LPF_RESISTOR="8",
-                a_MFG_ENABLE_FILTEROPAMP="1",
-                a_MFG_GMCREF_SEL="2"
-        )
+        fs_pll_config = solve_ehxplll(platform.default_clk_frequency, (
+            ("usb_io", frequencies["usb_io"]),
+            ("usb",    frequencies["usb"]),
+        ))
+        m.submodules.fs_pll = Instance("EHXPLLL", **ehxplll_parameters(fs_pll_config,
+            clki=clk100,
+            clocks={
+                "usb_io": ClockSignal("usb_io"),
+                "usb":    ClockSignal("usb"),
+            },
+            feedback=feedback,
+            locked=usb2_locked,
+            reset=reset,
+        ))
 
         # Control our resets.
         m.d.comb += [
-            ClockSignal("ss")      .eq(ClockSignal("sync")),
-
             ResetSignal("ss")      .eq(~locked),
             ResetSignal("sync")    .eq(~locked),
             ResetSignal("fast")    .eq(~locked),
@@ -218,54 +117,8 @@ class ECPIX5DomainGenerator(Elaboratable):
         return m
 
 
-class ECPIX5SuperSpeedPHY(AsyncPIPEInterface):
-    """ Superspeed PHY configuration for the ECPIX5. """
-
-    REFCLK_FREQUENCY = 100e6
-    SS_FREQUENCY     = 125e6
-    FAST_FREQUENCY   = 250e6
-
-    SERDES_DUAL    = 0
-    SERDES_CHANNEL = 1
-
-
-    def __init__(self, platform):
-
-        # Grab the I/O that implements our SerDes interface...
-        serdes_io_directions = {
-            'ch0':    {'tx':"-", 'rx':"-"},
-            'ch1':    {'tx':"-", 'rx':"-"},
-            'refclk': '-',
-        }
-        serdes_io      = platform.request("serdes", self.SERDES_DUAL, dir=serdes_io_directions)
-        serdes_channel = getattr(serdes_io, f"ch{self.SERDES_CHANNEL}")
-
-        # Use it to create our soft PHY...
-        serdes_phy = ECP5SerDesPIPE(
-            tx_pads             = serdes_channel.tx,
-            rx_pads             = serdes_channel.rx,
-            dual                = self.SERDES_DUAL,
-            channel             = self.SERDES_CHANNEL,
-            refclk_frequency    = self.FAST_FREQUENCY,
-        )
-
-        # ... and bring the PHY interface signals to the MAC domain.
-        super().__init__(serdes_phy, width=4, domain="ss")
-
-
-    def elaborate(self, platform):
-        m = super().elaborate(platform)
-
-        # Patch in our soft PHY as a submodule.
-        m.submodules.phy = self.phy
-
-        # Drive the PHY reference clock with our fast generated clock.
-        m.d.comb += self.clk.eq(ClockSignal("fast"))
-
-        # This board does not have a way to detect Vbus, so assume it's always present.
-        m.d.comb += self.phy.power_present.eq(1)
-
-        return m
+# Build our PHY class only once something asks for it (PEP 562).
+__getattr__ = lazy_module_attributes(globals(), {"ECPIX5SuperSpeedPHY": ".phy.ecpix5"})
 
 
 
@@ -320,11 +173,12 @@ class _ECPIXExtensions:
 
 
 
-class ECPIX5_45F_Platform(_ECPIX545Platform, _ECPIXExtensions, LUNAPlatform):
+class ECPIX5_45F_Platform(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _ECPIX545Platform, _ECPIXExtensions, LUNAPlatform):
     name                   = "ECPIX-5 (45F)"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi"))
 
     clock_domain_generator = ECPIX5DomainGenerator
-    default_usb3_phy       = ECPIX5SuperSpeedPHY
+    default_usb3_phy       = LazySuperSpeedPHY(__name__, "ECPIX5SuperSpeedPHY")
     default_usb_connection = "ulpi"
 
     # Create our semantic aliases.
@@ -334,11 +188,12 @@ class ECPIX5_45F_Platform(_ECPIX545Platform, _ECPIXExtensions, LUNAPlatform):
 
 
 
-class ECPIX5_85F_Platform(_ECPIX585Platform, _ECPIXExtensions, LUNAPlatform):
+class ECPIX5_85F_Platform(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _ECPIX585Platform, _ECPIXExtensions, LUNAPlatform):
     name                   = "ECPIX-5 (85F)"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi"))
 
     clock_domain_generator = ECPIX5DomainGenerator
-    default_usb3_phy       = ECPIX5SuperSpeedPHY
+    default_usb3_phy       = LazySuperSpeedPHY(__name__, "ECPIX5SuperSpeedPHY")
     default_usb_connection = "ulpi"
 
     # Create our semantic aliases.
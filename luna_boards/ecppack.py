@@ -0,0 +1,113 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Bitstream profiles for the luna_boards ECP5 platforms.
+
+Each ECP5 platform describes how its bitstreams should be packed: whether they're compressed, the
+master SPI clock the FPGA uses to load them from flash, and the SPI read mode the board's flash
+supports. These become the ``ecppack`` options for every build; smaller bitstreams load faster over
+JTAG, and faster configuration clocks and wider read modes cut boot time from flash.
+
+The profile can be adjusted at build time with ``LUNA_ECP5_BITSTREAM``; either to ``safe``, which
+produces uncompressed bitstreams loaded with ecppack's defaults, or to a comma-separated list of
+changes to the board's profile:
+
+    > LUNA_ECP5_BITSTREAM=safe python my_design.py
+    > LUNA_ECP5_BITSTREAM="freq=62.0,spimode=qspi" python my_design.py
+
+Quad-SPI modes also require the flash's quad-enable bit to be set; and so aren't used by default.
+Builds given an explicit ``ecppack_opts`` override use those options unchanged.
+"""
+
+import os
+
+from collections import namedtuple
+
+
+__all__ = ["ECP5BitstreamProfile", "ECP5BitstreamMixin", "ecppack_options"]
+
+
+# The master SPI clock frequencies (in MHz) that ecppack can configure.
+ECPPACK_FREQUENCIES = ("2.4", "4.8", "9.7", "19.4", "38.8", "62.0")
+
+# The SPI read modes ecppack can configure; from narrowest to widest.
+ECPPACK_SPI_MODES   = ("fast-read", "dual-spi", "qspi")
+
+
+class ECP5BitstreamProfile(namedtuple("ECP5BitstreamProfile", ["compress", "frequency", "spi_mode", "spi_modes"])):
+    """ Describes how a board's ECP5 bitstreams should be packed.
+
+    Parameters
+    ----------
+    compress: bool
+        True iff bitstreams should be compressed.
+    frequency: str
+        The master SPI clock frequency, in MHz, as understood by ``ecppack --freq``; or None for the default.
+    spi_mode: str
+        The SPI read mode used by default, as understood by ``ecppack --spimode``; or None for the default.
+    spi_modes: tuple of str
+        Every SPI read mode the board's flash, and its wiring, supports.
+    """
+
+    def __new__(cls, compress=True, frequency="38.8", spi_mode=None, spi_modes=("fast-read",)):
+        return super().__new__(cls, compress, frequency, spi_mode, spi_modes)
+
+
+    def adjusted(self, changes):
+        """ Returns a copy of this profile, with changes given as a ``LUNA_ECP5_BITSTREAM`` string applied. """
+
+        if changes.strip() == "safe":
+            return self._replace(compress=False, frequency=None, spi_mode=None)
+
+        profile = self
+        for change in filter(None, (change.strip() for change in changes.split(","))):
+            key, _, value = change.partition("=")
+            key, value    = key.strip(), value.strip()
+
+            if key == "compress" and value in ("yes", "on", "1", "no", "off", "0"):
+                profile = profile._replace(compress=value in ("yes", "on", "1"))
+            elif key == "freq" and value in ECPPACK_FREQUENCIES:
+                profile = profile._replace(frequency=value)
+            elif key == "spimode" and value in ECPPACK_SPI_MODES:
+                if value not in self.spi_modes:
+                    raise ValueError(f"this board's flash doesn't support the '{value}' SPI mode; "
+                        f"it supports: {', '.join(self.spi_modes)}")
+                profile = profile._replace(spi_mode=value)
+            else:
+                raise ValueError(f"invalid ECP5 bitstream setting '{change}'; expected 'safe', or a list of "
+                    f"compress=yes|no, freq={'|'.join(ECPPACK_FREQUENCIES)}, or spimode={'|'.join(ECPPACK_SPI_MODES)}")
+
+        return profile
+
+
+    def options(self):
+        """ Returns the ``ecppack`` options that implement this profile. """
+
+        options = []
+        if self.compress:
+            options.append("--compress")
+        if self.frequency is not None:
+            options.append(f"--freq {self.frequency}")
+        if self.spi_mode is not None:
+            options.append(f"--spimode {self.spi_mode}")
+        return " ".join(options)
+
+
+def ecppack_options(platform):
+    """ Returns the ``ecppack`` options for a platform's bitstreams, adjusted by ``LUNA_ECP5_BITSTREAM``. """
+    profile = getattr(platform, "ecp5_bitstream", ECP5BitstreamProfile())
+    return profile.adjusted(os.environ.get("LUNA_ECP5_BITSTREAM", "")).options()
+
+
+class ECP5BitstreamMixin:
+    """ Platform mixin that packs bitstreams according to the platform's ``ecp5_bitstream`` profile. """
+
+    ecp5_bitstream = ECP5BitstreamProfile()
+
+    def toolchain_prepare(self, fragment, name, **kwargs):
+        if "ecppack_opts" not in kwargs and not os.environ.get("AMARANTH_ecppack_opts"):
+            kwargs = {**kwargs, "ecppack_opts": ecppack_options(self)}
+        return super().toolchain_prepare(fragment, name, **kwargs)
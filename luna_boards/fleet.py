@@ -0,0 +1,184 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Programs a fleet of identical luna_boards boards at once.
+
+Finds every attached board of a platform by USB serial number, and programs an already-built design
+onto all of them concurrently; one worker thread per board. Each board's outcome and programming
+time are reported as it finishes:
+
+    > python -m luna_boards.fleet AmaltheaPlatformRev0D1 build/
+    > python -m luna_boards.fleet NeTV2Platform build/ --serial FT4Z1A2B --serial FT4Z1A2C --json fleet.json
+
+Platforms support fleet programming by listing the USB vendor/product IDs of their programming
+interface in ``fleet_usb_ids``, and by accepting a ``serial`` argument to ``toolchain_program`` that
+selects the board to program. Programming interfaces built on common USB bridges (such as FTDI
+chips) can match unrelated devices; use ``--serial`` to pick the boards to program.
+"""
+
+import sys
+import json
+import time
+import argparse
+import traceback
+
+from collections        import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .registry import get_platform
+
+
+__all__ = ["FleetResult", "enumerate_boards", "program_fleet"]
+
+
+class FleetResult(namedtuple("FleetResult", ["serial", "success", "duration", "error"])):
+    """ The outcome of programming a single board of a fleet.
+
+    Attributes
+    ----------
+    serial: str
+        The USB serial number of the board.
+    success: bool
+        True iff the board was programmed successfully.
+    duration: float
+        How long programming took, in seconds.
+    error: str
+        A description of what went wrong; or None if programming succeeded.
+    """
+
+
+def enumerate_boards(platform):
+    """ Returns the USB serial numbers of every attached board of the given platform.
+
+    Parameters
+    ----------
+    platform: type
+        The platform class to look for; which must provide ``fleet_usb_ids``.
+    """
+
+    usb_ids = getattr(platform, "fleet_usb_ids", None)
+    if not usb_ids:
+        raise ValueError(f"{platform.__name__} doesn't support fleet programming")
+
+    try:
+        import usb.core
+    except ImportError:
+        raise ImportError("pyusb is required to find boards for fleet programming") from None
+
+    serials = []
+    for vendor_id, product_id in usb_ids:
+        for device in usb.core.find(find_all=True, idVendor=vendor_id, idProduct=product_id):
+            try:
+                serial = device.serial_number
+            except (ValueError, usb.core.USBError):
+                # We couldn't read the serial number; e.g. because we lack permission to open the device.
+                continue
+            if serial and serial not in serials:
+                serials.append(serial)
+
+    return serials
+
+
+def _print_progress(result):
+    if result.success:
+        print(f"{result.serial}: programmed in {result.duration:.1f}s", file=sys.stderr)
+    else:
+        print(f"{result.serial}: FAILED after {result.duration:.1f}s ({result.error})", file=sys.stderr)
+
+
+def _program(platform, products, name, serial):
+    """ Programs a single board of a fleet; run in a worker thread. """
+
+    start = time.monotonic()
+    try:
+        platform().toolchain_program(products, name, serial=serial)
+        error = None
+    except Exception as e:
+        traceback.print_exc()
+        error = f"{type(e).__name__}: {e}"
+
+    return FleetResult(serial, error is None, time.monotonic() - start, error)
+
+
+def program_fleet(platform, products, name="top", serials=None, *, jobs=None, progress=_print_progress):
+    """ Programs a built design onto many boards of the same platform concurrently.
+
+    Parameters
+    ----------
+    platform: type
+        The platform class to program; a new instance is created for each board.
+    products: BuildProducts
+        The products of building the design for this platform.
+    name: str
+        The name of the design that was built.
+    serials: list of str
+        The USB serial numbers of the boards to program; or None to program every attached board.
+    jobs: int
+        The number of boards to program at once; by default, all of them.
+    progress: callable
+        Called with each FleetResult as its board finishes.
+
+    Returns a list of FleetResult, in the order the boards were given (or found).
+    """
+
+    serials = list(serials) if serials is not None else enumerate_boards(platform)
+    if not serials:
+        return []
+
+    results = {}
+    with ThreadPoolExecutor(jobs or len(serials)) as executor:
+        futures = [executor.submit(_program, platform, products, name, serial) for serial in serials]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.serial] = result
+            progress(result)
+
+    return [results[serial] for serial in serials]
+
+
+def main():
+    from amaranth.build.run import LocalBuildProducts
+
+    parser = argparse.ArgumentParser(description="Program a built design onto many identical boards at once.")
+    parser.add_argument("platform", help="the platform to program; as a class name or module:Class path")
+    parser.add_argument("build_dir", help="the directory the design was built in")
+    parser.add_argument("--name", default="top", help="the name of the design that was built")
+    parser.add_argument("--serial", action="append", dest="serials",
+        help="the USB serial number of a board to program; can be given more than once (default: all boards)")
+    parser.add_argument("--list", action="store_true", help="only list the attached boards")
+    parser.add_argument("--jobs", "-j", type=int, help="the number of boards to program at once")
+    parser.add_argument("--json", help="also write the per-board results to this file")
+    args = parser.parse_args()
+
+    try:
+        platform = get_platform(args.platform)
+        serials  = args.serials or enumerate_boards(platform)
+    except (KeyError, ValueError) as e:
+        parser.error(e.args[0])
+
+    if args.list or not serials:
+        print("\n".join(serials) if serials else f"No {platform.__name__} boards found.")
+        return
+
+    start   = time.monotonic()
+    results = program_fleet(platform, LocalBuildProducts(args.build_dir), args.name, serials, jobs=args.jobs)
+    elapsed = time.monotonic() - start
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([result._asdict() for result in results], f, indent=2)
+
+    failures = [result for result in results if not result.success]
+    print(f"{len(results) - len(failures)} of {len(results)} boards programmed in {elapsed:.1f}s.", file=sys.stderr)
+    for result in failures:
+        print(f"  {result.serial}: {result.error}", file=sys.stderr)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
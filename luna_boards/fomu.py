@@ -24,71 +24,90 @@ from amaranth_boards.resources import *
 
 from luna.gateware.platform.core import LUNAPlatform
 
+from .pll import domain_frequencies, shared_clocks, solve_sb_pll40, sb_pll40_parameters
+from .buildstats import BuildStatsMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+from .warmboot   import ICE40MultibootMixin
+
 
 class FomuDomainGenerator(Elaboratable):
-    """ Stub clock domain generator; stands in for the typical LUNA one.
+    """ Clock domain generator for the Fomu.
 
-    This generator creates domains; but currently does not configure them.
+    Our sync domain runs from the 48 MHz oscillator; which also feeds an SB_PLL40 that generates
+    any other domain clocks at their requested frequencies.
     """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our sync domain runs directly from the 48 MHz oscillator, which also serves as our PLL's reference;
+    # so only the fast domain can be moved.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   48,
+        "sync":   48,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("sync", "usb_io", "usb"))
 
         # Create our domains...
         m.domains.usb    = ClockDomain()
         m.domains.usb_io = ClockDomain()
         m.domains.fast   = ClockDomain()
 
-        # ... and create our 12 MHz USB clock.
-        clk12 = Signal()
-
-        m.submodules.pll = Instance("SB_PLL40_CORE",
-            i_REFERENCECLK  = ClockSignal("sync"),
-            i_RESETB        = Const(1),
-            i_BYPASS        = Const(0),
-
-            o_PLLOUTCORE    = clk12,
+        # ... and figure out which clocks our PLL needs to create. Our sync clock is our reference,
+        # so it's never generated.
+        requests, aliases = shared_clocks(frequencies, ("sync", "usb", "usb_io", "fast"))
+        requests = tuple(request for request in requests if request[0] != "sync")
+        clocks   = {domain: Signal(name=f"clk_{domain}") for domain, _ in requests}
 
-            # Create a 24 MHz PLL clock...
-            p_FEEDBACK_PATH = "SIMPLE",
-            p_DIVR          = 0,
-            p_DIVF          = 15,
-            p_DIVQ          = 5,
-            p_FILTER_RANGE  = 4,
+        # The PLL can't generate 12 MHz directly; so this will divide down a faster PLL clock
+        # (e.g. using GENCLK_HALF).
+        pll_config = solve_sb_pll40(platform.default_clk_frequency, requests)
+        m.submodules.pll = Instance(pll_config.primitive, **sb_pll40_parameters(pll_config,
+            reference = ClockSignal("sync"),
+            clocks    = clocks,
+        ))
 
-            # ... and divide it by half to get 12 MHz.
-            p_PLLOUT_SELECT ="GENCLK_HALF"
-        )
-
-        # Relax the 12MHz clock down to 12MHz.
-        platform.add_clock_constraint(clk12, 12e6)
+        # Relax each generated clock down to its real frequency.
+        for domain, clock in clocks.items():
+            platform.add_clock_constraint(clock, pll_config.output(domain).frequency)
 
         # We'll use our 48MHz clock for everything _except_ the usb domain...
-        m.d.comb += [
-            ClockSignal("usb")     .eq(clk12),
-            ClockSignal("usb_io")  .eq(ClockSignal("sync")),
-            ClockSignal("fast")    .eq(ClockSignal("sync"))
-        ]
+        m.d.comb += [ClockSignal(domain).eq(clock) for domain, clock in clocks.items()]
+        m.d.comb += [ClockSignal(domain).eq(ClockSignal(source)) for domain, source in aliases.items()]
 
         return m
 
 
-class FomuHackerPlatform(_FomuHackerPlatform, LUNAPlatform):
+class FomuHackerPlatform(BuildStatsMixin, NextpnrSeedSweepMixin, ICE40MultibootMixin, _FomuHackerPlatform, LUNAPlatform):
     name                   = "Fomu Hacker"
     clock_domain_generator = FomuDomainGenerator
     default_usb_connection = "usb"
 
+    # Warmboot bundles replace foboot; and are written with fomu-flash, from a Raspberry Pi.
+    multiboot_flash_command       = ("fomu-flash", "-w")
+    multiboot_replaces_bootloader = True
+
 
-class FomuPVT(_FomuPVTPlatform, LUNAPlatform):
+class FomuPVT(BuildStatsMixin, NextpnrSeedSweepMixin, ICE40MultibootMixin, _FomuPVTPlatform, LUNAPlatform):
     name                   = "Fomu PVT/Production"
     clock_domain_generator = FomuDomainGenerator
     default_usb_connection = "usb"
 
+    # Warmboot bundles replace foboot; and are written with fomu-flash, from a Raspberry Pi.
+    multiboot_flash_command       = ("fomu-flash", "-w")
+    multiboot_replaces_bootloader = True
 
-class FomuEVTPlatform(LatticeICE40Platform, LUNAPlatform):
+
+class FomuEVTPlatform(BuildStatsMixin, NextpnrSeedSweepMixin, ICE40MultibootMixin, LatticeICE40Platform, LUNAPlatform):
     """ Platform for the Fomu EVT platforms. """
 
     default_clk = "clk48"
@@ -100,6 +119,9 @@ class FomuEVTPlatform(LatticeICE40Platform, LUNAPlatform):
     # We only have a direct connection on our USB lines, so use that for USB comms.
     default_usb_connection = "usb"
 
+    # Write warmboot bundles the same way we write single bitstreams.
+    multiboot_flash_command = ("fomu-flash", "-w")
+
     device      = "iCE40UP5K"
     package     = "SG48"
 
@@ -19,27 +19,46 @@ import logging
 
 from amaranth import *
 from amaranth.build import *
-from amaranth.vendor.xilinx_7series import Xilinx7SeriesPlatform
 
 from amaranth_boards.genesys2 import Genesys2Platform as _CoreGenesys2Platform
 from amaranth_boards.resources import *
 
-from luna.gateware.architecture.car     import PHYResetController
-from luna.gateware.interface.pipe       import GearedPIPEInterface, AsyncPIPEInterface
-from luna.gateware.interface.serdes_phy import XC7GTXSerDesPIPE
-
 from luna.gateware.platform.core import LUNAPlatform
 
+from ._lazy import LazySuperSpeedPHY, lazy_module_attributes
+from .pll  import domain_frequencies, shared_clocks, solve_xilinx_pll, xilinx_pll_parameters
+from .buildcache import cached_build_plan
+from .buildstats import BuildStatsMixin
+from .vivado     import VivadoBitstreamMixin, VivadoBitstreamProfile, VivadoIncrementalMixin, merge_overrides, out_of_context_overrides
+
 
 class Genesys2HTGClockDomainGenerator(Elaboratable):
     """ Clock/Reset Controller for the Genesys2, used with TUSB1310 PHY. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Every domain here is fixed: sync runs directly from the 200 MHz oscillator that also feeds our
+    # IDELAYCTRL, fast is the PHY's 250 MHz PCLK, and the USB2 domains come from its 60 MHz ULPI clock.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   250,
+        "sync":   200,
+        "usb_io": 60,
+        "usb":    60,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
+        from luna.gateware.architecture.car import PHYResetController
+
         m = Module()
 
+        # We can't move any of our clocks; but we'll still reject requests that ask us to.
+        domain_frequencies(self, platform, fixed=self.DEFAULT_CLOCK_FREQUENCIES_MHZ)
+
         # Synthetic clock domains.
         m.domains.sync     = ClockDomain(reset_less=True)
         m.domains.fast     = ClockDomain()
@@ -61,23 +80,15 @@ class Genesys2HTGClockDomainGenerator(Elaboratable):
         # so we sample at a valid point and don't violate setup or hold.
         usb2_locked   = Signal()
         usb2_feedback = Signal()
-        m.submodules.usb2_pll = Instance("PLLE2_ADV",
-            p_BANDWIDTH            = "OPTIMIZED",
-            p_COMPENSATION         = "ZHOLD",
-            p_STARTUP_WAIT         = "FALSE",
-            p_DIVCLK_DIVIDE        = 1,
-            p_CLKFBOUT_MULT        = 14,
-            p_CLKFBOUT_PHASE       = 0.000,
-            p_CLKOUT0_DIVIDE       = 14,
-            p_CLKOUT0_PHASE        = 270.000,
-            p_CLKOUT0_DUTY_CYCLE   = 0.500,
-            i_CLKFBIN              = usb2_feedback,
-            o_CLKFBOUT             = usb2_feedback,
-            i_CLKIN1               = ClockSignal("usb_io"),  # 60 MHz
-            p_CLKIN1_PERIOD        = 16.67,
-            o_CLKOUT0              = ClockSignal("usb"),     # 60 MHz
-            o_LOCKED               = usb2_locked,
-        )
+        usb2_pll_config = solve_xilinx_pll(60e6, (
+            ("usb", 60e6, 270),
+        ), speed_grade=platform.speed)
+        m.submodules.usb2_pll = Instance(f"{usb2_pll_config.primitive}_ADV", **xilinx_pll_parameters(usb2_pll_config,
+            clkin    = ClockSignal("usb_io"),  # 60 MHz
+            clocks   = {"usb": ClockSignal("usb")},
+            feedback = usb2_feedback,
+            locked   = usb2_locked,
+        ))
 
         # Create a reset controller for our USB2 PHY.
         m.submodules.phy_reset = phy_reset = PHYResetController(clock_frequency=200e6)
@@ -87,39 +98,30 @@ class Genesys2HTGClockDomainGenerator(Elaboratable):
         #
         usb3_locked        = Signal()
         usb3_feedback      = Signal()
-        m.submodules.usb3_pll = Instance("PLLE2_BASE",
-            p_STARTUP_WAIT         = "FALSE",
+        usb3_pll_config = solve_xilinx_pll(250e6, (
+            # 125 MHz (1/2 PCLK)
+            ("ss",            125e6, 90),
 
-            # 250 MHz input from PCLK, VCO at 1GHz
-            i_CLKIN1               = ClockSignal("ss_io"),
-            p_REF_JITTER1          = 0.01,
-            p_CLKIN1_PERIOD        = 4.0,
-            p_DIVCLK_DIVIDE        = 1,
-            p_CLKFBOUT_MULT        = 4,
-            p_CLKFBOUT_PHASE       = 0.000,
-
-            o_LOCKED               = usb3_locked,
-
-            # Clock feedback.
-            i_CLKFBIN              = usb3_feedback,
-            o_CLKFBOUT             = usb3_feedback,
-
-            # CLKOUT0 = 125 MHz (1/2 PCLK)
-            p_CLKOUT0_DIVIDE       = 8,
-            p_CLKOUT0_PHASE        = 90,
-            o_CLKOUT0              = ClockSignal("ss"),
-
-            # CLKOUT1 = 125 MHz / 8ns (1/2 PCLK + phase delay)
+            # 125 MHz / 8ns (1/2 PCLK + phase delay)
             # We want to sample our input after 2ns. This is >=90 degrees of this clock.
-            p_CLKOUT1_DIVIDE       = 8,
-            p_CLKOUT1_PHASE        = 0.0,
-            o_CLKOUT1              = ClockSignal("ss_shifted"),
-
-            # CLKOUT2 = 250 MHz (PCLK + phase delay)
-            p_CLKOUT2_DIVIDE       = 4,
-            p_CLKOUT2_PHASE        = 90,
-            o_CLKOUT2              = ClockSignal("ss_io_shifted"),
-        )
+            ("ss_shifted",    125e6, 0),
+
+            # 250 MHz (PCLK + phase delay)
+            ("ss_io_shifted", 250e6, 90),
+        ), speed_grade=platform.speed)
+
+        # 250 MHz input from PCLK.
+        m.submodules.usb3_pll = Instance(f"{usb3_pll_config.primitive}_BASE", **xilinx_pll_parameters(usb3_pll_config,
+            clkin    = ClockSignal("ss_io"),
+            clocks   = {
+                "ss":            ClockSignal("ss"),
+                "ss_shifted":    ClockSignal("ss_shifted"),
+                "ss_io_shifted": ClockSignal("ss_io_shifted"),
+            },
+            feedback = usb3_feedback,
+            locked   = usb3_locked,
+            variant  = "BASE",
+        ))
 
 
         # Grab our main clock.
@@ -159,45 +161,29 @@ class Genesys2HTGClockDomainGenerator(Elaboratable):
         return m
 
 
-class Genesys2HTGSuperSpeedPHY(GearedPIPEInterface):
-    """ Interface for the TUSB1310A, mounted on the HTG-FMC-USB3.0 board. """
-
-    SYNC_FREQUENCY = 200e6
-
-    def __init__(self, platform, with_usb2=False, index=1):
-        logging.info("Using the HiTechGlobal HTG-FMC-USB3.0 PHY board, connected via FMC.")
-
-        self._with_usb2 = with_usb2
-        self._index     = index
-
-        # Grab the geared I/O for our PIPE PHY...
-        phy_connection = platform.request('hitech_fmc_pipe', 1, xdr=GearedPIPEInterface.GEARING_XDR)
-
-        # ... and create a PIPE interface around it.
-        super().__init__(pipe=phy_connection)
-
-
-    def elaborate(self, platform):
-
-        # Grab our platform, so we can tweak it.
-        m = super().elaborate(platform)
-
-        # If we're not using the USB2 functionality, we'll want to drive the ULPI lines as straps.
-        # Request them, so our PULL attributes are included.
-        if not self._with_usb2:
-            platform.request("hitech_fmc_ulpi_straps", 1)
-
-        return m
-
-
 class Genesys2GTXClockDomainGenerator(Elaboratable):
     """ Clock/Reset Controller for the Genesys2, used with the SerDes PHY. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # The transceivers fix our ss domain at 125 MHz, and our ULPI PHY fixes the USB2 domains at 60 MHz;
+    # sync shares the ss clock unless it's asked to run faster.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   250,
+        "sync":   125,
+        "ss":     125,
+        "usb_io": 60,
+        "usb":    60,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("ss", "usb_io", "usb"))
 
         # Grab our main clock and reset.
         clk200 = platform.request(platform.default_clk).i
@@ -215,59 +201,36 @@ class Genesys2GTXClockDomainGenerator(Elaboratable):
         # so we sample at a valid point and don't violate setup or hold.
         usb2_locked   = Signal()
         usb2_feedback = Signal()
-        m.submodules.usb2_pll = Instance("PLLE2_ADV",
-            p_BANDWIDTH            = "OPTIMIZED",
-            p_COMPENSATION         = "ZHOLD",
-            p_STARTUP_WAIT         = "FALSE",
-            p_DIVCLK_DIVIDE        = 1,
-            p_CLKFBOUT_MULT        = 14,
-            p_CLKFBOUT_PHASE       = 0.000,
-            p_CLKOUT0_DIVIDE       = 14,
-            p_CLKOUT0_PHASE        = 270.000,
-            p_CLKOUT0_DUTY_CYCLE   = 0.500,
-            i_CLKFBIN              = usb2_feedback,
-            o_CLKFBOUT             = usb2_feedback,
-            i_CLKIN1               = ClockSignal("usb_io"),  # 60 MHz
-            p_CLKIN1_PERIOD        = 16.67,
-            o_CLKOUT0              = ClockSignal("usb"),     # 60 MHz
-            o_LOCKED               = usb2_locked,
-            i_RST                  = rst,
-        )
+        usb2_pll_config = solve_xilinx_pll(60e6, (
+            ("usb", 60e6, 270),
+        ), speed_grade=platform.speed)
+        m.submodules.usb2_pll = Instance(f"{usb2_pll_config.primitive}_ADV", **xilinx_pll_parameters(usb2_pll_config,
+            clkin    = ClockSignal("usb_io"),  # 60 MHz
+            clocks   = {"usb": ClockSignal("usb")},
+            feedback = usb2_feedback,
+            locked   = usb2_locked,
+            reset    = rst,
+        ))
+
+        # USB3 PLL connections; sync shares a clock with any domain at the same frequency.
+        requests, aliases = shared_clocks(frequencies, ("fast", "ss", "sync"))
+        clocks = {domain: Signal(name=f"clk_{domain}") for domain, _ in requests}
 
-        # USB3 PLL connections.
-        clk250        = Signal()
-        clk125        = Signal()
         usb3_locked   = Signal()
         usb3_feedback = Signal()
-        m.submodules.usb3_pll = Instance("PLLE2_ADV",
-            p_BANDWIDTH            = "OPTIMIZED",
-            p_COMPENSATION         = "ZHOLD",
-            p_STARTUP_WAIT         = "FALSE",
-            p_DIVCLK_DIVIDE        = 1,
-            p_CLKFBOUT_MULT        = 5,     # VCO = 1000 MHz
-            p_CLKFBOUT_PHASE       = 0.000,
-            p_CLKOUT0_DIVIDE       = 4,     # CLKOUT0 = 250 MHz (1000/4)
-            p_CLKOUT0_PHASE        = 0.000,
-            p_CLKOUT0_DUTY_CYCLE   = 0.500,
-            p_CLKOUT1_DIVIDE       = 8,     # CLKOUT1 = 125 MHz (1000/8)
-            p_CLKOUT1_PHASE        = 0.000,
-            p_CLKOUT1_DUTY_CYCLE   = 0.500,
-            i_CLKFBIN              = usb3_feedback,
-            o_CLKFBOUT             = usb3_feedback,
-            i_CLKIN1               = clk200,
-            p_CLKIN1_PERIOD        = 20.000,
-            o_CLKOUT0              = clk250,
-            o_CLKOUT1              = clk125,
-            o_LOCKED               = usb3_locked,
-            i_RST                  = rst,
-        )
+        usb3_pll_config = solve_xilinx_pll(platform.default_clk_frequency, requests, speed_grade=platform.speed)
+        m.submodules.usb3_pll = Instance(f"{usb3_pll_config.primitive}_ADV", **xilinx_pll_parameters(usb3_pll_config,
+            clkin    = clk200,
+            clocks   = clocks,
+            feedback = usb3_feedback,
+            locked   = usb3_locked,
+            reset    = rst,
+        ))
 
         # Connect up our clock domains.
+        m.d.comb += [ClockSignal(domain).eq(clocks[domain]) for domain, _ in requests]
+        m.d.comb += [ClockSignal(domain).eq(clocks[source]) for domain, source in aliases.items()]
         m.d.comb += [
-            ClockSignal("sync")     .eq(clk125),
-            ClockSignal("ss")       .eq(clk125),
-            ClockSignal("fast")     .eq(clk250),
-
             ResetSignal("usb")      .eq(~usb2_locked),
             ResetSignal("sync")     .eq(~usb3_locked),
             ResetSignal("ss")       .eq(~usb3_locked),
@@ -277,62 +240,40 @@ class Genesys2GTXClockDomainGenerator(Elaboratable):
         return m
 
 
-class Genesys2GTXSuperSpeedPHY(AsyncPIPEInterface):
-    """ Superspeed PHY configuration for the Genesys2, using transceivers. """
-
-    SS_FREQUENCY   = 125e6
-    FAST_FREQUENCY = 250e6
-
-
-    def __init__(self, platform):
-
-        # Grab the I/O that implements our SerDes interface...
-        serdes_io = platform.request("hitech_fmc_serdes", dir={'tx':"-", 'rx':"-"})
+# Build our PHY classes only once something asks for them (PEP 562).
+__getattr__ = lazy_module_attributes(globals(), {
+    "Genesys2HTGSuperSpeedPHY": ".phy.genesys2",
+    "Genesys2GTXSuperSpeedPHY": ".phy.genesys2",
+})
 
-        # Use it to create our soft PHY...
-        serdes_phy = XC7GTXSerDesPIPE(
-            tx_pads             = serdes_io.tx,
-            rx_pads             = serdes_io.rx,
-            refclk_frequency    = self.FAST_FREQUENCY,
-            ss_clock_frequency  = self.SS_FREQUENCY,
-        )
-
-        # ... and bring the PHY interface signals to the MAC domain.
-        super().__init__(serdes_phy, width=4, domain="ss")
-
-
-    def elaborate(self, platform):
-        m = super().elaborate(platform)
-
-        # Patch in our soft PHY as a submodule.
-        m.submodules.phy = self.phy
 
-        # Drive the PHY reference clock with our fast generated clock.
-        m.d.comb += self.clk.eq(ClockSignal("fast"))
 
-        # This board does not have a way to detect Vbus, so assume it's always present.
-        m.d.comb += self.phy.power_present.eq(1)
-
-        return m
+class _Genesys2BoardPlatform(_CoreGenesys2Platform):
+    """ The amaranth-boards Genesys 2; without its toolchain overrides, which our own replace. """
 
+    def toolchain_prepare(self, fragment, name, **kwargs):
+        return super(_CoreGenesys2Platform, self).toolchain_prepare(fragment, name, **kwargs)
 
 
-class Genesys2Platform(_CoreGenesys2Platform, LUNAPlatform):
+class Genesys2Platform(BuildStatsMixin, VivadoIncrementalMixin, VivadoBitstreamMixin, _Genesys2BoardPlatform, LUNAPlatform):
     """ Board description for the Digilent Genesys 2."""
 
     name                   = "Genesys2"
     default_usb_connection = "usb"
     ulpi_raw_clock_domain  = "usb_io"
 
+    # Boot quickly from our 32 MiB quad-SPI flash (S25FL256S).
+    bitstream_profile      = VivadoBitstreamProfile(bus_width=4, config_rate=33, flash_size=32)
+
     # Select how we'll connect to our USB PHY.
     usb_connections = 'hpc_fmc'
 
     if usb_connections == 'hpc_fmc':
         clock_domain_generator = Genesys2HTGClockDomainGenerator
-        default_usb3_phy       = Genesys2HTGSuperSpeedPHY
+        default_usb3_phy       = LazySuperSpeedPHY(__name__, "Genesys2HTGSuperSpeedPHY")
     else:
         clock_domain_generator = Genesys2GTXClockDomainGenerator
-        default_usb3_phy       = Genesys2GTXSuperSpeedPHY
+        default_usb3_phy       = LazySuperSpeedPHY(__name__, "Genesys2GTXSuperSpeedPHY")
 
 
     # Additional resources for LUNA-specific connections.
@@ -743,7 +684,6 @@ class Genesys2Platform(_CoreGenesys2Platform, LUNAPlatform):
     def toolchain_prepare(self, fragment, name, **kwargs):
         overrides = {
             "script_after_read": "auto_detect_xpm",
-            "script_before_bitstream": "set_property BITSTREAM.GENERAL.COMPRESS TRUE [current_design]",
             "add_constraints": """
                 set_property CFGBVS VCCO [current_design]
                 set_property CONFIG_VOLTAGE 3.3 [current_design]
@@ -752,7 +692,10 @@ class Genesys2Platform(_CoreGenesys2Platform, LUNAPlatform):
                 # This saves us having to customize our logic if the USB2 domains aren't used.
                 set_property SEVERITY {Warning} [get_drc_checks REQP-161]
             """}
-        return Xilinx7SeriesPlatform.toolchain_prepare(self, fragment, name, **overrides, **kwargs)
+        overrides = out_of_context_overrides(self, merge_overrides(overrides, kwargs))
+
+        plan = super().toolchain_prepare(fragment, name, **overrides)
+        return cached_build_plan(self, plan, name, overrides)
 
 
 
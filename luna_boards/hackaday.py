@@ -26,15 +26,35 @@ from amaranth_boards.resources import *
 
 from luna.gateware.platform.core import LUNAPlatform
 
+from .pll import domain_frequencies, shared_clocks, solve_ehxplll, ehxplll_parameters
+from .buildcache import cached_build_plan
+from .buildstats import BuildStatsMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+from .ecppack    import ECP5BitstreamMixin, ECP5BitstreamProfile
+
 
 class SuperconDomainGenerator(Elaboratable):
     """ Simple clock domain generator for the Hackaday Supercon badge. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # The full-speed PHY needs a 48 MHz usb_io clock and a 12 MHz usb clock; sync and fast can be
+    # raised, and get their own PLL outputs once they no longer match another domain.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   48,
+        "sync":   48,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("usb_io", "usb"))
         locked = Signal()
 
         # Grab our default input clock.
@@ -46,71 +66,20 @@ class SuperconDomainGenerator(Elaboratable):
         m.domains.usb_io = ClockDomain()
         m.domains.fast   = ClockDomain()
 
-        m.submodules.pll = Instance("EHXPLLL",
-
-                # Status.
-                o_LOCK=locked,
-
-                # PLL parameters...
-                p_PLLRST_ENA="DISABLED",
-                p_INTFB_WAKE="DISABLED",
-                p_STDBY_ENABLE="DISABLED",
-                p_DPHASE_SOURCE="DISABLED",
-                p_OUTDIVIDER_MUXA="DIVA",
-                p_OUTDIVIDER_MUXB="DIVB",
-                p_OUTDIVIDER_MUXC="DIVC",
-                p_OUTDIVIDER_MUXD="DIVD",
-                p_CLKI_DIV = 1,
-                p_CLKOP_ENABLE = "ENABLED",
-                p_CLKOP_DIV = 12,
-                p_CLKOP_CPHASE = 5,
-                p_CLKOP_FPHASE = 0,
-                p_CLKOS2_ENABLE = "ENABLED",
-                p_CLKOS2_DIV = 48,
-                p_CLKOS2_CPHASE = 5,
-                p_CLKOS2_FPHASE = 0,
-                p_FEEDBK_PATH = "CLKOP",
-                p_CLKFB_DIV = 6,
-
-                # Clock in.
-                i_CLKI=input_clock,
-
-                # Internal feedback.
-                i_CLKFB=ClockSignal("sync"),
-
-                # Control signals.
-                i_RST=0,
-                i_PHASESEL0=0,
-                i_PHASESEL1=0,
-                i_PHASEDIR=1,
-                i_PHASESTEP=1,
-                i_PHASELOADREG=1,
-                i_STDBY=0,
-                i_PLLWAKESYNC=0,
-
-                # Output Enables.
-                i_ENCLKOP=0,
-                i_ENCLKOS2=0,
-
-                # Generated clock outputs.
-                o_CLKOP=ClockSignal("sync"),
-                o_CLKOS2=ClockSignal("usb"),
-
-                # Synthesis attributes.
-                a_FREQUENCY_PIN_CLKI="8",
-                a_FREQUENCY_PIN_CLKOP="48",
-                a_FREQUENCY_PIN_CLKOS2="12",
-                a_ICP_CURRENT="12",
-                a_LPF_RESISTOR="8",
-                a_MFG_ENABLE_FILTEROPAMP="1",
-                a_MFG_GMCREF_SEL="2"
-        )
+        # Domains that run at the same frequency share a clock; so only distinct frequencies need PLL outputs.
+        requests, aliases = shared_clocks(frequencies, ("sync", "usb", "usb_io", "fast"))
 
-        # We'll use our 48MHz clock for everything _except_ the usb domain...
-        m.d.comb += [
-            ClockSignal("usb_io")  .eq(ClockSignal("sync")),
-            ClockSignal("fast")    .eq(ClockSignal("sync")),
+        # Our sync clock is generated directly on CLKOP; which also serves as our PLL feedback.
+        pll_config = solve_ehxplll(platform.default_clk_frequency, requests, dedicated_feedback=False)
+        m.submodules.pll = Instance("EHXPLLL", **ehxplll_parameters(pll_config,
+            clki=input_clock,
+            clocks={domain: ClockSignal(domain) for domain, _ in requests},
+            locked=locked,
+        ))
 
+        # By default, we'll use our 48MHz clock for everything _except_ the usb domain...
+        m.d.comb += [ClockSignal(domain).eq(ClockSignal(source)) for domain, source in aliases.items()]
+        m.d.comb += [
             ResetSignal("sync")    .eq(~locked),
             ResetSignal("usb")     .eq(~locked),
             ResetSignal("usb_io")  .eq(~locked),
@@ -265,18 +234,22 @@ class _Supercon19BadgePlatform(LatticeECP5Platform):
     ]
 
     def toolchain_prepare(self, fragment, name, **kwargs):
-        overrides = dict(ecppack_opts="--compress --freq 38.8")
-        overrides.update(kwargs)
-        return super().toolchain_prepare(fragment, name, **overrides, **kwargs)
+        plan = super().toolchain_prepare(fragment, name, **kwargs)
+        return cached_build_plan(self, plan, name, kwargs)
+
+    # Find our badges by their DFU bootloaders, when programming many at once.
+    fleet_usb_ids = ((0x1d50, 0x614b),)
 
-    def toolchain_program(self, products, name):
+    def toolchain_program(self, products, name, serial=None):
         dfu_util = os.environ.get("DFU_UTIL", "dfu-util")
+        selector = ["-S", serial] if serial is not None else []
         with products.extract("{}.bit".format(name)) as bitstream_filename:
-            subprocess.check_call([dfu_util, "-d", "1d50:614b", "-a", "0", "-D", bitstream_filename])
+            subprocess.check_call([dfu_util, "-d", "1d50:614b", *selector, "-a", "0", "-D", bitstream_filename])
 
 
 
-class Supercon19BadgePlatform(_Supercon19BadgePlatform, LUNAPlatform):
+class Supercon19BadgePlatform(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _Supercon19BadgePlatform, LUNAPlatform):
     name                   = "HAD Supercon 2019 Badge"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi", "qspi"))
     clock_domain_generator = SuperconDomainGenerator
     default_usb_connection = "usb"
@@ -31,12 +31,34 @@ from amaranth_boards.icebreaker_bitsy import ICEBreakerBitsyPlatform as _IceBrea
 
 from luna.gateware.platform.core import LUNAPlatform
 
+from .pll import domain_frequencies, shared_clocks, solve_sb_pll40, sb_pll40_parameters
+from .buildstats import BuildStatsMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+from .warmboot   import ICE40MultibootMixin
+
 
 class IceBreakerDomainGenerator(Elaboratable):
     """ Creates clock domains for the iCEBreaker. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our PLL has only two outputs; and our full-speed PHY needs both a 48 MHz and a 12 MHz clock.
+    # Any other frequency must be shared with one of those.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   48,
+        "sync":   48,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
+    def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
+        self.clock_frequencies = clock_frequencies
+
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("usb_io", "usb"))
 
         # Create our domains...
         m.domains.sync   = ClockDomain()
@@ -48,48 +70,37 @@ class IceBreakerDomainGenerator(Elaboratable):
         platform.lookup(platform.default_clk).attrs['GLOBAL'] = False
 
         # ... create our 48 MHz IO and 12 MHz USB clocks...
-        clk48 = Signal()
-        clk12 = Signal()
-        m.submodules.pll = Instance("SB_PLL40_2F_PAD",
-            i_PACKAGEPIN    = platform.request(platform.default_clk, dir="i"),
-            i_RESETB        = Const(1),
-            i_BYPASS        = Const(0),
-
-            o_PLLOUTGLOBALA   = clk48,
-            o_PLLOUTGLOBALB   = clk12,
-
-            # Create a 48 MHz PLL clock...
-            p_FEEDBACK_PATH = "SIMPLE",
-            p_PLLOUT_SELECT_PORTA = "GENCLK",
-            p_PLLOUT_SELECT_PORTB = "SHIFTREG_0deg",
-            p_DIVR          = 0,
-            p_DIVF          = 63,
-            p_DIVQ          = 4,
-            p_FILTER_RANGE  = 1,
-        )
+        requests, aliases = shared_clocks(frequencies, ("usb_io", "usb", "sync", "fast"))
+        clocks = {domain: Signal(name=f"clk_{domain}") for domain, _ in requests}
+
+        pll_config = solve_sb_pll40(platform.default_clk_frequency, requests, from_pad=True)
+        m.submodules.pll = Instance(pll_config.primitive, **sb_pll40_parameters(pll_config,
+            reference      = platform.request(platform.default_clk, dir="i"),
+            clocks         = clocks,
+            global_outputs = True,
+        ))
 
         # ... and constrain them to their new frequencies.
-        platform.add_clock_constraint(clk48, 48e6)
-        platform.add_clock_constraint(clk12, 12e6)
+        for domain, clock in clocks.items():
+            platform.add_clock_constraint(clock, pll_config.output(domain).frequency)
 
 
         # We'll use our 48MHz clock for everything _except_ the usb domain...
-        m.d.comb += [
-            ClockSignal("usb_io")  .eq(clk48),
-            ClockSignal("fast")    .eq(clk48),
-            ClockSignal("sync")    .eq(clk48),
-            ClockSignal("usb")     .eq(clk12)
-        ]
+        m.d.comb += [ClockSignal(domain).eq(clock) for domain, clock in clocks.items()]
+        m.d.comb += [ClockSignal(domain).eq(clocks[source]) for domain, source in aliases.items()]
 
 
         return m
 
 
-class IceBreakerPlatform(_IceBreakerPlatform, LUNAPlatform):
+class IceBreakerPlatform(BuildStatsMixin, NextpnrSeedSweepMixin, ICE40MultibootMixin, _IceBreakerPlatform, LUNAPlatform):
     name                   = "iCEBreaker"
     clock_domain_generator = IceBreakerDomainGenerator
     default_usb_connection = "usb_pmod_1a"
 
+    # Our FTDI can write warmboot bundles straight to the start of flash.
+    multiboot_flash_command = ("iceprog",)
+
     additional_resources   = [
         # iCEBreaker official pmod, in 1A and 1B.
         DirectUSBResource("usb_pmod_1a", 0, d_p="47", d_n="45", pullup="4",
@@ -114,12 +125,19 @@ class IceBreakerPlatform(_IceBreakerPlatform, LUNAPlatform):
 
 
 
-class IceBreakerBitsyPlatform(_IceBreakerBitsyPlatform, LUNAPlatform):
+class IceBreakerBitsyPlatform(BuildStatsMixin, NextpnrSeedSweepMixin, ICE40MultibootMixin, _IceBreakerBitsyPlatform, LUNAPlatform):
     name                   = "iCEBreaker Bitsy"
     clock_domain_generator = IceBreakerDomainGenerator
     default_usb_connection = "usb"
 
-    def toolchain_program(self, products, name):
+    # Our DFU bootloader lives where warmboot bundles go; so they need an external programmer.
+    multiboot_replaces_bootloader = True
+
+    # Find our boards by their DFU bootloaders, when programming many at once.
+    fleet_usb_ids = ((0x1209, 0x6146),)
+
+    def toolchain_program(self, products, name, serial=None):
         dfu_util = os.environ.get("DFU_UTIL", "dfu-util")
+        selector = ["-S", serial] if serial is not None else []
         with products.extract("{}.bin".format(name)) as bitstream_filename:
-            subprocess.check_call([dfu_util, "-d", "1209:6146", "-a", "0", "-R", "-D", bitstream_filename])
+            subprocess.check_call([dfu_util, "-d", "1209:6146", *selector, "-a", "0", "-R", "-D", bitstream_filename])
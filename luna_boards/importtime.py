@@ -0,0 +1,135 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Import-time regression check for the luna_boards board modules.
+
+Each board module is imported in a fresh interpreter running ``python -X importtime``, and its
+cumulative import cost is recorded. Results can be saved as a baseline, and later runs compared
+against it:
+
+    > python -m luna_boards.importtime --save importtime.json
+    > python -m luna_boards.importtime --baseline importtime.json
+
+A comparison fails if any board module got noticeably slower, or if a board module started
+eagerly importing gateware that's meant to be loaded lazily (e.g. the SerDes/PIPE PHYs).
+"""
+
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+from .registry import PLATFORMS
+
+
+# Modules that board modules should only ever import on demand.
+DEFERRED_MODULES = [
+    "luna.gateware.interface.pipe",
+    "luna.gateware.interface.serdes_phy",
+]
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def board_modules():
+    """ Returns the names of every board module in luna_boards, in a stable order. """
+    return sorted({info.module_name for info in PLATFORMS.values()})
+
+
+def measure_import(module_name, python=sys.executable):
+    """ Imports a module in a fresh interpreter; and returns its import cost.
+
+    Returns a dict with the module's cumulative import time (in microseconds), and the list of
+    deferred modules it imported. If the import fails, the import time is None, and the dict also
+    holds the import's ``error`` output.
+    """
+
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module_name}"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        return {"cumulative_us": None, "deferred_imports": [], "error": "\n".join(errors)}
+
+    cumulative_us = None
+    imported      = set()
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+
+        name = match.group(4)
+        imported.add(name)
+        if name == module_name:
+            cumulative_us = int(match.group(2))
+
+    return {
+        "cumulative_us": cumulative_us,
+        "deferred_imports": [name for name in DEFERRED_MODULES if name in imported],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """ Compares a set of results against a baseline; and returns a list of regressions found. """
+
+    regressions = []
+    for module_name, result in results.items():
+        if result["cumulative_us"] is None:
+            regressions.append(f"{module_name} failed to import")
+            continue
+
+        if result["deferred_imports"]:
+            regressions.append(f"{module_name} eagerly imports {', '.join(result['deferred_imports'])}")
+
+        reference = baseline.get(module_name)
+        if reference is None or not reference.get("cumulative_us"):
+            continue
+
+        limit = reference["cumulative_us"] * (1 + tolerance)
+        if result["cumulative_us"] > limit:
+            regressions.append(f"{module_name} took {result['cumulative_us']}us to import "
+                f"(baseline {reference['cumulative_us']}us)")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import cost of each luna_boards board module.")
+    parser.add_argument("modules", nargs="*", help="board modules to measure; defaults to all of them")
+    parser.add_argument("--save", metavar="FILE", help="write the measured costs to FILE, as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="fail if any module regressed against FILE")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+        help="fractional slow-down allowed against the baseline (default: 0.25)")
+    args = parser.parse_args()
+
+    results = {}
+    for module_name in args.modules or board_modules():
+        results[module_name] = result = measure_import(module_name)
+        if result["cumulative_us"] is None:
+            print(f"{module_name:32} failed to import:\n{result['error']}", file=sys.stderr)
+            continue
+
+        deferred = ", ".join(result["deferred_imports"]) or "-"
+        print(f"{module_name:32} {result['cumulative_us'] / 1000:10.1f} ms    eager: {deferred}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,574 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Native JTAG programming for the luna_boards Xilinx 7-series platforms with FTDI JTAG adapters.
+
+Loads bitstreams into 7-series FPGAs directly from Python, over an FTDI chip's MPSSE engine; rather
+than through an external tool. The whole bitstream is shifted from memory as a single JTAG transfer,
+sent to the adapter in large bursts, at a configurable TCK frequency:
+
+    > LUNA_JTAG_FREQUENCY=30 python my_design.py
+    > python -m luna_boards.jtag build/top.bit --serial FT4Z1A2B
+
+The programmer talks to the FPGA through a :class:`JTAGTransport`; which moves the TAP between
+states and shifts bits through it. :class:`MPSSETransport` drives an FTDI adapter (and requires
+``pyftdi``); :class:`SimulatedTransport` models a 7-series TAP in software, so the programming
+sequence can be exercised without hardware:
+
+    transport = SimulatedTransport()
+    Xilinx7SeriesJTAGProgrammer(transport).configure(bitstream)
+    assert transport.configuration == bitstream_payload(bitstream)
+"""
+
+import os
+import sys
+import time
+import argparse
+
+
+__all__ = [
+    "JTAGError", "JTAGTransport", "MPSSETransport", "SimulatedTransport",
+    "Xilinx7SeriesJTAGProgrammer", "MPSSEProgrammerMixin", "bitstream_payload",
+]
+
+
+# The 7-series JTAG instructions we use; per UG470.
+IR_LENGTH     = 6
+CFG_IN        = 0b000101
+IDCODE        = 0b001001
+JPROGRAM      = 0b001011
+JSTART        = 0b001100
+ISC_NOOP      = 0b010100
+BYPASS        = 0b111111
+
+# The status bits captured into the instruction register.
+INIT_COMPLETE = 1 << 4
+DONE          = 1 << 5
+
+# The TCK cycles to spend in Run-Test/Idle after JSTART, so the FPGA can run its startup sequence.
+STARTUP_CYCLES = 2000
+
+# Our default TCK frequency; well within what both our adapters and the 7-series TAP can manage.
+DEFAULT_FREQUENCY = 15e6
+
+
+# Maps each byte to its bit-reversal. Configuration data is shifted MSB-first, but JTAG shifts LSB-first.
+_BIT_REVERSE = bytes(int(f"{value:08b}"[::-1], 2) for value in range(256))
+
+
+class JTAGError(IOError):
+    """ Raised when a JTAG device doesn't respond, or doesn't do what it's asked. """
+
+
+def bitstream_payload(bitstream):
+    """ Returns the configuration data in a bitstream; stripping the header from Vivado ``.bit`` files. """
+
+    bitstream = bytes(bitstream)
+
+    # Raw (.bin) bitstreams are already just configuration data.
+    if not bitstream.startswith(b"\x00\x09"):
+        return bitstream
+
+    # Otherwise, skip the .bit header's fixed preamble, then each of its fields; until we find the data ('e').
+    offset = 13
+    while offset < len(bitstream):
+        key = bitstream[offset:offset + 1]
+        if key == b"e":
+            length = int.from_bytes(bitstream[offset + 1:offset + 5], "big")
+            return bitstream[offset + 5:offset + 5 + length]
+
+        length  = int.from_bytes(bitstream[offset + 1:offset + 3], "big")
+        offset += 3 + length
+
+    raise ValueError("malformed .bit file: no configuration data found")
+
+
+class JTAGTransport:
+    """ Moves bits through a JTAG TAP; implemented for each way we can reach one.
+
+    Bit sequences are given LSB-first; as both integers and byte strings.
+    """
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def tms(self, bits, count):
+        """ Clocks ``count`` bits of ``bits`` out on TMS; e.g. to move between TAP states. """
+        raise NotImplementedError()
+
+
+    def shift(self, data, length, *, read=False):
+        """ Shifts ``length`` bits of ``data`` through TDI, from Shift-IR or Shift-DR.
+
+        TMS is held low, except on the last bit; which leaves the TAP in the matching Exit1 state.
+        If ``read`` is set, returns the bits captured from TDO as an integer; otherwise, returns None.
+        """
+        raise NotImplementedError()
+
+
+    def idle(self, cycles):
+        """ Clocks TCK ``cycles`` times with TMS low; e.g. to spend time in Run-Test/Idle. """
+        while cycles:
+            count   = min(cycles, 7)
+            self.tms(0, count)
+            cycles -= count
+
+
+    def flush(self):
+        """ Ensures every queued operation has been performed. """
+
+
+    def close(self):
+        """ Releases the transport's connection. """
+        self.flush()
+
+
+class MPSSETransport(JTAGTransport):
+    """ A JTAG transport over an FTDI chip's MPSSE engine.
+
+    Operations are queued as MPSSE commands, and written to the adapter in bursts of ``burst_size`` bytes;
+    or when their results are needed.
+
+    Parameters
+    ----------
+    url: str
+        The pyftdi URL of the adapter's JTAG interface; e.g. ``ftdi://0x0403:0x6011/1``.
+    frequency: float
+        The TCK frequency to run at, in Hz. The actual frequency is available as ``frequency``, once open.
+    burst_size: int
+        The number of bytes of commands to queue before writing them to the adapter.
+    """
+
+    # Our MPSSE pin assignments: TCK, TDI and TMS are outputs; TDO an input. TMS starts high.
+    DIRECTION = 0b1011
+    INITIAL   = 0b1000
+
+    # The most bytes a single MPSSE data command can carry.
+    MAX_COMMAND_BYTES = 0x10000
+
+    def __init__(self, url, *, frequency=DEFAULT_FREQUENCY, burst_size=0x40000):
+        try:
+            from pyftdi.ftdi import Ftdi
+        except ImportError:
+            raise ImportError("pyftdi is required for native JTAG programming") from None
+
+        self._ftdi       = Ftdi()
+        self._commands   = bytearray()
+        self._burst_size = burst_size
+
+        self.frequency = self._ftdi.open_mpsse_from_url(url,
+            direction = self.DIRECTION,
+            initial   = self.INITIAL,
+            frequency = frequency,
+        )
+
+
+    def _queue(self, *commands):
+        for command in commands:
+            self._commands += command
+        if len(self._commands) >= self._burst_size:
+            self.flush()
+
+
+    def _read(self, length):
+        """ Performs every queued operation, and returns the ``length`` bytes they read back. """
+
+        # Ask the adapter to send what it's read right away, rather than waiting for its latency timer.
+        self._commands.append(0x87)
+        self.flush()
+
+        data     = bytearray()
+        deadline = time.monotonic() + 5
+        while len(data) < length:
+            data += self._ftdi.read_data_bytes(length - len(data), attempt=4)
+            if len(data) < length and time.monotonic() > deadline:
+                raise JTAGError(f"JTAG adapter returned only {len(data)} of {length} bytes")
+
+        return bytes(data)
+
+
+    def tms(self, bits, count):
+        while count:
+            chunk = min(count, 7)
+
+            # Clock out TMS on the falling edge; with TDI held high, as it would idle.
+            self._queue(bytes([0x4b, chunk - 1, 0x80 | (bits & ((1 << chunk) - 1))]))
+            bits  >>= chunk
+            count  -= chunk
+
+
+    def idle(self, cycles):
+        # MPSSE can clock TCK in multiples of eight without sending data; which leaves TMS where it is.
+        octets = cycles // 8
+        while octets:
+            chunk   = min(octets, 0x10000)
+            self._queue(bytes([0x8f, (chunk - 1) & 0xff, (chunk - 1) >> 8]))
+            octets -= chunk
+
+        if cycles % 8:
+            self._queue(bytes([0x8e, cycles % 8 - 1]))
+
+
+    def shift(self, data, length, *, read=False):
+        data = memoryview(bytes(data))
+
+        # Shift all but our last bit with TMS low; whole bytes first, then any remaining bits.
+        body      = length - 1
+        octets    = body // 8
+        remainder = body % 8
+
+        # MPSSE data commands: clock bytes / bits out on the falling edge, LSB first; optionally reading TDO.
+        byte_command = 0x39 if read else 0x19
+        bit_command  = 0x3b if read else 0x1b
+        tms_command  = 0x6b if read else 0x4b
+
+        for offset in range(0, octets, self.MAX_COMMAND_BYTES):
+            chunk = data[offset:min(offset + self.MAX_COMMAND_BYTES, octets)]
+            self._queue(bytes([byte_command, (len(chunk) - 1) & 0xff, (len(chunk) - 1) >> 8]), chunk)
+
+        if remainder:
+            self._queue(bytes([bit_command, remainder - 1, data[octets]]))
+
+        # ... and clock the last bit out alongside a TMS high; leaving our Shift state.
+        last = (data[body // 8] >> (body % 8)) & 1
+        self._queue(bytes([tms_command, 0, (last << 7) | 1]))
+
+        if not read:
+            return None
+
+        # Bytes read back arrive whole; bits read back arrive shifted in from the top of a byte.
+        response = self._read(octets + (1 if remainder else 0) + 1)
+        value    = int.from_bytes(response[:octets], "little")
+        if remainder:
+            value |= (response[octets] >> (8 - remainder)) << (8 * octets)
+        value |= (response[-1] >> 7) << body
+
+        return value
+
+
+    def flush(self):
+        if self._commands:
+            self._ftdi.write_data(self._commands)
+            self._commands = bytearray()
+
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._ftdi.close()
+
+
+class SimulatedTransport(JTAGTransport):
+    """ A JTAG transport connected to a software model of a single 7-series TAP.
+
+    The model implements the TAP state machine, and enough of the 7-series configuration logic to
+    check a programming sequence: JPROGRAM clears the FPGA's configuration, data shifted through
+    CFG_IN is collected, and JSTART completes configuration if that data contained a sync word.
+
+    Parameters
+    ----------
+    idcode: int
+        The IDCODE the modeled device reports; by default, an XC7A35T's.
+
+    Attributes
+    ----------
+    state: str
+        The TAP's current state; e.g. ``"Run-Test/Idle"``.
+    instructions: list of int
+        Every instruction loaded into the TAP, in order.
+    configuration: bytes
+        The configuration data the FPGA has received, in the order it was received.
+    init_complete: bool
+        True iff the FPGA is ready to receive configuration data.
+    done: bool
+        True iff the FPGA has been configured, and started up.
+    """
+
+    # The TAP's next state; given its current one, and whether TMS is low or high.
+    TRANSITIONS = {
+        "Test-Logic-Reset": ("Run-Test/Idle",    "Test-Logic-Reset"),
+        "Run-Test/Idle":    ("Run-Test/Idle",    "Select-DR-Scan"),
+        "Select-DR-Scan":   ("Capture-DR",       "Select-IR-Scan"),
+        "Capture-DR":       ("Shift-DR",         "Exit1-DR"),
+        "Shift-DR":         ("Shift-DR",         "Exit1-DR"),
+        "Exit1-DR":         ("Pause-DR",         "Update-DR"),
+        "Pause-DR":         ("Pause-DR",         "Exit2-DR"),
+        "Exit2-DR":         ("Shift-DR",         "Update-DR"),
+        "Update-DR":        ("Run-Test/Idle",    "Select-DR-Scan"),
+        "Select-IR-Scan":   ("Capture-IR",       "Test-Logic-Reset"),
+        "Capture-IR":       ("Shift-IR",         "Exit1-IR"),
+        "Shift-IR":         ("Shift-IR",         "Exit1-IR"),
+        "Exit1-IR":         ("Pause-IR",         "Update-IR"),
+        "Pause-IR":         ("Pause-IR",         "Exit2-IR"),
+        "Exit2-IR":         ("Shift-IR",         "Update-IR"),
+        "Update-IR":        ("Run-Test/Idle",    "Select-DR-Scan"),
+    }
+
+    # The configuration sync word; and the number of TCK cycles the modeled FPGA takes to clear itself.
+    SYNC_WORD    = b"\xaa\x99\x55\x66"
+    CLEAR_CYCLES = 3
+
+    def __init__(self, idcode=0x0362d093):
+        self.idcode        = idcode
+
+        self.state         = "Test-Logic-Reset"
+        self.instructions  = []
+        self.configuration = b""
+        self.init_complete = True
+        self.done          = False
+
+        self._instruction  = IDCODE
+        self._register     = 0
+        self._length       = 0
+        self._config_bits  = []
+        self._clear_cycles = 0
+        self._start_cycles = 0
+
+
+    def clock(self, tms, tdi):
+        """ Clocks the modeled TAP once, with the given TMS and TDI; and returns TDO. """
+
+        tdo = 0
+
+        # Shift states move data through the selected register on every clock; including the one that leaves them.
+        if self.state == "Shift-DR" and self._instruction == CFG_IN:
+            self._config_bits.append(tdi)
+        elif self.state in ("Shift-IR", "Shift-DR"):
+            tdo             = self._register & 1
+            self._register  = (self._register >> 1) | (tdi << (self._length - 1))
+
+        if self.state == "Run-Test/Idle":
+            self._run_test_idle()
+
+        self.state = self.TRANSITIONS[self.state][tms]
+
+        if self.state == "Test-Logic-Reset":
+            self._instruction = IDCODE
+        elif self.state == "Capture-IR":
+            self._register, self._length = self._status(), IR_LENGTH
+        elif self.state == "Update-IR":
+            self._update_instruction(self._register)
+        elif self.state == "Capture-DR":
+            self._register, self._length = (self.idcode, 32) if self._instruction == IDCODE else (0, 1)
+        elif self.state == "Update-DR" and self._instruction == CFG_IN:
+            self._receive_configuration()
+
+        return tdo
+
+
+    def _status(self):
+        return (DONE if self.done else 0) | (INIT_COMPLETE if self.init_complete else 0) | 0b01
+
+
+    def _update_instruction(self, instruction):
+        self.instructions.append(instruction)
+        self._instruction  = instruction
+        self._start_cycles = 0
+
+        if instruction == JPROGRAM:
+            self.configuration = b""
+            self.init_complete = False
+            self.done          = False
+            self._clear_cycles = self.CLEAR_CYCLES
+
+
+    def _run_test_idle(self):
+        if self._clear_cycles:
+            self._clear_cycles -= 1
+            self.init_complete  = not self._clear_cycles
+
+        if self._instruction == JSTART:
+            self._start_cycles += 1
+            if self._start_cycles >= STARTUP_CYCLES and self.SYNC_WORD in self.configuration:
+                self.done = True
+
+
+    def _receive_configuration(self):
+        """ Collects the bits shifted through CFG_IN into bytes; each of which the FPGA receives MSB-first. """
+
+        bits = self._config_bits
+        self.configuration += bytes(
+            sum(bit << (7 - index) for index, bit in enumerate(bits[offset:offset + 8]))
+            for offset in range(0, len(bits) - len(bits) % 8, 8)
+        )
+        self._config_bits = []
+
+
+    def tms(self, bits, count):
+        for index in range(count):
+            self.clock((bits >> index) & 1, 1)
+
+
+    def shift(self, data, length, *, read=False):
+        data  = bytes(data)
+        value = 0
+        for index in range(length):
+            tdi    = (data[index // 8] >> (index % 8)) & 1
+            value |= self.clock(int(index == length - 1), tdi) << index
+
+        return value if read else None
+
+
+class Xilinx7SeriesJTAGProgrammer:
+    """ Loads bitstreams into a 7-series FPGA over JTAG; following the sequence in UG470.
+
+    Parameters
+    ----------
+    transport: JTAGTransport
+        The transport connected to the FPGA's TAP; which must be the only device in its chain.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+
+
+    def reset(self):
+        """ Resets the TAP, and leaves it in Run-Test/Idle. """
+        self.transport.tms(0b011111, 6)
+
+
+    def shift_ir(self, instruction, *, read=False):
+        """ Loads an instruction, from Run-Test/Idle; returning the captured status bits if ``read`` is set. """
+
+        # Select-DR-Scan, Select-IR-Scan, Capture-IR, Shift-IR; then, after shifting, Update-IR and Run-Test/Idle.
+        self.transport.tms(0b0011, 4)
+        status = self.transport.shift(bytes([instruction]), IR_LENGTH, read=read)
+        self.transport.tms(0b01, 2)
+
+        return status
+
+
+    def shift_dr(self, data, length, *, read=False):
+        """ Shifts data through the current data register, from Run-Test/Idle. """
+
+        # Select-DR-Scan, Capture-DR, Shift-DR; then, after shifting, Update-DR and Run-Test/Idle.
+        self.transport.tms(0b001, 3)
+        value = self.transport.shift(data, length, read=read)
+        self.transport.tms(0b01, 2)
+
+        return value
+
+
+    def read_idcode(self):
+        """ Returns the FPGA's IDCODE. """
+
+        self.reset()
+        self.shift_ir(IDCODE)
+        return self.shift_dr(bytes(4), 32, read=True)
+
+
+    def configure(self, bitstream, *, timeout=1):
+        """ Loads a bitstream into the FPGA; and starts it running.
+
+        Parameters
+        ----------
+        bitstream: bytes
+            The bitstream to load; either as a Vivado ``.bit`` file, or as raw configuration data.
+        timeout: float
+            How long to wait for the FPGA to clear its existing configuration, in seconds.
+        """
+
+        data = bitstream_payload(bitstream).translate(_BIT_REVERSE)
+
+        idcode = self.read_idcode()
+        if idcode in (0, 0xffffffff):
+            raise JTAGError(f"no JTAG device responded (IDCODE {idcode:08x}); is the adapter connected?")
+
+        # Clear the FPGA's existing configuration; and wait for it to be ready for a new one.
+        self.shift_ir(JPROGRAM)
+        deadline = time.monotonic() + timeout
+        while not self.shift_ir(ISC_NOOP, read=True) & INIT_COMPLETE:
+            if time.monotonic() > deadline:
+                raise JTAGError("FPGA didn't finish clearing its configuration")
+            self.transport.idle(10000)
+
+        # Send our configuration data, as a single transfer...
+        self.shift_ir(CFG_IN)
+        self.shift_dr(data, 8 * len(data))
+
+        # ... start the FPGA up ...
+        self.shift_ir(JSTART)
+        self.transport.idle(STARTUP_CYCLES)
+        self.reset()
+
+        # ... and check that it's running.
+        status = self.shift_ir(BYPASS, read=True)
+        if not status & DONE:
+            raise JTAGError(f"FPGA didn't finish configuring (status {status:06b}); is the bitstream for this part?")
+
+
+def _frequency(frequency, default):
+    """ Returns the TCK frequency to use, in Hz; taking ``LUNA_JTAG_FREQUENCY`` (in MHz) over our default. """
+
+    if frequency is not None:
+        return frequency
+
+    override = os.environ.get("LUNA_JTAG_FREQUENCY")
+    return float(override) * 1e6 if override else default
+
+
+def _ftdi_url(usb_id, interface, serial=None):
+    vendor_id, product_id = usb_id
+    selector = f":{serial}" if serial is not None else ""
+    return f"ftdi://{vendor_id:#06x}:{product_id:#06x}{selector}/{interface}"
+
+
+class MPSSEProgrammerMixin:
+    """ Platform mixin that programs a 7-series FPGA natively, through an FTDI adapter's MPSSE engine.
+
+    Platforms set ``jtag_usb_id`` to the USB vendor/product ID of their adapter, ``jtag_interface`` to
+    the (one-based) FTDI interface wired to the FPGA's JTAG port, and ``jtag_frequency`` to their TCK.
+    """
+
+    jtag_usb_id    = (0x0403, 0x6011)
+    jtag_interface = 1
+    jtag_frequency = DEFAULT_FREQUENCY
+
+    def toolchain_program(self, products, name, serial=None, frequency=None):
+        bitstream = products.get("{}.bit".format(name))
+        url       = _ftdi_url(self.jtag_usb_id, self.jtag_interface, serial)
+
+        with MPSSETransport(url, frequency=_frequency(frequency, self.jtag_frequency)) as transport:
+            Xilinx7SeriesJTAGProgrammer(transport).configure(bitstream)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a bitstream into a 7-series FPGA through an FTDI JTAG adapter.")
+    parser.add_argument("bitstream", help="the .bit or .bin file to load")
+    parser.add_argument("--usb-id", default="0403:6011", help="the adapter's USB vendor:product ID (default: 0403:6011)")
+    parser.add_argument("--interface", type=int, default=1, help="the adapter interface wired to JTAG (default: 1)")
+    parser.add_argument("--serial", help="the USB serial number of the adapter to use")
+    parser.add_argument("--frequency", type=float, help="the TCK frequency, in MHz (default: 15)")
+    args = parser.parse_args()
+
+    try:
+        usb_id = tuple(int(part, 16) for part in args.usb_id.split(":"))
+    except ValueError:
+        parser.error(f"invalid USB ID '{args.usb_id}'; expected vendor:product, in hex")
+
+    with open(args.bitstream, "rb") as f:
+        bitstream = f.read()
+
+    frequency = _frequency(args.frequency * 1e6 if args.frequency else None, DEFAULT_FREQUENCY)
+    start     = time.monotonic()
+    try:
+        with MPSSETransport(_ftdi_url(usb_id, args.interface, args.serial), frequency=frequency) as transport:
+            Xilinx7SeriesJTAGProgrammer(transport).configure(bitstream)
+            print(f"Loaded {args.bitstream} at {transport.frequency / 1e6:.1f} MHz "
+                f"in {time.monotonic() - start:.1f}s.", file=sys.stderr)
+    except (JTAGError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
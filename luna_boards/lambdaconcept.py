@@ -14,10 +14,7 @@ or
     > export LUNA_PLATFORM="luna_boards.lambdaconcept:ECPIX5PlatformRev02"
 """
 
-import os
-import subprocess
-
-from amaranth import Elaboratable, ClockDomain, Module, ResetSignal
+from amaranth import Elaboratable, ClockDomain, ClockSignal, Module, ResetSignal, Signal, Instance
 from amaranth.build import Resource, Subsignal, Pins, PinsN, Attrs, Clock, DiffPairs, Connector
 from amaranth.vendor.xilinx_7series import Xilinx7SeriesPlatform
 from amaranth.vendor.lattice_ecp5 import LatticeECP5Platform
@@ -25,6 +22,15 @@ from amaranth.vendor.lattice_ecp5 import LatticeECP5Platform
 from luna.gateware.platform.core import LUNAPlatform
 from luna.gateware.architecture.car import PHYResetController
 
+from .pll import domain_frequencies, shared_clocks
+from .pll import solve_ehxplll, ehxplll_parameters, solve_xilinx_pll, xilinx_pll_parameters
+from .buildstats import BuildStatsMixin
+from .jtag       import MPSSEProgrammerMixin
+from .openocd    import run_openocd
+from .vivado     import VivadoBitstreamMixin, VivadoBitstreamProfile, VivadoIncrementalMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+from .ecppack    import ECP5BitstreamMixin, ECP5BitstreamProfile
+
 
 def ULPIResource(name, data_sites, clk_site, dir_site, nxt_site, stp_site, reset_site, extras=(), attrs=None):
     """ Generates a set of resources for a ULPI-connected USB PHY. """
@@ -45,29 +51,89 @@ def ULPIResource(name, data_sites, clk_site, dir_site, nxt_site, stp_site, reset
 class StubClockDomainGenerator(Elaboratable):
     """ Stub clock domain generator; stands in for the typical LUNA one.
 
-    This generator creates domains; but currently does not configuration.
+    By default, this generator creates domains; but doesn't configure them. Only if clock frequencies
+    are requested does it generate our sync and fast clocks from the board's main oscillator, using
+    whichever PLL the platform's FPGA provides.
     """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our usb domain is clocked by the ULPI PHY; sync and fast can be set freely.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast": 200,
+        "sync": 100,
+        "usb":  60,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
 
-        # Create our domains; but don't do anything else for them, for now.
-        m.domains.usb = ClockDomain()
+        # Unless we've been asked for particular frequencies, create our domains; but don't do anything
+        # else for them, for now.
+        if self.clock_frequencies is None:
+            m.domains.usb  = ClockDomain()
+            m.domains.fast = ClockDomain()
+
+            self._elaborate_usb_reset(m)
+            return m
+
+        frequencies = domain_frequencies(self, platform, fixed=("usb",))
+
+        # Create our domains.
+        m.domains.sync = ClockDomain()
+        m.domains.usb  = ClockDomain()
         m.domains.fast = ClockDomain()
 
-        # Handle USB PHY resets.
-        m.submodules.usb_reset = controller = PHYResetController()
+        # Generate our sync and fast clocks; sharing a single output if they match.
+        clk      = platform.request(platform.default_clk, dir="i").i
+        feedback = Signal()
+        locked   = Signal()
+        requests, aliases = shared_clocks(frequencies, ("sync", "fast"))
+        clocks = {domain: ClockSignal(domain) for domain, _ in requests}
+
+        if isinstance(platform, LatticeECP5Platform):
+            pll_config = solve_ehxplll(platform.default_clk_frequency, requests)
+            m.submodules.pll = Instance("EHXPLLL", **ehxplll_parameters(pll_config,
+                clki     = clk,
+                clocks   = clocks,
+                feedback = feedback,
+                locked   = locked,
+            ))
+        else:
+            pll_config = solve_xilinx_pll(platform.default_clk_frequency, requests, speed_grade=platform.speed)
+            m.submodules.pll = Instance(f"{pll_config.primitive}_BASE", **xilinx_pll_parameters(pll_config,
+                clkin    = clk,
+                clocks   = clocks,
+                feedback = feedback,
+                locked   = locked,
+                variant  = "BASE",
+            ))
+
+        m.d.comb += [ClockSignal(domain).eq(ClockSignal(source)) for domain, source in aliases.items()]
         m.d.comb += [
-            ResetSignal("usb")  .eq(controller.phy_reset)
+            ResetSignal("sync") .eq(~locked),
+            ResetSignal("fast") .eq(~locked),
         ]
 
+        self._elaborate_usb_reset(m)
         return m
 
 
-class USB2SnifferPlatform(Xilinx7SeriesPlatform, LUNAPlatform):
+    def _elaborate_usb_reset(self, m):
+        """ Handles USB PHY resets. """
+
+        m.submodules.usb_reset = controller = PHYResetController()
+        m.d.comb += [
+            ResetSignal("usb")  .eq(controller.phy_reset)
+        ]
+
+
+class USB2SnifferPlatform(BuildStatsMixin, MPSSEProgrammerMixin, VivadoIncrementalMixin, VivadoBitstreamMixin, Xilinx7SeriesPlatform, LUNAPlatform):
     """ Board description for OpenVizsla USB analyzer. """
 
     name        = "LambdaConcept USB2Sniffer"
@@ -84,11 +150,14 @@ class USB2SnifferPlatform(Xilinx7SeriesPlatform, LUNAPlatform):
     # We only have a single PHY; so use it directly.
     default_usb_connection = "target_phy"
 
+    # Boot quickly from our quad-SPI flash.
+    bitstream_profile      = VivadoBitstreamProfile(bus_width=4, config_rate=33, flash_size=16)
+
     #
     # I/O resources.
     #
     resources   = [
-        Resource("clk100", 0, Pins("J19"), Attrs(IOStandard="LVCMOS33")),
+        Resource("clk100", 0, Pins("J19", dir="i"), Clock(100e6), Attrs(IOStandard="LVCMOS33")),
 
         Resource("led", 0, PinsN("W1"), Attrs(IOStandard="LVCMOS33")),
         Resource("led", 1, PinsN("Y2"), Attrs(IOStandard="LVCMOS33")),
@@ -186,14 +255,12 @@ class USB2SnifferPlatform(Xilinx7SeriesPlatform, LUNAPlatform):
 
     connectors = []
 
-    def toolchain_program(self, products, name):
-        xc3sprog = os.environ.get("XC3SPROG", "xc3sprog")
-        with products.extract("{}.bit".format(name)) as bitstream_file:
-            subprocess.check_call([xc3sprog, "-c", "ft4232h", bitstream_file])
-
+    # We're programmed natively, through our FT4232H JTAG adapter; where we also find our boards
+    # when programming many at once.
+    fleet_usb_ids = ((0x0403, 0x6011),)
 
 
-class ECPIX5PlatformRev02(LatticeECP5Platform, LUNAPlatform):
+class ECPIX5PlatformRev02(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, LatticeECP5Platform, LUNAPlatform):
     name        = "ECPIX-5 R02"
 
     device      = "LFE5UM5G-85F"
@@ -209,6 +276,9 @@ class ECPIX5PlatformRev02(LatticeECP5Platform, LUNAPlatform):
     # We only have a single PHY; so use it directly.
     default_usb_connection = "ulpi"
 
+    # Pack our bitstreams to load quickly from the board's SPI flash.
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi"))
+
     resources   = [
         Resource("rst", 0, PinsN("AB1", dir="i"), Attrs(IO_TYPE="LVCMOS33")),
         Resource("clk100", 0, Pins("K23", dir="i"), Clock(100e6), Attrs(IO_TYPE="LVCMOS33")),
@@ -365,11 +435,10 @@ class ECPIX5PlatformRev02(LatticeECP5Platform, LUNAPlatform):
             """
         }
 
-    def toolchain_program(self, products, name):
-        openocd = os.environ.get("OPENOCD", "openocd")
+    # Find our boards by their FT2232H JTAG adapters, when programming many at once.
+    fleet_usb_ids = ((0x0403, 0x6010),)
+
+    def toolchain_program(self, products, name, serial=None):
         with products.extract("{}-openocd.cfg".format(name), "{}.svf".format(name)) \
                 as (config_filename, vector_filename):
-            subprocess.check_call([openocd,
-                "-f", config_filename,
-                "-c", "transport select jtag; init; svf -quiet {}; exit".format(vector_filename)
-            ])
+            run_openocd(config_filename, ["svf -quiet {}".format(vector_filename)], serial=serial)
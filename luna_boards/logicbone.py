@@ -25,11 +25,14 @@ from amaranth_boards.logicbone import LogicbonePlatform as _CoreLogicbonePlatfor
 from amaranth_boards.logicbone import Logicbone85FPlatform as _CoreLogicbone85FPlatform
 from amaranth_boards.resources import *
 
-from luna.gateware.interface.pipe       import AsyncPIPEInterface
-from luna.gateware.interface.serdes_phy import ECP5SerDesPIPE
-
 from luna.gateware.platform.core import LUNAPlatform
 
+from ._lazy import LazySuperSpeedPHY, lazy_module_attributes
+from .pll  import domain_frequencies, shared_clocks, solve_ehxplll, ehxplll_parameters
+from .buildstats import BuildStatsMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+from .ecppack    import ECP5BitstreamMixin, ECP5BitstreamProfile
+
 
 __all__ = ["LogicbonePlatform", "Logicbone85FPlatform"]
 
@@ -37,11 +40,26 @@ __all__ = ["LogicbonePlatform", "Logicbone85FPlatform"]
 class LogicboneDomainGenerator(Elaboratable):
     """ Simple clock domain generator for the Logicbone. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our SuperSpeed PHY expects a 125 MHz ss domain, and takes its SerDes reference from our 250 MHz
+    # fast domain; by default, our sync domain shares the ss clock.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   250,
+        "sync":   125,
+        "ss":     125,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("fast", "ss", "usb_io", "usb"))
 
         # Grab our default input clock.
         clk25 = platform.request(platform.default_clk, dir="i")
@@ -57,161 +75,40 @@ class LogicboneDomainGenerator(Elaboratable):
         # USB FS PLL
         feedback    = Signal()
         usb2_locked = Signal()
-        m.submodules.fs_pll = Instance("EHXPLLL",
-
-                # Status.
-                o_LOCK=usb2_locked,
-
-                # PLL parameters...
-                p_PLLRST_ENA="ENABLED",
-                p_INTFB_WAKE="DISABLED",
-                p_STDBY_ENABLE="DISABLED",
-                p_DPHASE_SOURCE="DISABLED",
-                p_OUTDIVIDER_MUXA="DIVA",
-                p_OUTDIVIDER_MUXB="DIVB",
-                p_OUTDIVIDER_MUXC="DIVC",
-                p_OUTDIVIDER_MUXD="DIVD",
-
-                p_CLKI_DIV = 5,
-                p_CLKOP_ENABLE = "ENABLED",
-                p_CLKOP_DIV = 16,
-                p_CLKOP_CPHASE = 15,
-                p_CLKOP_FPHASE = 0,
-
-                p_CLKOS_DIV = 10,
-                p_CLKOS_CPHASE = 0,
-                p_CLKOS_FPHASE = 0,
-
-
-                p_CLKOS2_ENABLE = "ENABLED",
-                p_CLKOS2_DIV = 10,
-                p_CLKOS2_CPHASE = 0,
-                p_CLKOS2_FPHASE = 0,
-
-                p_CLKOS3_ENABLE = "ENABLED",
-                p_CLKOS3_DIV = 40,
-                p_CLKOS3_CPHASE = 5,
-                p_CLKOS3_FPHASE = 0,
-
-                p_FEEDBK_PATH = "CLKOP",
-                p_CLKFB_DIV = 6,
+        fs_pll_config = solve_ehxplll(platform.default_clk_frequency, (
+            ("usb_io", frequencies["usb_io"]),
+            ("usb",    frequencies["usb"]),
+        ))
+        m.submodules.fs_pll = Instance("EHXPLLL", **ehxplll_parameters(fs_pll_config,
+            clki=clk25,
+            clocks={
+                "usb_io": ClockSignal("usb_io"),
+                "usb":    ClockSignal("usb"),
+            },
+            feedback=feedback,
+            locked=usb2_locked,
+            reset=reset,
+        ))
+
+        # Generate the clocks we need for running our SerDes; our sync domain only gets its own output
+        # if it doesn't share the ss frequency.
+        requests, aliases = shared_clocks(frequencies, ("fast", "ss", "sync"))
 
-                # Clock in.
-                i_CLKI=clk25,
-
-                # Internal feedback.
-                i_CLKFB=feedback,
-
-                # Control signals.
-                i_RST=reset,
-                i_PHASESEL0=0,
-                i_PHASESEL1=0,
-                i_PHASEDIR=1,
-                i_PHASESTEP=1,
-                i_PHASELOADREG=1,
-                i_STDBY=0,
-                i_PLLWAKESYNC=0,
-
-                # Output Enables.
-                i_ENCLKOP=0,
-                i_ENCLKOS2=0,
-
-                # Generated clock outputs.
-                o_CLKOP=feedback,
-                o_CLKOS2=ClockSignal("usb_io"),
-                o_CLKOS3=ClockSignal("usb"),
-
-                # Synthesis attributes.
-                a_FREQUENCY_PIN_CLKI="25",
-                a_FREQUENCY_PIN_CLKOP="48",
-                a_FREQUENCY_PIN_CLKOS="48",
-                a_FREQUENCY_PIN_CLKOS2="12",
-                a_ICP_CURRENT="12",
-                a_LPF_RESISTOR="8",
-                a_MFG_ENABLE_FILTEROPAMP="1",
-                a_MFG_GMCREF_SEL="2"
-        )
-
-        # Generate the clocks we need for running our SerDes.
         feedback     = Signal()
         usb3_locked  = Signal()
-        m.submodules.ss_pll = Instance("EHXPLLL",
-
-                # Clock in.
-                i_CLKI=clk25,
-
-                # Generated clock outputs.
-                o_CLKOP=feedback,
-                o_CLKOS= ClockSignal("ss"),
-                o_CLKOS2=ClockSignal("fast"),
-
-                # Status.
-                o_LOCK=usb3_locked,
-
-                # PLL parameters...
-                p_CLKI_DIV=1,
-                p_PLLRST_ENA="ENABLED",
-                p_INTFB_WAKE="DISABLED",
-                p_STDBY_ENABLE="DISABLED",
-                p_DPHASE_SOURCE="DISABLED",
-                p_CLKOS3_FPHASE=0,
-                p_CLKOS3_CPHASE=0,
-                p_CLKOS2_FPHASE=0,
-                p_CLKOS2_CPHASE=5,
-                p_CLKOS_FPHASE=0,
-                p_CLKOS_CPHASE=5,
-                p_CLKOP_FPHASE=0,
-                p_CLKOP_CPHASE=19,
-                p_PLL_LOCK_MODE=0,
-                p_CLKOS_TRIM_DELAY="0",
-                p_CLKOS_TRIM_POL="FALLING",
-                p_CLKOP_TRIM_DELAY="0",
-                p_CLKOP_TRIM_POL="FALLING",
-                p_OUTDIVIDER_MUXD="DIVD",
-                p_CLKOS3_ENABLE="DISABLED",
-                p_OUTDIVIDER_MUXC="DIVC",
-                p_CLKOS2_ENABLE="ENABLED",
-                p_OUTDIVIDER_MUXB="DIVB",
-                p_CLKOS_ENABLE="ENABLED",
-                p_OUTDIVIDER_MUXA="DIVA",
-                p_CLKOP_ENABLE="ENABLED",
-                p_CLKOS3_DIV=1,
-                p_CLKOS2_DIV=2,
-                p_CLKOS_DIV=4,
-                p_CLKOP_DIV=20,
-                p_CLKFB_DIV=1,
-                p_FEEDBK_PATH="CLKOP",
-
-                # Internal feedback.
-                i_CLKFB=feedback,
-
-                # Control signals.
-                i_RST=reset,
-                i_PHASESEL0=0,
-                i_PHASESEL1=0,
-                i_PHASEDIR=1,
-                i_PHASESTEP=1,
-                i_PHASELOADREG=1,
-                i_STDBY=0,
-                i_PLLWAKESYNC=0,
-
-                # Output Enables.
-                i_ENCLKOP=0,
-                i_ENCLKOS=0,
-                i_ENCLKOS2=0,
-                i_ENCLKOS3=0,
-
-                # Synthesis attributes.
-                a_ICP_CURRENT="12",
-                a_LPF_RESISTOR="8"
-        )
-
+        ss_pll_config = solve_ehxplll(platform.default_clk_frequency, requests)
+        m.submodules.ss_pll = Instance("EHXPLLL", **ehxplll_parameters(ss_pll_config,
+            clki=clk25,
+            clocks={domain: ClockSignal(domain) for domain, _ in requests},
+            feedback=feedback,
+            locked=usb3_locked,
+            reset=reset,
+        ))
+        m.d.comb += [ClockSignal(domain).eq(ClockSignal(source)) for domain, source in aliases.items()]
 
 
         # We'll use our 48MHz clock for everything _except_ the usb domain...
         m.d.comb += [
-            ClockSignal("sync")    .eq(ClockSignal("ss")),
-
             # ResetSignal("usb")     .eq(~usb2_locked),
             ResetSignal("usb_io")  .eq(ResetSignal("usb")),
             # ResetSignal("ss")      .eq(~usb3_locked),
@@ -228,55 +125,22 @@ class LogicboneDomainGenerator(Elaboratable):
         return m
 
 
-class LogicboneSuperSpeedPHY(AsyncPIPEInterface):
-    """ Superspeed PHY configuration for the Logicbone. """
-
-    SS_FREQUENCY   = 125e6
-    FAST_FREQUENCY = 250e6
-
-    SERDES_CHANNEL = 0
-
-
-    def __init__(self, platform):
-
-        # Grab the I/O that implements our SerDes interface...
-        serdes_io = platform.request("serdes", self.SERDES_CHANNEL, dir={'tx':"-", 'rx':"-"})
-
-        # Use it to create our soft PHY...
-        serdes_phy = ECP5SerDesPIPE(
-            tx_pads             = serdes_io.tx,
-            rx_pads             = serdes_io.rx,
-            channel             = self.SERDES_CHANNEL,
-            refclk_frequency    = self.FAST_FREQUENCY,
-        )
-
-        # ... and bring the PHY interface signals to the MAC domain.
-        super().__init__(serdes_phy, width=4, domain="ss")
-
-
-    def elaborate(self, platform):
-        m = super().elaborate(platform)
-
-        # Patch in our soft PHY as a submodule.
-        m.submodules.phy = self.phy
-
-        # Drive the PHY reference clock with our fast generated clock.
-        m.d.comb += self.clk.eq(ClockSignal("fast"))
-
-        # This board does not have a way to detect Vbus, so assume it's always present.
-        m.d.comb += self.phy.power_present.eq(1)
-
-        return m
+# Build our PHY class only once something asks for it (PEP 562).
+__getattr__ = lazy_module_attributes(globals(), {"LogicboneSuperSpeedPHY": ".phy.logicbone"})
 
 
 
-class LogicbonePlatform(_CoreLogicbonePlatform, LUNAPlatform):
+class LogicbonePlatform(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _CoreLogicbonePlatform, LUNAPlatform):
+    name                   = "Logicbone"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi"))
     clock_domain_generator = LogicboneDomainGenerator
-    default_usb3_phy       = LogicboneSuperSpeedPHY
+    default_usb3_phy       = LazySuperSpeedPHY(__name__, "LogicboneSuperSpeedPHY")
     default_usb_connection = "usb"
 
 
-class Logicbone85FPlatform(_CoreLogicbone85FPlatform, LUNAPlatform):
+class Logicbone85FPlatform(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _CoreLogicbone85FPlatform, LUNAPlatform):
+    name                   = "Logicbone (85F)"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi"))
     clock_domain_generator = LogicboneDomainGenerator
-    default_usb3_phy       = LogicboneSuperSpeedPHY
+    default_usb3_phy       = LazySuperSpeedPHY(__name__, "LogicboneSuperSpeedPHY")
     default_usb_connection = "usb"
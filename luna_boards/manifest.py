@@ -0,0 +1,234 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Static JSON manifest of the luna_boards platforms.
+
+The manifest captures each board's metadata -- device, clocking, USB connections and the
+resources it provides -- in a single JSON file shipped alongside the package. Querying it only
+requires the standard library; so it can be used on hosts that don't have Amaranth installed.
+
+The manifest is generated from the board classes themselves, which does require Amaranth,
+amaranth-boards and LUNA; regenerate it whenever a board definition changes:
+
+    > python -m luna_boards.manifest
+
+To check that the shipped manifest is up to date -- against the platform registry, and, where
+Amaranth is installed, against a freshly generated manifest:
+
+    > python -m luna_boards.manifest --check
+"""
+
+import os
+import sys
+import json
+import argparse
+import functools
+import importlib
+
+from .registry import PLATFORMS, get_platform_info
+
+
+__all__ = ["MANIFEST_PATH", "generate_manifest", "write_manifest", "load_manifest",
+    "board_metadata", "find_boards", "stale_entries"]
+
+
+#: The location of the manifest shipped with luna_boards.
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "manifest.json")
+
+MANIFEST_VERSION = 1
+
+
+def _qualified_name(obj):
+    """ Returns a ``module:Name`` string for a class (or lazy stand-in), or None. """
+
+    if obj is None:
+        return None
+
+    # Lazily-loaded PHYs already know where they live.
+    if hasattr(obj, "module") and hasattr(obj, "name") and hasattr(obj, "resolve"):
+        return f"{obj.module}:{obj.name}"
+
+    return f"{obj.__module__}:{obj.__qualname__}"
+
+
+def _describe_platform(cls):
+    """ Captures the manifest entry for a single platform class. """
+
+    # Create an instance of the platform, so resources added at construction time are included.
+    platform = cls()
+
+    resources = {}
+    for name, number in platform.resources:
+        resources.setdefault(name, []).append(number)
+
+    return {
+        "name":                   getattr(cls, "name", cls.__name__),
+        "path":                   f"{cls.__module__}:{cls.__name__}",
+        "device":                 platform.device,
+        "package":                platform.package,
+        "speed":                  str(platform.speed) if getattr(platform, "speed", None) is not None else None,
+        "default_clk":            platform.default_clk,
+        "default_rst":            getattr(platform, "default_rst", None),
+        "clock_domain_generator": _qualified_name(getattr(cls, "clock_domain_generator", None)),
+        "default_usb_connection": getattr(cls, "default_usb_connection", None),
+        "default_usb3_phy":       _qualified_name(getattr(cls, "default_usb3_phy", None)),
+        "resources":              {name: sorted(numbers) for name, numbers in sorted(resources.items())},
+    }
+
+
+def generate_manifest():
+    """ Walks every LUNAPlatform subclass in luna_boards; and returns the resulting manifest. """
+
+    from luna.gateware.platform.core import LUNAPlatform
+
+    boards = {}
+    for module_name in sorted({info.module_name for info in PLATFORMS.values()}):
+        module = importlib.import_module(module_name)
+
+        for cls in vars(module).values():
+            if not isinstance(cls, type) or not issubclass(cls, LUNAPlatform):
+                continue
+            if cls.__module__ != module_name or cls.__name__.startswith("_"):
+                continue
+
+            boards[cls.__name__] = _describe_platform(cls)
+
+    return {"version": MANIFEST_VERSION, "boards": dict(sorted(boards.items()))}
+
+
+def write_manifest(path=MANIFEST_PATH):
+    """ Generates the manifest and writes it to ``path``. """
+
+    manifest = generate_manifest()
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+    return manifest
+
+
+@functools.lru_cache(maxsize=None)
+def load_manifest(path=MANIFEST_PATH):
+    """ Returns the parsed manifest; reading it from disk only once. """
+
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"no platform manifest found at {path}; "
+            "generate one with `python -m luna_boards.manifest`") from None
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"platform manifest at {path} has unsupported version {manifest.get('version')!r}")
+
+    return manifest
+
+
+def board_metadata(spec, path=MANIFEST_PATH):
+    """ Returns the manifest entry for a single board.
+
+    Accepts any of the platform identifiers understood by :func:`luna_boards.get_platform_info`.
+    """
+    return load_manifest(path)["boards"][get_platform_info(spec).class_name]
+
+
+def find_boards(*, device=None, family=None, resource=None, usb3=None, path=MANIFEST_PATH):
+    """ Returns the class names of every board matching all of the given criteria.
+
+    Parameters
+    ----------
+    device: str
+        Only match boards using this FPGA device.
+    family: str
+        Only match boards in this FPGA family; as named in the platform registry.
+    resource: str
+        Only match boards that provide a resource with this name.
+    usb3: bool
+        If provided, only match boards that do (or don't) have a default SuperSpeed PHY.
+    """
+
+    matches = []
+    for class_name, board in load_manifest(path)["boards"].items():
+        if device is not None and board["device"] != device:
+            continue
+        if family is not None and (class_name not in PLATFORMS or PLATFORMS[class_name].family != family):
+            continue
+        if resource is not None and resource not in board["resources"]:
+            continue
+        if usb3 is not None and (board["default_usb3_phy"] is not None) != usb3:
+            continue
+
+        matches.append(class_name)
+
+    return matches
+
+
+def stale_entries(manifest=None, regenerated=None):
+    """ Returns a list of the ways in which a manifest is out of date; which is empty if it's current.
+
+    Parameters
+    ----------
+    manifest: dict
+        The manifest to check; or None to check the one shipped with luna_boards.
+    regenerated: dict
+        A freshly generated manifest to compare against; or None to only compare against the
+        platform registry, which doesn't require Amaranth.
+    """
+
+    manifest = manifest if manifest is not None else load_manifest()
+    boards   = manifest["boards"]
+    problems = []
+
+    for class_name in sorted(set(PLATFORMS) - set(boards)):
+        problems.append(f"{class_name} is missing from the manifest")
+    for class_name in sorted(set(boards) - set(PLATFORMS)):
+        problems.append(f"{class_name} is in the manifest, but not in the platform registry")
+
+    for class_name in sorted(set(PLATFORMS) & set(boards)):
+        info, board = PLATFORMS[class_name], boards[class_name]
+        for field in ("name", "path", "device", "package", "default_usb_connection"):
+            if getattr(info, field) != board[field]:
+                problems.append(f"{class_name}.{field} is {board[field]!r} in the manifest, "
+                    f"but {getattr(info, field)!r} in the platform registry")
+
+    if regenerated is not None:
+        for class_name in sorted(set(boards) & set(regenerated["boards"])):
+            for field, value in regenerated["boards"][class_name].items():
+                if boards[class_name].get(field) != value:
+                    problems.append(f"{class_name}.{field} has changed since the manifest was generated")
+
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the luna_boards platform manifest.")
+    parser.add_argument("--output", "-o", default=MANIFEST_PATH,
+        help="where to write the manifest (default: the copy shipped in the package)")
+    parser.add_argument("--check", action="store_true",
+        help="don't write anything; instead, fail if the shipped manifest is out of date")
+    args = parser.parse_args()
+
+    if args.check:
+        try:
+            regenerated = generate_manifest()
+        except ImportError as e:
+            print(f"can't regenerate the manifest ({e}); only checking it against the registry", file=sys.stderr)
+            regenerated = None
+
+        problems = stale_entries(load_manifest(args.output), regenerated)
+        for problem in problems:
+            print(f"STALE: {problem}", file=sys.stderr)
+        if problems:
+            print("regenerate the manifest with `python -m luna_boards.manifest`", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    manifest = write_manifest(args.output)
+    print(f"wrote {len(manifest['boards'])} boards to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,29 +14,45 @@ FS device. To use the platform for full-speed USB, you'll need to move the resis
 populated as R23 over to R24.
 """
 
-import os
-import subprocess
-
 from amaranth import *
 from amaranth.build import *
 from amaranth.vendor.xilinx_7series import Xilinx7SeriesPlatform
 
 from amaranth_boards.resources import *
 
-from luna.gateware.interface.pipe       import AsyncPIPEInterface
-from luna.gateware.interface.serdes_phy import XC7GTPSerDesPIPE
-
 from luna.gateware.platform.core import LUNAPlatform
 
+from ._lazy import LazySuperSpeedPHY, lazy_module_attributes
+from .pll  import domain_frequencies, shared_clocks, solve_xilinx_pll, xilinx_pll_parameters
+from .buildcache import cached_build_plan
+from .buildstats import BuildStatsMixin
+from .jtag       import MPSSEProgrammerMixin
+from .vivado     import VivadoBitstreamMixin, VivadoBitstreamProfile, VivadoIncrementalMixin, merge_overrides, out_of_context_overrides
+
 
 class NeTV2ClockDomainGenerator(Elaboratable):
     """ Clock/Reset Controller for the NeTV2. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our transceivers need a 125 MHz ss domain, and our full-speed PHY a 48 MHz / 12 MHz pair;
+    # by default, our sync domain shares the ss clock.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   250,
+        "sync":   125,
+        "ss":     125,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("ss", "usb_io", "usb"))
 
         # Create our domains; but don't do anything else for them, for now.
         m.domains.usb     = ClockDomain()
@@ -53,68 +69,45 @@ class NeTV2ClockDomainGenerator(Elaboratable):
         clk48         = Signal()
         usb2_locked   = Signal()
         usb2_feedback = Signal()
-        m.submodules.usb2_pll = Instance("PLLE2_ADV",
-            p_BANDWIDTH            = "OPTIMIZED",
-            p_COMPENSATION         = "ZHOLD",
-            p_STARTUP_WAIT         = "FALSE",
-            p_DIVCLK_DIVIDE        = 1,
-            p_CLKFBOUT_MULT        = 24,
-            p_CLKFBOUT_PHASE       = 0.000,
-            p_CLKOUT0_DIVIDE       = 100,
-            p_CLKOUT0_PHASE        = 0.000,
-            p_CLKOUT0_DUTY_CYCLE   = 0.500,
-            p_CLKOUT1_DIVIDE       = 25,
-            p_CLKOUT1_PHASE        = 0.000,
-            p_CLKOUT1_DUTY_CYCLE   = 0.500,
-            p_CLKIN1_PERIOD        = 20.000,
-            i_CLKFBIN              = usb2_feedback,
-            o_CLKFBOUT             = usb2_feedback,
-            i_CLKIN1               = clk50,
-            o_CLKOUT0              = clk12,
-            o_CLKOUT1              = clk48,
-            o_LOCKED               = usb2_locked,
-        )
-
-
-        # USB3 PLL connections.
-        clk16         = Signal()
-        clk125        = Signal()
-        clk250        = Signal()
+        usb2_pll_config = solve_xilinx_pll(platform.default_clk_frequency, (
+            ("usb",    frequencies["usb"]),
+            ("usb_io", frequencies["usb_io"]),
+        ), speed_grade=platform.speed)
+        m.submodules.usb2_pll = Instance(f"{usb2_pll_config.primitive}_ADV", **xilinx_pll_parameters(usb2_pll_config,
+            clkin    = clk50,
+            clocks   = {
+                "usb":    clk12,
+                "usb_io": clk48,
+            },
+            feedback = usb2_feedback,
+            locked   = usb2_locked,
+        ))
+
+
+        # USB3 PLL connections; our sync domain only gets its own output if it doesn't share a frequency.
+        requests, aliases = shared_clocks(frequencies, ("fast", "ss", "sync"))
+        clocks = {domain: Signal(name=f"clk_{domain}") for domain, _ in requests}
+        clocks["clk16"] = Signal()
+
         usb3_locked   = Signal()
         usb3_feedback = Signal()
-        m.submodules.usb3_pll = Instance("PLLE2_ADV",
-            p_BANDWIDTH            = "OPTIMIZED",
-            p_COMPENSATION         = "ZHOLD",
-            p_STARTUP_WAIT         = "FALSE",
-            p_DIVCLK_DIVIDE        = 1,
-            p_CLKFBOUT_MULT        = 20,    # VCO = 1000 MHz
-            p_CLKFBOUT_PHASE       = 0.000,
-            p_CLKOUT0_DIVIDE       = 4,     # CLKOUT0 = 250 MHz (1000/4)
-            p_CLKOUT0_PHASE        = 0.000,
-            p_CLKOUT0_DUTY_CYCLE   = 0.500,
-            p_CLKOUT1_DIVIDE       = 8,     # CLKOUT1 = 125 MHz (1000/8)
-            p_CLKOUT1_PHASE        = 0.000,
-            p_CLKOUT1_DUTY_CYCLE   = 0.500,
-            p_CLKOUT2_DIVIDE       = 64,    # CLKOUT2 = 16 MHz  (1000/64)
-            p_CLKOUT2_PHASE        = 0.000,
-            p_CLKOUT2_DUTY_CYCLE   = 0.500,
-            p_CLKIN1_PERIOD        = 20.000,
-            i_CLKFBIN              = usb3_feedback,
-            o_CLKFBOUT             = usb3_feedback,
-            i_CLKIN1               = clk50,
-            o_CLKOUT0              = clk250,
-            o_CLKOUT1              = clk125,
-            o_CLKOUT2              = clk16,
-            o_LOCKED               = usb3_locked,
-        )
+        usb3_pll_config = solve_xilinx_pll(platform.default_clk_frequency, (
+            *requests,
+            ("clk16", 15.625e6),
+        ), speed_grade=platform.speed)
+        m.submodules.usb3_pll = Instance(f"{usb3_pll_config.primitive}_ADV", **xilinx_pll_parameters(usb3_pll_config,
+            clkin    = clk50,
+            clocks   = clocks,
+            feedback = usb3_feedback,
+            locked   = usb3_locked,
+        ))
 
         # Connect up our clock domains.
+        m.d.comb += [ClockSignal(domain).eq(clocks[domain]) for domain, _ in requests]
+        m.d.comb += [ClockSignal(domain).eq(clocks[source]) for domain, source in aliases.items()]
         m.d.comb += [
             ClockSignal("usb")      .eq(clk12),
             ClockSignal("usb_io")   .eq(clk48),
-            ClockSignal("sync")     .eq(clk125),
-            ClockSignal("ss")       .eq(clk125),
-            ClockSignal("fast")     .eq(clk250),
 
             ResetSignal("usb")      .eq(~usb2_locked),
             ResetSignal("usb_io")   .eq(~usb2_locked),
@@ -126,47 +119,12 @@ class NeTV2ClockDomainGenerator(Elaboratable):
         return m
 
 
-class NeTV2SuperSpeedPHY(AsyncPIPEInterface):
-    """ Superspeed PHY configuration for the NeTV2. """
-
-    SS_FREQUENCY   = 125e6
-    FAST_FREQUENCY = 250e6
-
-
-    def __init__(self, platform):
-
-        # Grab the I/O that implements our SerDes interface...
-        serdes_io = platform.request("serdes", dir={'tx':"-", 'rx':"-"})
-
-        # Use it to create our soft PHY...
-        serdes_phy = XC7GTPSerDesPIPE(
-            tx_pads             = serdes_io.tx,
-            rx_pads             = serdes_io.rx,
-            refclk_frequency    = self.FAST_FREQUENCY,
-            ss_clock_frequency  = self.SS_FREQUENCY,
-        )
+# Build our PHY class only once something asks for it (PEP 562).
+__getattr__ = lazy_module_attributes(globals(), {"NeTV2SuperSpeedPHY": ".phy.netv2"})
 
-        # ... and bring the PHY interface signals to the MAC domain.
-        super().__init__(serdes_phy, width=4, domain="ss")
 
 
-    def elaborate(self, platform):
-        m = super().elaborate(platform)
-
-        # Patch in our soft PHY as a submodule.
-        m.submodules.phy = self.phy
-
-        # Drive the PHY reference clock with our fast generated clock.
-        m.d.comb += self.clk.eq(ClockSignal("fast"))
-
-        # This board does not have a way to detect Vbus, so assume it's always present.
-        m.d.comb += self.phy.power_present.eq(1)
-
-        return m
-
-
-
-class NeTV2Platform(Xilinx7SeriesPlatform, LUNAPlatform):
+class NeTV2Platform(BuildStatsMixin, MPSSEProgrammerMixin, VivadoIncrementalMixin, VivadoBitstreamMixin, Xilinx7SeriesPlatform, LUNAPlatform):
     """ Board description for the NeTV2. """
 
     name        = "NeTV2"
@@ -177,12 +135,15 @@ class NeTV2Platform(Xilinx7SeriesPlatform, LUNAPlatform):
 
     default_clk = "clk50"
 
+    # Boot quickly from our 16 MiB quad-SPI flash.
+    bitstream_profile = VivadoBitstreamProfile(bus_width=4, config_rate=33, flash_size=16)
+
     # Provide the type that'll be used to create our clock domains.
     clock_domain_generator = NeTV2ClockDomainGenerator
 
     # Use our direct USB connection for USB2, and our SerDes for USB3.
     default_usb_connection = "usb"
-    default_usb3_phy       = NeTV2SuperSpeedPHY
+    default_usb3_phy       = LazySuperSpeedPHY(__name__, "NeTV2SuperSpeedPHY")
 
     #
     # I/O resources.
@@ -232,20 +193,18 @@ class NeTV2Platform(Xilinx7SeriesPlatform, LUNAPlatform):
         ]
 
         overrides = {
-            "script_before_bitstream":
-                "set_property BITSTREAM.GENERAL.COMPRESS TRUE [current_design]",
             "add_constraints": "\n".join(extra_constraints)
         }
-        return super().toolchain_prepare(fragment, name, **overrides, **kwargs)
+        overrides = out_of_context_overrides(self, merge_overrides(overrides, kwargs))
+
+        plan = super().toolchain_prepare(fragment, name, **overrides)
+        return cached_build_plan(self, plan, name, overrides)
 
 
     #
-    # FIXME: figure out a better tool to use for running with the NeTV attached
+    # FIXME: add a JTAG transport for running with the NeTV2 attached
     # to a raspberry pi
     #
-    def toolchain_program(self, products, name):
-        xc3sprog = os.environ.get("XC3SPROG", "xc3sprog")
-        with products.extract("{}.bit".format(name)) as bitstream_file:
-            subprocess.check_call([xc3sprog, "-c", "ft4232h", bitstream_file])
-
-
+    # We're programmed natively, through the FT4232H JTAG adapter; where we also find our boards
+    # when programming many at once.
+    fleet_usb_ids = ((0x0403, 0x6011),)
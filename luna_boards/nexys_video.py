@@ -14,28 +14,44 @@ TUSB1310A PHYs, which offer ULPI USB2 and PIPE USB3. They also have pmods, which
 connected up via our gateware PHY.
 """
 
-import os
-import logging
-import subprocess
-
 from amaranth import *
 from amaranth.build import *
 from amaranth.vendor.xilinx_7series import Xilinx7SeriesPlatform
 
 from amaranth_boards.resources import *
-from luna.gateware.interface.pipe import GearedPIPEInterface
 
 from luna.gateware.platform.core import LUNAPlatform
 
+from ._lazy import LazySuperSpeedPHY, lazy_module_attributes
+from .pll  import domain_frequencies, solve_xilinx_pll, xilinx_pll_parameters
+from .buildcache import cached_build_plan
+from .buildstats import BuildStatsMixin
+from .openocd    import run_openocd
+from .vivado     import VivadoBitstreamMixin, VivadoBitstreamProfile, VivadoIncrementalMixin, merge_overrides
+
 
 class NexysVideoClockDomainGenerator(Elaboratable):
     """ Clock/Reset Controller for the Nexys Video. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our fast domain is the PHY's 250 MHz PCLK, and our full-speed domains need 48 MHz and 12 MHz.
+    # Our sync domain runs directly from the 100 MHz oscillator, unless another frequency is requested.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   250,
+        "sync":   100,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("fast", "usb_io", "usb"))
 
         # Synthetic clock domains.
         m.domains.sync     = ClockDomain(reset_less=True)
@@ -56,74 +72,64 @@ class NexysVideoClockDomainGenerator(Elaboratable):
         # Grab our main clock.
         clk100 = platform.request(platform.default_clk)
 
+        # Our sync clock only needs to pass through a PLL if it's not running at our input frequency.
+        sync_from_pll = (frequencies["sync"] != platform.default_clk_frequency)
+
         # USB2 PLL connections.
         usb2_locked   = Signal()
         usb2_feedback = Signal()
-        m.submodules.usb2_pll = Instance("PLLE2_ADV",
-            p_BANDWIDTH            = "OPTIMIZED",
-            p_COMPENSATION         = "ZHOLD",
-            p_STARTUP_WAIT         = "FALSE",
-            p_DIVCLK_DIVIDE        = 1,
-            p_CLKFBOUT_MULT        = 12,
-            p_CLKFBOUT_PHASE       = 0.000,
-            p_CLKOUT0_DIVIDE       = 100,
-            p_CLKOUT0_PHASE        = 0.000,
-            p_CLKOUT0_DUTY_CYCLE   = 0.500,
-            p_CLKOUT1_DIVIDE       = 25,
-            p_CLKOUT1_PHASE        = 0.000,
-            p_CLKOUT1_DUTY_CYCLE   = 0.500,
-            p_CLKIN1_PERIOD        = 20.000,
-            i_CLKFBIN              = usb2_feedback,
-            o_CLKFBOUT             = usb2_feedback,
-            i_CLKIN1               = clk100,
-            o_CLKOUT0              = ClockSignal("usb"),
-            o_CLKOUT1              = ClockSignal("usb_io"),
-            o_LOCKED               = usb2_locked,
-        )
+        usb2_pll_config = solve_xilinx_pll(platform.default_clk_frequency, (
+            ("usb",    frequencies["usb"]),
+            ("usb_io", frequencies["usb_io"]),
+            *((("sync", frequencies["sync"]),) if sync_from_pll else ()),
+        ), speed_grade=platform.speed)
+        m.submodules.usb2_pll = Instance(f"{usb2_pll_config.primitive}_ADV", **xilinx_pll_parameters(usb2_pll_config,
+            clkin    = clk100,
+            clocks   = {
+                "usb":    ClockSignal("usb"),
+                "usb_io": ClockSignal("usb_io"),
+                "sync":   ClockSignal("sync"),
+            },
+            feedback = usb2_feedback,
+            locked   = usb2_locked,
+        ))
 
         clk_idelay         = Signal()
 
         usb3_locked        = Signal()
         usb3_feedback      = Signal()
 
-        m.submodules.usb3_pll = Instance("PLLE2_BASE",
-            p_STARTUP_WAIT         = "FALSE",
-
-            # 250 MHz input from PCLK, VCO at 1GHz
-            i_CLKIN1               = ClockSignal("ss_io"),
-            p_REF_JITTER1          = 0.01,
-            p_CLKIN1_PERIOD        = 4.0,
-            p_DIVCLK_DIVIDE        = 1,
-            p_CLKFBOUT_MULT        = 4,
-            p_CLKFBOUT_PHASE       = 0.000,
-
-            o_LOCKED               = usb3_locked,
-
-            # Clock feedback.
-            i_CLKFBIN              = usb3_feedback,
-            o_CLKFBOUT             = usb3_feedback,
+        usb3_pll_config = solve_xilinx_pll(250e6, (
+            # 125 MHz (1/2 PCLK)
+            ("ss",            125e6, 0),
 
-            # CLKOUT0 = 125 MHz (1/2 PCLK)
-            p_CLKOUT0_DIVIDE       = 8,
-            p_CLKOUT0_PHASE        = 0.0,
-            o_CLKOUT0              = ClockSignal("ss"),
-
-            # CLKOUT1 = 125 MHz / 8ns (1/2 PCLK + phase delay)
+            # 125 MHz / 8ns (1/2 PCLK + phase delay)
             # We want to sample our input after 2ns. This is >=90 degrees of this clock.
-            p_CLKOUT1_DIVIDE       = 8,
-            p_CLKOUT1_PHASE        = 180.0,
-            o_CLKOUT1              = ClockSignal("ss_shifted"),
-
-            # CLKOUT2 = 250 MHz (PCLK + phase delay)
-            p_CLKOUT2_DIVIDE       = 4,
-            p_CLKOUT2_PHASE        = 00.0,
-            o_CLKOUT2              = ClockSignal("ss_io_shifted"),
-
-            # CLKOUT3 = 200 MHz (for our the chip's I/O delay equalization)
-            p_CLKOUT3_DIVIDE       = 5,
-            p_CLKOUT3_PHASE        = 0.0,
-            o_CLKOUT3              = clk_idelay
-        )
+            ("ss_shifted",    125e6, 180),
+
+            # 250 MHz (PCLK + phase delay)
+            ("ss_io_shifted", 250e6, 0),
+
+            # 200 MHz (for our the chip's I/O delay equalization)
+            ("idelay",        200e6, 0),
+        ), speed_grade=platform.speed)
+
+        # 250 MHz input from PCLK.
+        m.submodules.usb3_pll = Instance(f"{usb3_pll_config.primitive}_BASE", **xilinx_pll_parameters(usb3_pll_config,
+            clkin    = ClockSignal("ss_io"),
+            clocks   = {
+                "ss":            ClockSignal("ss"),
+                "ss_shifted":    ClockSignal("ss_shifted"),
+                "ss_io_shifted": ClockSignal("ss_io_shifted"),
+                "idelay":        clk_idelay,
+            },
+            feedback = usb3_feedback,
+            locked   = usb3_locked,
+            variant  = "BASE",
+        ))
+
+        if not sync_from_pll:
+            m.d.comb += ClockSignal("sync").eq(clk100)
 
         # Create our I/O delay compensation unit.
         m.submodules.idelayctrl = Instance("IDELAYCTRL",
@@ -134,7 +140,6 @@ class NexysVideoClockDomainGenerator(Elaboratable):
         # Connect up our clock domains.
         m.d.comb += [
             # Synthetic clock domains.
-            ClockSignal("sync")           .eq(clk100),
             ClockSignal("fast")           .eq(ClockSignal("ss_io")),
             ResetSignal("fast")           .eq(~usb3_locked),
 
@@ -153,36 +158,12 @@ class NexysVideoClockDomainGenerator(Elaboratable):
         return m
 
 
-class NexysVideoAB07SuperspeedPHY(GearedPIPEInterface):
-    """ Interface for the TUSB1310A, mounted on the AB07 FMC board. """
-
-    VADJ_VOLTAGE = '2.5V'
+# Build our PHY class only once something asks for it (PEP 562).
+__getattr__ = lazy_module_attributes(globals(), {"NexysVideoAB07SuperspeedPHY": ".phy.nexys_video"})
 
-    def __init__(self, platform):
-        logging.info("Using DesignGateway AB07 PHY board, connected via FMC.")
 
-        # Grab the geared I/O for our PIPE PHY...
-        phy_connection = platform.request('ab07_usbfmc_pipe', xdr=GearedPIPEInterface.GEARING_XDR)
 
-        # ... and create a PIPE interface around it.
-        super().__init__(pipe=phy_connection, invert_rx_polarity_signal=True)
-
-
-    def elaborate(self, platform):
-
-        # Grab our platform, and make an important tweak before returning it:
-        m = super().elaborate(platform)
-
-        # Ensure that we're driving VADJ with the proper I/O voltage.
-        m.d.comb += [
-            platform.request("vadj_select").eq(platform.VADJ_VALUES[self.VADJ_VOLTAGE])
-        ]
-
-        return m
-
-
-
-class NexysVideoPlatform(Xilinx7SeriesPlatform, LUNAPlatform):
+class NexysVideoPlatform(BuildStatsMixin, VivadoIncrementalMixin, VivadoBitstreamMixin, Xilinx7SeriesPlatform, LUNAPlatform):
     """ Board description for the Nexys Video. """
 
     name        = "Nexys Video"
@@ -194,6 +175,9 @@ class NexysVideoPlatform(Xilinx7SeriesPlatform, LUNAPlatform):
     default_clk = "clk100"
     default_rst = "cpu_reset"
 
+    # Boot quickly from our 32 MiB quad-SPI flash (S25FL256S).
+    bitstream_profile = VivadoBitstreamProfile(bus_width=4, config_rate=33, flash_size=32)
+
 
     # Provide the type that'll be used to create our clock domains.
     clock_domain_generator = NexysVideoClockDomainGenerator
@@ -204,7 +188,7 @@ class NexysVideoPlatform(Xilinx7SeriesPlatform, LUNAPlatform):
 
     if usb_connections == 'ab07_fmcusb':
         default_usb_connection = "usb"
-        default_usb3_phy       = NexysVideoAB07SuperspeedPHY
+        default_usb3_phy       = LazySuperSpeedPHY(__name__, "NexysVideoAB07SuperspeedPHY")
 
 
     VADJ_VALUES = {
@@ -575,21 +559,22 @@ class NexysVideoPlatform(Xilinx7SeriesPlatform, LUNAPlatform):
     def toolchain_prepare(self, fragment, name, **kwargs):
         overrides = {
             'add_constraints': "set_property INTERNAL_VREF 0.750 [get_iobanks 35]",
-            'script_before_bitstream': "set_property BITSTREAM.GENERAL.COMPRESS TRUE [current_design]",
         }
         if hasattr(kwargs, 'overrides'):
             overrides.update(kwargs['overrides'])
 
-        return super().toolchain_prepare(fragment, name, **overrides, **kwargs)
+        overrides = merge_overrides(overrides, kwargs)
+
+        plan = super().toolchain_prepare(fragment, name, **overrides)
+        return cached_build_plan(self, plan, name, overrides)
+
 
+    # Find our boards by their FT2232H JTAG adapters, when programming many at once.
+    fleet_usb_ids = ((0x0403, 0x6010),)
 
-    def toolchain_program(self, products, name):
-        openocd = os.environ.get("OPENOCD", "openocd")
+    def toolchain_program(self, products, name, serial=None):
         with products.extract("{}-openocd.cfg".format(name), "{}.bit".format(name)) \
                 as (config_filename, bitstream_filename):
-            subprocess.check_call([openocd,
-                "-f", config_filename,
-                "-c", "transport select jtag; init; fpga_program; pld load 0 {}; exit".format(bitstream_filename)
-            ])
+            run_openocd(config_filename, ["fpga_program", "pld load 0 {}".format(bitstream_filename)], serial=serial)
 
 
@@ -0,0 +1,271 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Persistent OpenOCD servers for the luna_boards platforms programmed with OpenOCD.
+
+Each load normally starts a fresh OpenOCD; which parses its configuration, initializes its adapter and
+scans the JTAG chain before doing any work. When ``LUNA_OPENOCD_SERVER`` is set, loads instead send their
+commands over the TCL socket of a long-lived OpenOCD:
+
+    > LUNA_OPENOCD_SERVER=1 python my_design.py
+    > LUNA_OPENOCD_SERVER=localhost:6666 python my_design.py
+
+Given ``1``, the first load starts OpenOCD as a background daemon, and later loads with the same
+configuration (and adapter serial number) reuse it. Given ``host:port``, loads use an OpenOCD server
+that's already running there; which must have been started with the board's configuration.
+
+While a daemon runs, it keeps its adapter open; stop daemons before using the adapter with anything else:
+
+    > python -m luna_boards.openocd stop
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+
+__all__ = ["OpenOCDError", "OpenOCDClient", "run_openocd", "stop_openocd_servers"]
+
+
+# The byte that terminates each command and response on OpenOCD's TCL socket.
+COMMAND_TOKEN = b"\x1a"
+
+
+class OpenOCDError(IOError):
+    """ Raised when OpenOCD can't be reached, or a command it's given fails. """
+
+
+class OpenOCDClient:
+    """ A connection to the TCL socket of a running OpenOCD.
+
+    Parameters
+    ----------
+    host: str
+        The host OpenOCD is listening on.
+    port: int
+        OpenOCD's TCL port.
+    timeout: float
+        How long to wait for each command to complete, in seconds.
+    """
+
+    def __init__(self, host="localhost", port=6666, *, timeout=60):
+        try:
+            self._socket = socket.create_connection((host, port), timeout=timeout)
+        except OSError as e:
+            raise OpenOCDError(f"couldn't connect to OpenOCD at {host}:{port}: {e}") from e
+
+        self._buffer = b""
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        self._socket.close()
+
+
+    def command(self, command):
+        """ Sends a single command to OpenOCD, and returns its result. """
+
+        self._socket.sendall(command.encode("utf-8") + COMMAND_TOKEN)
+
+        while COMMAND_TOKEN not in self._buffer:
+            data = self._socket.recv(4096)
+            if not data:
+                raise OpenOCDError("OpenOCD closed its connection")
+            self._buffer += data
+
+        response, _, self._buffer = self._buffer.partition(COMMAND_TOKEN)
+        return response.decode("utf-8", errors="replace")
+
+
+    def run(self, command):
+        """ Runs a command on OpenOCD; raising OpenOCDError if it fails. Returns its result. """
+
+        # The TCL socket returns a failed command's error message as though it were a result;
+        # so have OpenOCD catch any error, and tell us whether there was one.
+        failed = self.command(f"catch {{{command}}} luna_result")
+        result = self.command("set luna_result")
+        if failed.strip() != "0":
+            raise OpenOCDError(f"OpenOCD command '{command}' failed: {result}")
+
+        return result
+
+
+def _state_dir():
+    """ Returns the directory in which we keep track of our OpenOCD daemons. """
+    return os.path.join(tempfile.gettempdir(), f"luna-openocd-{os.getuid() if hasattr(os, 'getuid') else 0}")
+
+
+def _daemon_alive(daemon):
+    """ Returns True iff one of our recorded daemons is still running; and is still the OpenOCD we started.
+
+    Process IDs are reused; so as well as checking for the process, we ask its TCL port who's there.
+    """
+
+    try:
+        os.kill(daemon["pid"], 0)
+    except OSError:
+        return False
+
+    try:
+        with OpenOCDClient("localhost", daemon["port"], timeout=5) as client:
+            return client.command("version").startswith("Open On-Chip Debugger")
+    except OSError:
+        return False
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def _daemon(openocd, config, setup):
+    """ Returns the port of an OpenOCD daemon running the given configuration; starting one if needed. """
+
+    key   = hashlib.sha256("\0".join([openocd, config, setup]).encode("utf-8")).hexdigest()[:16]
+    state = os.path.join(_state_dir(), f"{key}.json")
+    os.makedirs(_state_dir(), exist_ok=True)
+
+    # If we've already started a daemon for this configuration, and it's still there, use it.
+    try:
+        with open(state) as f:
+            daemon = json.load(f)
+        if _daemon_alive(daemon):
+            return daemon["port"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Otherwise, start one; keeping its configuration beside our record of it, since it's read only once.
+    config_path = os.path.join(_state_dir(), f"{key}.cfg")
+    with open(config_path, "w") as f:
+        f.write(config)
+
+    port = _free_port()
+    log  = open(os.path.join(_state_dir(), f"{key}.log"), "w")
+    process = subprocess.Popen([openocd,
+        "-c", f"tcl_port {port}; telnet_port disabled; gdb_port disabled",
+        "-f", config_path,
+        "-c", f"{setup}transport select jtag; init",
+    ], stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    log.close()
+
+    # Wait for it to start listening; or to give up.
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise OpenOCDError(f"OpenOCD exited while starting up; see {log.name}")
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        process.kill()
+        raise OpenOCDError(f"OpenOCD didn't start listening; see {log.name}")
+
+    with open(state, "w") as f:
+        json.dump({"pid": process.pid, "port": port, "log": log.name}, f)
+
+    return port
+
+
+def run_openocd(config_filename, commands, *, serial=None):
+    """ Runs commands on OpenOCD, with the given configuration; via a server, if ``LUNA_OPENOCD_SERVER`` is set.
+
+    Parameters
+    ----------
+    config_filename: str
+        The OpenOCD configuration file to use.
+    commands: list of str
+        The commands to run, once the JTAG chain has been initialized.
+    serial: str
+        The serial number of the FTDI adapter to use; or None to use the first one found.
+    """
+
+    openocd = os.environ.get("OPENOCD", "openocd")
+    setup   = f"ftdi_serial {serial}; " if serial is not None else ""
+    server  = os.environ.get("LUNA_OPENOCD_SERVER")
+
+    # Without a server, run the commands in a fresh OpenOCD, as usual.
+    if not server:
+        subprocess.check_call([openocd,
+            "-f", config_filename,
+            "-c", f"{setup}transport select jtag; init; {'; '.join(commands)}; exit"
+        ])
+        return
+
+    if server in ("1", "yes", "on"):
+        with open(config_filename) as f:
+            host, port = "localhost", _daemon(openocd, f.read(), setup)
+    else:
+        host, _, port = server.rpartition(":")
+        host, port    = host or "localhost", int(port)
+
+    with OpenOCDClient(host, port) as client:
+        for command in commands:
+            client.run(command)
+
+
+def stop_openocd_servers():
+    """ Stops every OpenOCD daemon started by :func:`run_openocd`. Returns the number stopped. """
+
+    stopped = 0
+    if not os.path.isdir(_state_dir()):
+        return stopped
+
+    for filename in os.listdir(_state_dir()):
+        if not filename.endswith(".json"):
+            continue
+
+        path = os.path.join(_state_dir(), filename)
+        try:
+            with open(path) as f:
+                daemon = json.load(f)
+            if _daemon_alive(daemon):
+                os.kill(daemon["pid"], signal.SIGTERM)
+                stopped += 1
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            os.remove(path)
+
+    return stopped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the OpenOCD daemons started for luna_boards platforms.")
+    parser.add_argument("action", choices=("list", "stop"), help="list the running daemons, or stop them all")
+    args = parser.parse_args()
+
+    if args.action == "stop":
+        stopped = stop_openocd_servers()
+        print(f"Stopped {stopped} OpenOCD daemon{'s' if stopped != 1 else ''}.", file=sys.stderr)
+        return
+
+    for filename in sorted(os.listdir(_state_dir()) if os.path.isdir(_state_dir()) else []):
+        if filename.endswith(".json"):
+            with open(os.path.join(_state_dir(), filename)) as f:
+                daemon = json.load(f)
+            if _daemon_alive(daemon):
+                print(f"pid {daemon['pid']}: TCL port {daemon['port']}; log in {daemon['log']}")
+
+
+if __name__ == "__main__":
+    main()
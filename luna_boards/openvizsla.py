@@ -18,6 +18,9 @@ from amaranth.vendor.xilinx_spartan_3_6 import XilinxSpartan6Platform
 from amaranth_boards.resources import *
 from luna.gateware.platform.core import LUNAPlatform
 
+from .pll import domain_frequencies
+from .buildstats import BuildStatsMixin
+
 __all__ = ["OpenVizslaPlatform"]
 
 class OpenVizslaClockDomainGenerator(Elaboratable):
@@ -26,12 +29,27 @@ class OpenVizslaClockDomainGenerator(Elaboratable):
 
     """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Every domain runs from the PHY's 60 MHz clock; we don't yet configure the Spartan-6's PLLs,
+    # so none of these can be changed.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast": 60,
+        "sync": 60,
+        "usb":  60,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
 
+        # Our clocks are fixed; but we'll still refuse any clock_frequencies we can't honor.
+        domain_frequencies(self, platform, fixed=self.DEFAULT_CLOCK_FREQUENCIES_MHZ)
+
         # Create our domains; but don't do anything else for them, for now.
         m.domains.sync = ClockDomain()
         m.domains.usb  = ClockDomain()
@@ -45,7 +63,7 @@ class OpenVizslaClockDomainGenerator(Elaboratable):
         return m
 
 
-class OpenVizslaPlatform(XilinxSpartan6Platform, LUNAPlatform):
+class OpenVizslaPlatform(BuildStatsMixin, XilinxSpartan6Platform, LUNAPlatform):
     """ Board description for OpenVizsla USB analyzer. """
 
     name                   = "OpenVizsla"
@@ -24,6 +24,12 @@ from amaranth_boards.orangecrab_r0_2 import OrangeCrabR0_2Platform as _OrangeCra
 
 from luna.gateware.platform.core import LUNAPlatform
 
+from .pll import domain_frequencies, shared_clocks, solve_ehxplll, ehxplll_parameters
+from .buildstats import BuildStatsMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+from .ecppack    import ECP5BitstreamMixin, ECP5BitstreamProfile
+
+
 __all__ = ["OrangeCrabPlatformR0D1", "OrangeCrabPlatformR0D2"]
 
 
@@ -33,11 +39,25 @@ class OrangeCrabDomainGenerator(Elaboratable):
     This generator creates domains; but currently does not configure them.
     """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # Our full-speed USB PHY needs its 48 MHz usb_io and 12 MHz usb clocks; any other domain
+    # that runs at our sync frequency shares the sync clock.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   48,
+        "sync":   48,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("usb_io", "usb"))
         locked = Signal()
 
         # Grab our default input clock.
@@ -49,84 +69,20 @@ class OrangeCrabDomainGenerator(Elaboratable):
         m.domains.usb_io = ClockDomain()
         m.domains.fast   = ClockDomain()
 
-        m.submodules.pll = Instance("EHXPLLL",
-
-                # Clock in.
-                i_CLKI=input_clock,
-
-                # Generated clock outputs.
-                o_CLKOP=ClockSignal("sync"),
-                o_CLKOS=ClockSignal("usb"),
-
-                # Status.
-                o_LOCK=locked,
-
-                # PLL parameters...
-                p_PLLRST_ENA="DISABLED",
-                p_INTFB_WAKE="DISABLED",
-                p_STDBY_ENABLE="DISABLED",
-                p_DPHASE_SOURCE="DISABLED",
-                p_CLKOS3_FPHASE=0,
-                p_CLKOS3_CPHASE=0,
-                p_CLKOS2_FPHASE=0,
-                p_CLKOS2_CPHASE=7,
-                p_CLKOS_FPHASE=0,
-                p_CLKOS_CPHASE=5,
-                p_CLKOP_FPHASE=0,
-                p_CLKOP_CPHASE=5,
-                p_PLL_LOCK_MODE=0,
-                p_CLKOS_TRIM_DELAY="0",
-                p_CLKOS_TRIM_POL="FALLING",
-                p_CLKOP_TRIM_DELAY="0",
-                p_CLKOP_TRIM_POL="FALLING",
-                p_OUTDIVIDER_MUXD="DIVD",
-                p_CLKOS3_ENABLE="DISABLED",
-                p_OUTDIVIDER_MUXC="DIVC",
-                p_CLKOS2_ENABLE="DISABLED",
-                p_OUTDIVIDER_MUXB="DIVB",
-                p_CLKOS_ENABLE="ENABLED",
-                p_OUTDIVIDER_MUXA="DIVA",
-                p_CLKOP_ENABLE="ENABLED",
-                p_CLKOS3_DIV=1,
-                p_CLKOS2_DIV=8,
-                p_CLKOS_DIV=48,
-                p_CLKOP_DIV=12,
-                p_CLKFB_DIV=1,
-                p_CLKI_DIV=1,
-                p_FEEDBK_PATH="CLKOP",
-
-                # Internal feedback.
-                i_CLKFB=ClockSignal("sync"),
-
-                # Control signals.
-                i_RST=0,
-                i_PHASESEL0=0,
-                i_PHASESEL1=0,
-                i_PHASEDIR=1,
-                i_PHASESTEP=1,
-                i_PHASELOADREG=1,
-                i_STDBY=0,
-                i_PLLWAKESYNC=0,
-
-                # Output Enables.
-                i_ENCLKOP=0,
-                i_ENCLKOS=0,
-                i_ENCLKOS2=0,
-                i_ENCLKOS3=0,
-
-                # Synthesis attributes.
-                a_FREQUENCY_PIN_CLKI="48.000000",
-                a_FREQUENCY_PIN_CLKOS="48.000000",
-                a_FREQUENCY_PIN_CLKOP="12.000000",
-                a_ICP_CURRENT="12",
-                a_LPF_RESISTOR="8"
-        )
-
-        # We'll use our 48MHz clock for everything _except_ the usb domain...
-        m.d.comb += [
-            ClockSignal("usb_io")  .eq(ClockSignal("sync")),
-            ClockSignal("fast")    .eq(ClockSignal("sync")),
+        # Domains that run at the same frequency share a clock; so only distinct frequencies need PLL outputs.
+        requests, aliases = shared_clocks(frequencies, ("sync", "usb", "usb_io", "fast"))
+
+        # Our sync clock is generated directly on CLKOP; which also serves as our PLL feedback.
+        pll_config = solve_ehxplll(platform.default_clk_frequency, requests, dedicated_feedback=False)
+        m.submodules.pll = Instance("EHXPLLL", **ehxplll_parameters(pll_config,
+            clki=input_clock,
+            clocks={domain: ClockSignal(domain) for domain, _ in requests},
+            locked=locked,
+        ))
 
+        # By default, we'll use our 48MHz clock for everything _except_ the usb domain...
+        m.d.comb += [ClockSignal(domain).eq(ClockSignal(source)) for domain, source in aliases.items()]
+        m.d.comb += [
             ResetSignal("sync")    .eq(~locked),
             ResetSignal("usb")     .eq(~locked),
             ResetSignal("usb_io")  .eq(~locked),
@@ -136,8 +92,9 @@ class OrangeCrabDomainGenerator(Elaboratable):
         return m
 
 
-class OrangeCrabPlatformR0D1(_OrangeCrabR0D1Platform, LUNAPlatform):
+class OrangeCrabPlatformR0D1(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _OrangeCrabR0D1Platform, LUNAPlatform):
     name                   = "OrangeCrab r0.1"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi", "qspi"))
     clock_domain_generator = OrangeCrabDomainGenerator
     default_usb_connection = "usb"
 
@@ -162,8 +119,9 @@ class OrangeCrabPlatformR0D1(_OrangeCrabR0D1Platform, LUNAPlatform):
         self.add_resources(self.additional_resources)
 
 
-class OrangeCrabPlatformR0D2(_OrangeCrabR0D2Platform, LUNAPlatform):
+class OrangeCrabPlatformR0D2(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _OrangeCrabR0D2Platform, LUNAPlatform):
     name                   = "OrangeCrab r0.2"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi", "qspi"))
     clock_domain_generator = OrangeCrabDomainGenerator
     default_usb_connection = "usb"
 
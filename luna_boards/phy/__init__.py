@@ -0,0 +1,11 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" SuperSpeed PHY definitions for the luna_boards platforms.
+
+Each board's PHYs live in a module of their own; which board modules import only once a PHY is
+used, so that loading a platform doesn't pull in LUNA's SerDes/PIPE gateware.
+"""
@@ -0,0 +1,65 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" SuperSpeed PHY definitions for the ECPIX5.
+
+Kept apart from the board module, so that LUNA's SerDes/PIPE gateware is only imported once a PHY is used.
+"""
+
+from amaranth import *
+
+from luna.gateware.interface.pipe       import AsyncPIPEInterface
+from luna.gateware.interface.serdes_phy import ECP5SerDesPIPE
+
+
+class ECPIX5SuperSpeedPHY(AsyncPIPEInterface):
+    """ Superspeed PHY configuration for the ECPIX5. """
+
+    REFCLK_FREQUENCY = 100e6
+    SS_FREQUENCY     = 125e6
+    FAST_FREQUENCY   = 250e6
+
+    SERDES_DUAL    = 0
+    SERDES_CHANNEL = 1
+
+
+    def __init__(self, platform):
+
+        # Grab the I/O that implements our SerDes interface...
+        serdes_io_directions = {
+            'ch0':    {'tx':"-", 'rx':"-"},
+            'ch1':    {'tx':"-", 'rx':"-"},
+            'refclk': '-',
+        }
+        serdes_io      = platform.request("serdes", self.SERDES_DUAL, dir=serdes_io_directions)
+        serdes_channel = getattr(serdes_io, f"ch{self.SERDES_CHANNEL}")
+
+        # Use it to create our soft PHY...
+        serdes_phy = ECP5SerDesPIPE(
+            tx_pads             = serdes_channel.tx,
+            rx_pads             = serdes_channel.rx,
+            dual                = self.SERDES_DUAL,
+            channel             = self.SERDES_CHANNEL,
+            refclk_frequency    = self.FAST_FREQUENCY,
+        )
+
+        # ... and bring the PHY interface signals to the MAC domain.
+        super().__init__(serdes_phy, width=4, domain="ss")
+
+
+    def elaborate(self, platform):
+        m = super().elaborate(platform)
+
+        # Patch in our soft PHY as a submodule.
+        m.submodules.phy = self.phy
+
+        # Drive the PHY reference clock with our fast generated clock.
+        m.d.comb += self.clk.eq(ClockSignal("fast"))
+
+        # This board does not have a way to detect Vbus, so assume it's always present.
+        m.d.comb += self.phy.power_present.eq(1)
+
+        return m
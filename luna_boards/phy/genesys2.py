@@ -0,0 +1,89 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" SuperSpeed PHY definitions for the Genesys2.
+
+Kept apart from the board module, so that LUNA's SerDes/PIPE gateware is only imported once a PHY is used.
+"""
+
+import logging
+
+from amaranth import *
+
+from luna.gateware.interface.pipe       import AsyncPIPEInterface, GearedPIPEInterface
+from luna.gateware.interface.serdes_phy import XC7GTXSerDesPIPE
+
+from ..vivado import OutOfContextModule
+
+
+class Genesys2HTGSuperSpeedPHY(GearedPIPEInterface):
+    """ Interface for the TUSB1310A, mounted on the HTG-FMC-USB3.0 board. """
+
+    SYNC_FREQUENCY = 200e6
+
+    def __init__(self, platform, with_usb2=False, index=1):
+        logging.info("Using the HiTechGlobal HTG-FMC-USB3.0 PHY board, connected via FMC.")
+
+        self._with_usb2 = with_usb2
+        self._index     = index
+
+        # Grab the geared I/O for our PIPE PHY...
+        phy_connection = platform.request('hitech_fmc_pipe', 1, xdr=GearedPIPEInterface.GEARING_XDR)
+
+        # ... and create a PIPE interface around it.
+        super().__init__(pipe=phy_connection)
+
+
+    def elaborate(self, platform):
+
+        # Grab our platform, so we can tweak it.
+        m = super().elaborate(platform)
+
+        # If we're not using the USB2 functionality, we'll want to drive the ULPI lines as straps.
+        # Request them, so our PULL attributes are included.
+        if not self._with_usb2:
+            platform.request("hitech_fmc_ulpi_straps", 1)
+
+        return m
+
+
+class Genesys2GTXSuperSpeedPHY(AsyncPIPEInterface):
+    """ Superspeed PHY configuration for the Genesys2, using transceivers. """
+
+    SS_FREQUENCY   = 125e6
+    FAST_FREQUENCY = 250e6
+
+
+    def __init__(self, platform):
+
+        # Grab the I/O that implements our SerDes interface...
+        serdes_io = platform.request("hitech_fmc_serdes", dir={'tx':"-", 'rx':"-"})
+
+        # Use it to create our soft PHY...
+        serdes_phy = XC7GTXSerDesPIPE(
+            tx_pads             = serdes_io.tx,
+            rx_pads             = serdes_io.rx,
+            refclk_frequency    = self.FAST_FREQUENCY,
+            ss_clock_frequency  = self.SS_FREQUENCY,
+        )
+
+        # ... and bring the PHY interface signals to the MAC domain.
+        super().__init__(serdes_phy, width=4, domain="ss")
+
+
+    def elaborate(self, platform):
+        m = super().elaborate(platform)
+
+        # Patch in our soft PHY as a submodule; pre-synthesized, if LUNA_VIVADO_OOC is set.
+        m.submodules.phy = OutOfContextModule(self.phy, name="genesys2_gtx_serdes")
+
+        # Drive the PHY reference clock with our fast generated clock.
+        m.d.comb += self.clk.eq(ClockSignal("fast"))
+
+        # This board does not have a way to detect Vbus, so assume it's always present.
+        m.d.comb += self.phy.power_present.eq(1)
+
+        return m
@@ -0,0 +1,56 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" SuperSpeed PHY definitions for the NeTV2.
+
+Kept apart from the board module, so that LUNA's SerDes/PIPE gateware is only imported once a PHY is used.
+"""
+
+from amaranth import *
+
+from luna.gateware.interface.pipe       import AsyncPIPEInterface
+from luna.gateware.interface.serdes_phy import XC7GTPSerDesPIPE
+
+from ..vivado import OutOfContextModule
+
+
+class NeTV2SuperSpeedPHY(AsyncPIPEInterface):
+    """ Superspeed PHY configuration for the NeTV2. """
+
+    SS_FREQUENCY   = 125e6
+    FAST_FREQUENCY = 250e6
+
+
+    def __init__(self, platform):
+
+        # Grab the I/O that implements our SerDes interface...
+        serdes_io = platform.request("serdes", dir={'tx':"-", 'rx':"-"})
+
+        # Use it to create our soft PHY...
+        serdes_phy = XC7GTPSerDesPIPE(
+            tx_pads             = serdes_io.tx,
+            rx_pads             = serdes_io.rx,
+            refclk_frequency    = self.FAST_FREQUENCY,
+            ss_clock_frequency  = self.SS_FREQUENCY,
+        )
+
+        # ... and bring the PHY interface signals to the MAC domain.
+        super().__init__(serdes_phy, width=4, domain="ss")
+
+
+    def elaborate(self, platform):
+        m = super().elaborate(platform)
+
+        # Patch in our soft PHY as a submodule; pre-synthesized, if LUNA_VIVADO_OOC is set.
+        m.submodules.phy = OutOfContextModule(self.phy, name="netv2_gtp_serdes")
+
+        # Drive the PHY reference clock with our fast generated clock.
+        m.d.comb += self.clk.eq(ClockSignal("fast"))
+
+        # This board does not have a way to detect Vbus, so assume it's always present.
+        m.d.comb += self.phy.power_present.eq(1)
+
+        return m
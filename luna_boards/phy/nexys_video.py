@@ -0,0 +1,44 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" SuperSpeed PHY definitions for the Nexys Video.
+
+Kept apart from the board module, so that LUNA's PIPE gateware is only imported once a PHY is used.
+"""
+
+import logging
+
+from amaranth import *
+
+from luna.gateware.interface.pipe import GearedPIPEInterface
+
+
+class NexysVideoAB07SuperspeedPHY(GearedPIPEInterface):
+    """ Interface for the TUSB1310A, mounted on the AB07 FMC board. """
+
+    VADJ_VOLTAGE = '2.5V'
+
+    def __init__(self, platform):
+        logging.info("Using DesignGateway AB07 PHY board, connected via FMC.")
+
+        # Grab the geared I/O for our PIPE PHY...
+        phy_connection = platform.request('ab07_usbfmc_pipe', xdr=GearedPIPEInterface.GEARING_XDR)
+
+        # ... and create a PIPE interface around it.
+        super().__init__(pipe=phy_connection, invert_rx_polarity_signal=True)
+
+
+    def elaborate(self, platform):
+
+        # Grab our platform, and make an important tweak before returning it:
+        m = super().elaborate(platform)
+
+        # Ensure that we're driving VADJ with the proper I/O voltage.
+        m.d.comb += [
+            platform.request("vadj_select").eq(platform.VADJ_VALUES[self.VADJ_VOLTAGE])
+        ]
+
+        return m
@@ -0,0 +1,111 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Solvers that configure the clock generators (PLLs) used by the luna_boards domain generators.
+
+The solvers are pure Python: they don't require Amaranth, and their results are memoized.
+"""
+
+
+class PLLConfigurationError(ValueError):
+    """ Raised when a PLL can't produce a requested set of clocks. """
+
+
+def _too_many_clocks(message, limit, requests):
+    """ Returns a PLLConfigurationError for a PLL that was asked for more clocks than it can generate.
+
+    Parameters
+    ----------
+    message: str
+        Describes the PLL's limit; e.g. "an SB_PLL40 can generate one or two clocks".
+    limit: int
+        The number of clocks the PLL can generate.
+    requests: tuple
+        The ``(name, frequency, phase)`` requests made of it; in order of preference, as produced
+        by :func:`shared_clocks`. The error names the domains that didn't fit, and those whose
+        outputs they could share instead.
+    """
+
+    def describe(requests, conjunction):
+        names = [f"{name} ({frequency / 1e6:g} MHz{f', {phase:g} degrees' if phase else ''})"
+            for name, frequency, phase in requests]
+        return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} {conjunction} {names[-1]}"
+
+    fitted, extra = requests[:limit], requests[limit:]
+    return PLLConfigurationError(f"{message}; {len(requests)} were requested. "
+        f"{describe(extra, 'and')} {'needs an output of its' if len(extra) == 1 else 'need outputs of their'} own; "
+        f"{'it' if len(extra) == 1 else 'they'} could share an output with {describe(fitted, 'or')} instead, if run at the same frequency")
+
+
+def domain_frequencies(generator, platform, *, fixed=()):
+    """ Returns the frequency each clock domain produced by a domain generator should run at, in Hz.
+
+    Each generator lists the domains it can produce -- and their default frequencies, in MHz -- in its
+    ``DEFAULT_CLOCK_FREQUENCIES_MHZ``; a platform can provide its own ``DEFAULT_CLOCK_FREQUENCIES_MHZ``
+    to override these. Any domain named in the generator's ``clock_frequencies`` runs at that frequency
+    (in MHz) instead.
+
+    Parameters
+    ----------
+    generator:
+        The domain generator being elaborated.
+    platform:
+        The platform it's being elaborated for.
+    fixed: iterable of str
+        Domains whose frequency can't be changed; e.g. those clocked by a ULPI PHY, or by a
+        full-speed USB PHY that relies on a fixed 48 MHz / 12 MHz pair.
+
+    Raises PLLConfigurationError if an unknown domain, or a new frequency for a fixed domain, is requested.
+    """
+
+    defaults    = getattr(platform, "DEFAULT_CLOCK_FREQUENCIES_MHZ", generator.DEFAULT_CLOCK_FREQUENCIES_MHZ)
+    frequencies = dict(defaults)
+
+    for domain, frequency in (generator.clock_frequencies or {}).items():
+        if domain not in defaults:
+            raise PLLConfigurationError(f"the {platform.name} can't generate a '{domain}' domain; "
+                f"its domains are {', '.join(defaults)}")
+        if domain in fixed and frequency != defaults[domain]:
+            raise PLLConfigurationError(f"the '{domain}' domain of the {platform.name} is fixed "
+                f"at {defaults[domain]:g} MHz; {frequency:g} MHz was requested")
+
+        frequencies[domain] = frequency
+
+    return {domain: frequency * 1e6 for domain, frequency in frequencies.items()}
+
+
+def shared_clocks(frequencies, domains):
+    """ Groups clock domains that run at the same frequency, so they can share a single PLL output.
+
+    Parameters
+    ----------
+    frequencies: dict
+        The frequency of each domain; as returned by :func:`domain_frequencies`.
+    domains: iterable of str
+        The domains to be clocked, in order of preference; the first domain at each frequency
+        is generated directly.
+
+    Returns a tuple of ``(requests, aliases)``: ``requests`` is a tuple of ``(domain, frequency)``
+    requests suitable for a solver, and ``aliases`` maps each remaining domain onto the generated
+    domain whose clock it should share.
+    """
+
+    sources = {}
+    aliases = {}
+
+    for domain in domains:
+        source = sources.setdefault(frequencies[domain], domain)
+        if source != domain:
+            aliases[domain] = source
+
+    requests = tuple((domain, frequency) for frequency, domain in sources.items())
+    return requests, aliases
+
+
+from .ecp5   import EHXPLLLConfig, solve_ehxplll, ehxplll_parameters, evaluate_ehxplll
+from .xilinx import XilinxPLLConfig, solve_xilinx_pll, xilinx_pll_parameters, evaluate_xilinx_pll
+from .ice40  import SBPLL40Config, solve_sb_pll40, sb_pll40_parameters, evaluate_sb_pll40
+from .intel  import ALTPLLConfig, solve_altpll, altpll_parameters, evaluate_altpll
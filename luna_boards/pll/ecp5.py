@@ -0,0 +1,350 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Configuration solver for the ECP5 EHXPLLL.
+
+    >>> config = solve_ehxplll(25e6, (("sync", 48e6), ("usb", 12e6)))
+    >>> m.submodules.pll = Instance("EHXPLLL", **ehxplll_parameters(config,
+    ...     clki=input_clock, feedback=Signal(), locked=locked,
+    ...     clocks={"sync": ClockSignal("sync"), "usb": ClockSignal("usb")}))
+"""
+
+import math
+import functools
+
+from collections import namedtuple
+
+from . import PLLConfigurationError, _too_many_clocks
+
+
+__all__ = ["EHXPLLLOutput", "EHXPLLLConfig", "solve_ehxplll", "ehxplll_parameters", "evaluate_ehxplll"]
+
+
+# Operating limits, from the ECP5 family datasheet (sysCLOCK PLL timing).
+INPUT_RANGE  = (8e6,     400e6)
+PFD_RANGE    = (3.125e6, 400e6)
+VCO_RANGE    = (400e6,   800e6)
+OUTPUT_RANGE = (3.125e6, 400e6)
+
+CLKI_DIV_MAX   = 128
+CLKFB_DIV_MAX  = 80
+OUTPUT_DIV_MAX = 128
+
+# The EHXPLLL's outputs, in the order we allocate them.
+OUTPUT_PORTS = ["CLKOP", "CLKOS", "CLKOS2", "CLKOS3"]
+
+
+class EHXPLLLOutput(namedtuple("EHXPLLLOutput",
+        ["name", "port", "divider", "cphase", "fphase", "frequency", "phase",
+         "requested_frequency", "requested_phase"])):
+    """ A single clock produced by an EHXPLLL.
+
+    Attributes
+    ----------
+    name: str
+        The name of the requested clock; typically the LUNA domain it drives.
+    port: str
+        The EHXPLLL output generating the clock; e.g. "CLKOS2".
+    divider, cphase, fphase: int
+        The output's DIV, CPHASE and FPHASE parameters.
+    frequency, phase: float
+        The frequency (in Hz) and phase (in degrees) actually produced.
+    requested_frequency, requested_phase: float
+        The frequency and phase that were asked for.
+    """
+
+    @property
+    def error(self):
+        """ The output's frequency error, relative to the requested frequency. """
+        return (self.frequency - self.requested_frequency) / self.requested_frequency
+
+
+class EHXPLLLConfig(namedtuple("EHXPLLLConfig",
+        ["input_frequency", "clki_div", "clkfb_div", "clkop_div", "vco_frequency", "dedicated_feedback", "outputs"])):
+    """ A complete, legal EHXPLLL configuration; as returned by :func:`solve_ehxplll`.
+
+    Attributes
+    ----------
+    input_frequency: float
+        The frequency of the clock on CLKI, in Hz.
+    clki_div, clkfb_div, clkop_div: int
+        The input, feedback and CLKOP dividers.
+    vco_frequency: float
+        The resulting VCO frequency, in Hz.
+    dedicated_feedback: bool
+        True if CLKOP is used only as the feedback clock; False if it also drives the first output.
+    outputs: tuple of EHXPLLLOutput
+        The generated clocks, in the order they were requested.
+    """
+
+    @property
+    def max_error(self):
+        """ The largest relative frequency error of any output. """
+        return max(abs(output.error) for output in self.outputs)
+
+
+    def output(self, name):
+        """ Returns the EHXPLLLOutput that generates the clock with the given name. """
+        for output in self.outputs:
+            if output.name == name:
+                return output
+
+        raise KeyError(name)
+
+
+def _normalize_request(request):
+    """ Converts a (name, frequency[, phase]) request into a (name, frequency, phase) tuple. """
+    name, frequency, *phase = request
+    return name, float(frequency), float(phase[0]) % 360 if phase else 0.0
+
+
+def _phase_settings(divider, phase):
+    """ Returns the (cphase, fphase, actual phase) for an output; using Diamond's conventions.
+
+    Each output's phase can be adjusted in steps of 1/8th of a VCO period.
+    """
+    steps = round(phase / 360 * divider * 8) % (divider * 8)
+    return divider - 1 + steps // 8, steps % 8, 360 * steps / (divider * 8)
+
+
+@functools.lru_cache(maxsize=None)
+def solve_ehxplll(input_frequency, outputs, *, dedicated_feedback=True, tolerance=1e-3):
+    """ Finds an EHXPLLL configuration that generates a set of clocks from a single input.
+
+    Among the configurations that best approximate the requested frequencies, the one with
+    the highest VCO frequency (and thus the least jitter) is chosen. Results are memoized.
+
+    Parameters
+    ----------
+    input_frequency: float
+        The frequency of the clock provided on CLKI, in Hz.
+    outputs: tuple
+        A tuple of ``(name, frequency)`` or ``(name, frequency, phase)`` requests; one per clock
+        to be generated. Frequencies are in Hz; phases are in degrees, relative to the feedback.
+    dedicated_feedback: bool
+        If True, CLKOP is reserved for the feedback path and up to three clocks can be generated.
+        If False, CLKOP drives the first requested clock (and must be fed back by the caller);
+        leaving all four outputs available.
+    tolerance: float
+        The largest relative frequency error acceptable on any output.
+
+    Raises PLLConfigurationError if no legal configuration meets the given tolerance.
+    """
+
+    requests = tuple(_normalize_request(request) for request in outputs)
+    ports    = OUTPUT_PORTS[1:] if dedicated_feedback else OUTPUT_PORTS
+
+    if not requests:
+        raise PLLConfigurationError("an EHXPLLL must generate at least one clock")
+    if len(requests) > len(ports):
+        raise _too_many_clocks(f"an EHXPLLL can only generate {len(ports)} clocks "
+            f"{'with' if dedicated_feedback else 'without'} dedicated feedback", len(ports), requests)
+    if len({name for name, _, _ in requests}) != len(requests):
+        raise PLLConfigurationError("EHXPLLL clock names must be unique")
+    if not (INPUT_RANGE[0] <= input_frequency <= INPUT_RANGE[1]):
+        raise PLLConfigurationError(f"EHXPLLL input frequency {input_frequency / 1e6:g} MHz is out of range")
+    for name, frequency, _ in requests:
+        if not (OUTPUT_RANGE[0] <= frequency <= OUTPUT_RANGE[1]):
+            raise PLLConfigurationError(f"requested EHXPLLL output {name} ({frequency / 1e6:g} MHz) is out of range")
+
+    def output_divider(vco_frequency, frequency):
+        """ Returns the closest legal divider for generating a frequency; or None if there's none. """
+        divider = min(max(round(vco_frequency / frequency), 1), OUTPUT_DIV_MAX)
+        if not (OUTPUT_RANGE[0] <= vco_frequency / divider <= OUTPUT_RANGE[1]):
+            return None
+        return divider
+
+    best, best_key = None, None
+    for clki_div in range(1, CLKI_DIV_MAX + 1):
+        pfd_frequency = input_frequency / clki_div
+        if pfd_frequency < PFD_RANGE[0]:
+            break
+        if pfd_frequency > PFD_RANGE[1]:
+            continue
+
+        for clkfb_div in range(1, CLKFB_DIV_MAX + 1):
+
+            # The PLL locks CLKOP to CLKFB_DIV times the PFD frequency.
+            clkop_frequency = pfd_frequency * clkfb_div
+            if clkop_frequency > OUTPUT_RANGE[1]:
+                break
+            if clkop_frequency < OUTPUT_RANGE[0]:
+                continue
+
+            # CLKOP's own divider sets the VCO frequency; try every one that keeps the VCO in range.
+            smallest = max(math.ceil(VCO_RANGE[0] / clkop_frequency), 1)
+            largest  = min(math.floor(VCO_RANGE[1] / clkop_frequency), OUTPUT_DIV_MAX)
+
+            for clkop_div in range(smallest, largest + 1):
+                vco_frequency = clkop_frequency * clkop_div
+
+                # Without dedicated feedback, our first output is CLKOP itself; every other
+                # output gets its own divider from the VCO.
+                free_requests = requests if dedicated_feedback else requests[1:]
+                dividers = [output_divider(vco_frequency, f) for _, f, _ in free_requests]
+                if None in dividers:
+                    continue
+                if not dedicated_feedback:
+                    dividers.insert(0, clkop_div)
+
+                error = max(abs(vco_frequency / d - f) / f for d, (_, f, _) in zip(dividers, requests))
+                key   = (error, -vco_frequency, clki_div)
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best     = (clki_div, clkfb_div, clkop_div, vco_frequency, dividers)
+
+    if best is None or best_key[0] > tolerance:
+        wanted = ", ".join(f"{name}={frequency / 1e6:g} MHz" for name, frequency, _ in requests)
+        raise PLLConfigurationError(f"no EHXPLLL configuration generates {wanted} "
+            f"from {input_frequency / 1e6:g} MHz within {tolerance:.2%}")
+
+    clki_div, clkfb_div, clkop_div, vco_frequency, dividers = best
+
+    generated = []
+    for port, divider, (name, frequency, phase) in zip(ports, dividers, requests):
+
+        # The fed-back output defines our zero phase; so it can't itself be shifted.
+        if port == "CLKOP" and phase:
+            raise PLLConfigurationError(f"EHXPLLL output {name} drives the feedback path, and can't be phase-shifted")
+
+        cphase, fphase, actual_phase = _phase_settings(divider, phase)
+        generated.append(EHXPLLLOutput(name, port, divider, cphase, fphase,
+            vco_frequency / divider, actual_phase, frequency, phase))
+
+    return EHXPLLLConfig(input_frequency, clki_div, clkfb_div, clkop_div, vco_frequency, dedicated_feedback, tuple(generated))
+
+
+def _mhz(frequency):
+    return f"{frequency / 1e6:g}"
+
+
+def ehxplll_parameters(config, *, clki, clocks, locked, feedback=None, reset=None):
+    """ Returns the Instance arguments for an EHXPLLL implementing the given configuration.
+
+    Parameters
+    ----------
+    config: EHXPLLLConfig
+        The configuration to implement; as returned by :func:`solve_ehxplll`.
+    clki:
+        The PLL's input clock.
+    clocks: dict
+        Maps each requested clock's name to the signal it should drive.
+    locked:
+        The signal driven by the PLL's LOCK output.
+    feedback:
+        A signal used to route CLKOP back to CLKFB. Required if the configuration uses
+        dedicated feedback; otherwise, the first requested clock is fed back directly.
+    reset:
+        If provided, the signal that resets the PLL.
+    """
+
+    if config.dedicated_feedback:
+        if feedback is None:
+            raise ValueError("a feedback signal is required for EHXPLLL configurations with dedicated feedback")
+    else:
+        feedback = clocks[config.outputs[0].name]
+
+    parameters = dict(
+        i_CLKI=clki,
+        i_CLKFB=feedback,
+        i_RST=0 if reset is None else reset,
+        i_STDBY=0,
+        i_PHASESEL0=0,
+        i_PHASESEL1=0,
+        i_PHASEDIR=1,
+        i_PHASESTEP=1,
+        i_PHASELOADREG=1,
+        i_PLLWAKESYNC=0,
+        i_ENCLKOP=0,
+        i_ENCLKOS=0,
+        i_ENCLKOS2=0,
+        i_ENCLKOS3=0,
+        o_LOCK=locked,
+
+        p_PLLRST_ENA="DISABLED" if reset is None else "ENABLED",
+        p_INTFB_WAKE="DISABLED",
+        p_STDBY_ENABLE="DISABLED",
+        p_DPHASE_SOURCE="DISABLED",
+        p_OUTDIVIDER_MUXA="DIVA",
+        p_OUTDIVIDER_MUXB="DIVB",
+        p_OUTDIVIDER_MUXC="DIVC",
+        p_OUTDIVIDER_MUXD="DIVD",
+        p_PLL_LOCK_MODE=0,
+        p_FEEDBK_PATH="CLKOP",
+        p_CLKI_DIV=config.clki_div,
+        p_CLKFB_DIV=config.clkfb_div,
+
+        a_FREQUENCY_PIN_CLKI=_mhz(config.input_frequency),
+        a_ICP_CURRENT="12",
+        a_LPF_RESISTOR="8",
+        a_MFG_ENABLE_FILTEROPAMP="1",
+        a_MFG_GMCREF_SEL="2",
+    )
+
+    # Start with every output disabled; CLKOP always runs, as it closes our feedback loop.
+    for port in OUTPUT_PORTS:
+        parameters[f"p_{port}_ENABLE"] = "DISABLED"
+        parameters[f"p_{port}_DIV"]    = 1
+        parameters[f"p_{port}_CPHASE"] = 0
+        parameters[f"p_{port}_FPHASE"] = 0
+
+    parameters.update(
+        o_CLKOP=feedback,
+        p_CLKOP_ENABLE="ENABLED",
+        p_CLKOP_DIV=config.clkop_div,
+        p_CLKOP_CPHASE=config.clkop_div - 1,
+        a_FREQUENCY_PIN_CLKOP=_mhz(config.vco_frequency / config.clkop_div),
+    )
+
+    # ... and then enable each output we're using.
+    for output in config.outputs:
+        parameters[f"o_{output.port}"]              = clocks[output.name]
+        parameters[f"p_{output.port}_ENABLE"]       = "ENABLED"
+        parameters[f"p_{output.port}_DIV"]          = output.divider
+        parameters[f"p_{output.port}_CPHASE"]       = output.cphase
+        parameters[f"p_{output.port}_FPHASE"]       = output.fphase
+        parameters[f"a_FREQUENCY_PIN_{output.port}"] = _mhz(output.frequency)
+
+    return parameters
+
+
+# Maps each FEEDBK_PATH setting onto the output whose divider closes the feedback loop.
+_FEEDBACK_OUTPUTS = {
+    "CLKOP":  "CLKOP", "CLKOS":  "CLKOS",  "CLKOS2":  "CLKOS2",  "CLKOS3":  "CLKOS3",
+    "INT_OP": "CLKOP", "INT_OS": "CLKOS",  "INT_OS2": "CLKOS2",  "INT_OS3": "CLKOS3",
+}
+
+
+def evaluate_ehxplll(parameters, input_frequency):
+    """ Computes the clocks an existing EHXPLLL instance produces; e.g. for reporting.
+
+    Parameters
+    ----------
+    parameters: dict
+        The instance's parameters, without their ``p_`` prefixes.
+    input_frequency: float
+        The frequency of the clock on CLKI, in Hz.
+
+    Returns a tuple of ``(vco_frequency, outputs)``, where ``outputs`` maps the name of each
+    enabled output port onto the ``(frequency, phase)`` it produces.
+    """
+
+    feedback = _FEEDBACK_OUTPUTS.get(str(parameters.get("FEEDBK_PATH", "CLKOP")), "CLKOP")
+
+    feedback_frequency = input_frequency / int(parameters.get("CLKI_DIV", 1)) * int(parameters.get("CLKFB_DIV", 1))
+    vco_frequency      = feedback_frequency * int(parameters.get(f"{feedback}_DIV", 1))
+
+    outputs = {}
+    for port in OUTPUT_PORTS:
+        if parameters.get(f"{port}_ENABLE", "ENABLED") != "ENABLED":
+            continue
+
+        divider = int(parameters.get(f"{port}_DIV", 1))
+        steps   = (int(parameters.get(f"{port}_CPHASE", divider - 1)) - (divider - 1)) * 8 \
+            + int(parameters.get(f"{port}_FPHASE", 0))
+        outputs[port] = (vco_frequency / divider, (360 * steps / (divider * 8)) % 360)
+
+    return vco_frequency, outputs
@@ -0,0 +1,299 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Configuration solver for the iCE40 SB_PLL40 family.
+
+    >>> config = solve_sb_pll40(12e6, (("sync", 48e6), ("usb", 12e6)), from_pad=True)
+    >>> m.submodules.pll = Instance(config.primitive, **sb_pll40_parameters(config,
+    ...     reference=clk_pin, clocks={"sync": clk48, "usb": clk12}, global_outputs=True))
+"""
+
+import functools
+
+from collections import namedtuple
+
+from . import PLLConfigurationError, _too_many_clocks
+
+
+__all__ = ["SBPLL40Output", "SBPLL40Config", "solve_sb_pll40", "sb_pll40_parameters", "evaluate_sb_pll40"]
+
+
+# Operating limits, from the iCE40 sysCLOCK PLL design guide (TN1251).
+INPUT_RANGE  = (10e6,  133e6)
+PFD_RANGE    = (10e6,  133e6)
+VCO_RANGE    = (533e6, 1066e6)
+OUTPUT_RANGE = (16e6,  275e6)
+
+DIVR_MAX   = 15
+DIVF_MAX   = 127
+DIVQ_RANGE = (1, 6)
+
+# Each output can take the PLL's generated clock directly, or divided down. The quadrature
+# (SHIFTREG) outputs run at a quarter of the generated clock, and can be shifted by 90 degrees.
+# Modes are listed in order of preference.
+OUTPUT_MODES = [
+    # (mode,            divisor, phase)
+    ("GENCLK",          1,       0),
+    ("GENCLK_HALF",     2,       0),
+    ("SHIFTREG_0deg",   4,       0),
+    ("SHIFTREG_90deg",  4,       90),
+]
+
+
+class SBPLL40Output(namedtuple("SBPLL40Output",
+        ["name", "port", "mode", "frequency", "phase", "requested_frequency", "requested_phase"])):
+    """ A single clock produced by an SB_PLL40.
+
+    Attributes
+    ----------
+    name: str
+        The name of the requested clock; typically the LUNA domain it drives.
+    port: str
+        The output port used: "" for single-output PLLs, or "A"/"B" for two-output PLLs.
+    mode: str
+        The output's PLLOUT_SELECT setting; e.g. "GENCLK_HALF".
+    frequency, phase: float
+        The frequency (in Hz) and phase (in degrees) actually produced.
+    requested_frequency, requested_phase: float
+        The frequency and phase that were asked for.
+    """
+
+    @property
+    def error(self):
+        """ The output's frequency error, relative to the requested frequency. """
+        return (self.frequency - self.requested_frequency) / self.requested_frequency
+
+
+class SBPLL40Config(namedtuple("SBPLL40Config",
+        ["primitive", "input_frequency", "divr", "divf", "divq", "filter_range", "vco_frequency", "outputs"])):
+    """ A complete, legal SB_PLL40 configuration; as returned by :func:`solve_sb_pll40`.
+
+    Attributes
+    ----------
+    primitive: str
+        The PLL primitive to instantiate; e.g. "SB_PLL40_2F_PAD".
+    input_frequency: float
+        The frequency of the PLL's reference clock, in Hz.
+    divr, divf, divq, filter_range: int
+        The PLL's DIVR, DIVF, DIVQ and FILTER_RANGE parameters.
+    vco_frequency: float
+        The resulting VCO frequency, in Hz.
+    outputs: tuple of SBPLL40Output
+        The generated clocks, in the order they were requested.
+    """
+
+    @property
+    def max_error(self):
+        """ The largest relative frequency error of any output. """
+        return max(abs(output.error) for output in self.outputs)
+
+
+    def output(self, name):
+        """ Returns the SBPLL40Output that generates the clock with the given name. """
+        for output in self.outputs:
+            if output.name == name:
+                return output
+
+        raise KeyError(name)
+
+
+def filter_range(pfd_frequency):
+    """ Returns the loop filter setting appropriate for a given PFD frequency; as icepll does. """
+    for setting, upper_limit in enumerate([17e6, 26e6, 44e6, 66e6, 101e6], start=1):
+        if pfd_frequency < upper_limit:
+            return setting
+    return 6
+
+
+def _normalize_request(request):
+    """ Converts a (name, frequency[, phase]) request into a (name, frequency, phase) tuple. """
+    name, frequency, *phase = request
+    return name, float(frequency), float(phase[0]) % 360 if phase else 0.0
+
+
+@functools.lru_cache(maxsize=None)
+def solve_sb_pll40(input_frequency, outputs, *, from_pad=False, tolerance=1e-3):
+    """ Finds an SB_PLL40 configuration that generates one or two clocks from a single reference.
+
+    Both outputs share the PLL's generated clock; but each can use it directly, halved (GENCLK_HALF)
+    or quartered (SHIFTREG). This lets slow clocks -- such as a 12 MHz USB clock, which is below
+    the PLL's minimum output frequency -- be generated. Results are memoized.
+
+    Parameters
+    ----------
+    input_frequency: float
+        The frequency of the PLL's reference clock, in Hz.
+    outputs: tuple
+        A tuple of one or two ``(name, frequency)`` or ``(name, frequency, phase)`` requests.
+        Frequencies are in Hz; phases are in degrees, and can only be 0, or 90 for quadrature outputs.
+    from_pad: bool
+        True if the reference clock comes directly from a package pin; which selects the _PAD
+        variant of the PLL. Otherwise, the _CORE variant is used, and the reference is taken from fabric.
+    tolerance: float
+        The largest relative frequency error acceptable on any output.
+
+    Raises PLLConfigurationError if no legal configuration meets the given tolerance.
+    """
+
+    requests = tuple(_normalize_request(request) for request in outputs)
+
+    if not requests:
+        raise PLLConfigurationError("an SB_PLL40 must generate at least one clock")
+    if len(requests) > 2:
+        raise _too_many_clocks("an SB_PLL40 can generate one or two clocks", 2, requests)
+    if len({name for name, _, _ in requests}) != len(requests):
+        raise PLLConfigurationError("SB_PLL40 clock names must be unique")
+    if not (INPUT_RANGE[0] <= input_frequency <= INPUT_RANGE[1]):
+        raise PLLConfigurationError(f"SB_PLL40 reference frequency {input_frequency / 1e6:g} MHz is out of range")
+
+    # Figure out which output modes could produce each request's phase.
+    candidate_modes = []
+    for name, _, phase in requests:
+        modes = [(mode, divisor) for mode, divisor, mode_phase in OUTPUT_MODES if mode_phase == phase]
+        if not modes:
+            raise PLLConfigurationError(f"SB_PLL40 output {name} can't be shifted by {phase:g} degrees; "
+                "only 0 and 90 (quadrature) are supported")
+        candidate_modes.append(modes)
+
+    best, best_key = None, None
+    for divr in range(DIVR_MAX + 1):
+        pfd_frequency = input_frequency / (divr + 1)
+        if pfd_frequency < PFD_RANGE[0]:
+            break
+        if pfd_frequency > PFD_RANGE[1]:
+            continue
+
+        for divf in range(DIVF_MAX + 1):
+            vco_frequency = pfd_frequency * (divf + 1)
+            if vco_frequency < VCO_RANGE[0]:
+                continue
+            if vco_frequency > VCO_RANGE[1]:
+                break
+
+            for divq in range(DIVQ_RANGE[0], DIVQ_RANGE[1] + 1):
+                generated_frequency = vco_frequency / (2 ** divq)
+                if not (OUTPUT_RANGE[0] <= generated_frequency <= OUTPUT_RANGE[1]):
+                    continue
+
+                # Pick the best mode for each output; preferring simpler modes on a tie.
+                choices, error, cost = [], 0, 0
+                for (_, frequency, _), modes in zip(requests, candidate_modes):
+                    choice = min(range(len(modes)),
+                        key=lambda i: abs(generated_frequency / modes[i][1] - frequency))
+                    choices.append(modes[choice])
+                    error = max(error, abs(generated_frequency / modes[choice][1] - frequency) / frequency)
+                    cost += choice
+
+                key = (error, cost, -vco_frequency, divr)
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best     = (divr, divf, divq, vco_frequency, generated_frequency, choices)
+
+    if best is None or best_key[0] > tolerance:
+        wanted = ", ".join(f"{name}={frequency / 1e6:g} MHz" for name, frequency, _ in requests)
+        raise PLLConfigurationError(f"no SB_PLL40 configuration generates {wanted} "
+            f"from {input_frequency / 1e6:g} MHz within {tolerance:.2%}")
+
+    divr, divf, divq, vco_frequency, generated_frequency, choices = best
+
+    two_outputs = (len(requests) == 2)
+    ports       = ["A", "B"] if two_outputs else [""]
+    primitive   = "SB_PLL40_{}{}".format("2F_" if two_outputs else "", "PAD" if from_pad else "CORE")
+
+    generated = tuple(
+        SBPLL40Output(name, port, mode, generated_frequency / divisor,
+            90.0 if mode == "SHIFTREG_90deg" else 0.0, frequency, phase)
+        for port, (mode, divisor), (name, frequency, phase) in zip(ports, choices, requests)
+    )
+
+    return SBPLL40Config(primitive, input_frequency, divr, divf, divq,
+        filter_range(input_frequency / (divr + 1)), vco_frequency, generated)
+
+
+def sb_pll40_parameters(config, *, reference, clocks, locked=None, global_outputs=False):
+    """ Returns the Instance arguments for an SB_PLL40 implementing the given configuration.
+
+    The primitive to instantiate is ``config.primitive``.
+
+    Parameters
+    ----------
+    config: SBPLL40Config
+        The configuration to implement; as returned by :func:`solve_sb_pll40`.
+    reference:
+        The PLL's reference clock; a package pin for _PAD variants, or a fabric signal otherwise.
+    clocks: dict
+        Maps each requested clock's name to the signal it should drive.
+    locked:
+        If provided, the signal driven by the PLL's LOCK output.
+    global_outputs: bool
+        If True, the outputs drive global buffers directly (PLLOUTGLOBAL); otherwise they're
+        routed through fabric (PLLOUTCORE).
+    """
+
+    reference_port = "i_PACKAGEPIN" if config.primitive.endswith("_PAD") else "i_REFERENCECLK"
+    output_port    = "PLLOUTGLOBAL" if global_outputs else "PLLOUTCORE"
+
+    parameters = {
+        reference_port:    reference,
+        "i_RESETB":        1,
+        "i_BYPASS":        0,
+
+        "p_FEEDBACK_PATH": "SIMPLE",
+        "p_DIVR":          config.divr,
+        "p_DIVF":          config.divf,
+        "p_DIVQ":          config.divq,
+        "p_FILTER_RANGE":  config.filter_range,
+    }
+
+    if locked is not None:
+        parameters["o_LOCK"] = locked
+
+    for output in config.outputs:
+        select = f"p_PLLOUT_SELECT_PORT{output.port}" if output.port else "p_PLLOUT_SELECT"
+        parameters[select]                           = output.mode
+        parameters[f"o_{output_port}{output.port}"] = clocks[output.name]
+
+    return parameters
+
+
+def evaluate_sb_pll40(parameters, input_frequency):
+    """ Computes the clocks an existing SB_PLL40 instance produces; e.g. for reporting.
+
+    Parameters
+    ----------
+    parameters: dict
+        The instance's parameters, without their ``p_`` prefixes.
+    input_frequency: float
+        The frequency of the PLL's reference clock, in Hz.
+
+    Returns a tuple of ``(vco_frequency, outputs)``, where ``outputs`` maps each of the PLL's
+    output ports (both its PLLOUTCORE and PLLOUTGLOBAL forms) onto the ``(frequency, phase)`` it produces.
+    """
+
+    divr = int(parameters.get("DIVR", 0))
+    divf = int(parameters.get("DIVF", 0))
+    divq = int(parameters.get("DIVQ", 0))
+
+    # With simple feedback, the VCO itself is locked to the reference; otherwise, the divided output is.
+    if parameters.get("FEEDBACK_PATH", "SIMPLE") == "SIMPLE":
+        vco_frequency = input_frequency * (divf + 1) / (divr + 1)
+    else:
+        vco_frequency = input_frequency * (divf + 1) / (divr + 1) * (2 ** divq)
+
+    generated_frequency = vco_frequency / (2 ** divq)
+    modes = {mode: (divisor, phase) for mode, divisor, phase in OUTPUT_MODES}
+
+    outputs = {}
+    for port in ("", "A", "B"):
+        select = parameters.get(f"PLLOUT_SELECT_PORT{port}" if port else "PLLOUT_SELECT")
+        if select is None:
+            continue
+
+        divisor, phase = modes.get(select, (1, 0))
+        for kind in ("PLLOUTCORE", "PLLOUTGLOBAL"):
+            outputs[f"{kind}{port}"] = (generated_frequency / divisor, phase)
+
+    return vco_frequency, outputs
@@ -0,0 +1,318 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Parameter builder for the Intel (Altera) Cyclone IV ALTPLL megafunction.
+
+Unlike the other vendors' PLLs, the ALTPLL is described by per-output frequency ratios, and Quartus
+picks the PLL's internal counters itself. We still search for a legal set of internal counters, so
+impossible configurations are caught before they reach Quartus.
+
+    >>> config = solve_altpll(60e6, (("sync", 60e6),), speed_grade=platform.speed)
+    >>> m.submodules.pll = Instance("ALTPLL", **altpll_parameters(config,
+    ...     inclk=ClockSignal("usb"), clk=main_clock, locked=locked))
+"""
+
+import re
+import functools
+
+from fractions   import Fraction
+from collections import namedtuple
+
+from . import PLLConfigurationError, _too_many_clocks
+
+
+__all__ = ["ALTPLLOutput", "ALTPLLConfig", "solve_altpll", "altpll_parameters", "evaluate_altpll"]
+
+
+# Operating limits, from the Cyclone IV device datasheet.
+INPUT_RANGE = (5e6,   472.5e6)
+PFD_RANGE   = (5e6,   325e6)
+VCO_RANGE   = (600e6, 1300e6)
+COUNTER_MAX = 512
+
+# The fastest clock each speed grade can drive onto the global clock network.
+OUTPUT_MAX = {6: 472.5e6, 7: 472.5e6, 8: 402.5e6, 9: 402.5e6}
+
+# Cyclone IV PLLs have five output counters; and thus a five-bit-wide ``clk`` port.
+OUTPUT_COUNT = 5
+
+# Every optional port of the ALTPLL; each is marked PORT_UNUSED unless we connect it.
+OPTIONAL_PORTS = [
+    "activeclock", "areset", "clkbad0", "clkbad1", "clkloss", "clkswitch", "configupdate", "fbin",
+    "inclk0", "inclk1", "locked", "pfdena", "phasecounterselect", "phasedone", "phasestep",
+    "phaseupdown", "pllena", "scanaclr", "scanclk", "scanclkena", "scandata", "scandataout",
+    "scandone", "scanread", "scanwrite",
+    *(f"clk{i}"    for i in range(6)),
+    *(f"clkena{i}" for i in range(6)),
+    *(f"extclk{i}" for i in range(4)),
+]
+
+
+class ALTPLLOutput(namedtuple("ALTPLLOutput",
+        ["name", "index", "multiply_by", "divide_by", "phase_shift", "frequency", "phase",
+         "requested_frequency", "requested_phase"])):
+    """ A single clock produced by an ALTPLL.
+
+    Attributes
+    ----------
+    name: str
+        The name of the requested clock; typically the LUNA domain it drives.
+    index: int
+        The output counter used; the clock appears on bit ``index`` of the ``clk`` port.
+    multiply_by, divide_by: int
+        The output's frequency ratio, relative to the input clock.
+    phase_shift: int
+        The output's phase shift, in picoseconds; as passed to Quartus.
+    frequency, phase: float
+        The frequency (in Hz) produced, and the phase (in degrees) achievable at our VCO frequency.
+    requested_frequency, requested_phase: float
+        The frequency and phase that were asked for.
+    """
+
+    @property
+    def error(self):
+        """ The output's frequency error, relative to the requested frequency. """
+        return (self.frequency - self.requested_frequency) / self.requested_frequency
+
+
+class ALTPLLConfig(namedtuple("ALTPLLConfig", ["input_frequency", "m", "n", "vco_frequency", "outputs"])):
+    """ A validated ALTPLL configuration; as returned by :func:`solve_altpll`.
+
+    Attributes
+    ----------
+    input_frequency: float
+        The frequency of the clock on ``inclk0``, in Hz.
+    m, n: int
+        A legal set of feedback and pre-scale counter values. Quartus makes its own choice;
+        these only demonstrate that one exists.
+    vco_frequency: float
+        The VCO frequency that results from ``m`` and ``n``, in Hz.
+    outputs: tuple of ALTPLLOutput
+        The generated clocks; in order of their output counters.
+    """
+
+    @property
+    def max_error(self):
+        """ The largest relative frequency error of any output. """
+        return max(abs(output.error) for output in self.outputs)
+
+
+    def output(self, name):
+        """ Returns the ALTPLLOutput that generates the clock with the given name. """
+        for output in self.outputs:
+            if output.name == name:
+                return output
+
+        raise KeyError(name)
+
+
+def speed_grade_number(speed_grade):
+    """ Converts a platform ``speed`` (e.g. "C8", "I7") into the numeric speed grade. """
+    match = re.search(r"\d", str(speed_grade))
+    if not match:
+        raise PLLConfigurationError(f"can't determine a Cyclone IV speed grade from {speed_grade!r}")
+    return int(match.group(0))
+
+
+def _normalize_request(request):
+    """ Converts a (name, frequency[, phase]) request into a (name, frequency, phase) tuple. """
+    name, frequency, *phase = request
+    return name, float(frequency), float(phase[0]) % 360 if phase else 0.0
+
+
+@functools.lru_cache(maxsize=None)
+def solve_altpll(input_frequency, outputs, *, speed_grade=8, tolerance=1e-3):
+    """ Computes and validates ALTPLL parameters for a set of output clocks.
+
+    Each output's ``multiply_by``/``divide_by`` ratio and picosecond ``phase_shift`` are derived from
+    the requested frequency and phase; then we check that some legal combination of the PLL's
+    internal M, N and C counters can produce every output at once. Results are memoized.
+
+    Parameters
+    ----------
+    input_frequency: float
+        The frequency of the clock provided on ``inclk0``, in Hz.
+    outputs: tuple
+        A tuple of ``(name, frequency)`` or ``(name, frequency, phase)`` requests; assigned to the
+        PLL's output counters in order. Frequencies are in Hz; phases are in degrees.
+    speed_grade: int or str
+        The device's speed grade; typically ``platform.speed``. This limits the output frequency.
+    tolerance: float
+        The largest relative frequency error acceptable on any output.
+
+    Raises PLLConfigurationError if the requested clocks can't be generated within Cyclone IV limits.
+    """
+
+    requests    = tuple(_normalize_request(request) for request in outputs)
+    speed_grade = speed_grade_number(speed_grade)
+    output_max  = OUTPUT_MAX.get(speed_grade, min(OUTPUT_MAX.values()))
+
+    if not requests:
+        raise PLLConfigurationError("an ALTPLL must generate at least one clock")
+    if len(requests) > OUTPUT_COUNT:
+        raise _too_many_clocks(f"an ALTPLL can generate between one and {OUTPUT_COUNT} clocks",
+            OUTPUT_COUNT, requests)
+    if len({name for name, _, _ in requests}) != len(requests):
+        raise PLLConfigurationError("ALTPLL clock names must be unique")
+    if not (INPUT_RANGE[0] <= input_frequency <= INPUT_RANGE[1]):
+        raise PLLConfigurationError(f"ALTPLL input frequency {input_frequency / 1e6:g} MHz is out of range")
+
+    # First, find the frequency ratio for each output...
+    input_frequency_exact = Fraction(input_frequency)
+    ratios = []
+    for name, frequency, _ in requests:
+        if frequency > output_max:
+            raise PLLConfigurationError(f"ALTPLL output {name} ({frequency / 1e6:g} MHz) exceeds the "
+                f"{output_max / 1e6:g} MHz limit of speed grade {speed_grade}")
+
+        ratio = (Fraction(frequency) / input_frequency_exact).limit_denominator(COUNTER_MAX)
+        if abs(float(ratio) * input_frequency - frequency) / frequency > tolerance:
+            raise PLLConfigurationError(f"ALTPLL output {name} ({frequency / 1e6:g} MHz) can't be "
+                f"derived from {input_frequency / 1e6:g} MHz within {tolerance:.2%}")
+        ratios.append(ratio)
+
+    # ... and then look for internal counter values that produce all of them; preferring a fast VCO,
+    # which gives us the finest phase resolution.
+    best = None
+    for n in range(1, COUNTER_MAX + 1):
+        pfd_frequency = input_frequency_exact / n
+        if pfd_frequency < PFD_RANGE[0]:
+            break
+        if pfd_frequency > PFD_RANGE[1]:
+            continue
+
+        for m in range(1, COUNTER_MAX + 1):
+            vco_frequency = pfd_frequency * m
+            if vco_frequency < VCO_RANGE[0]:
+                continue
+            if vco_frequency > VCO_RANGE[1]:
+                break
+
+            # Each output needs an integer post-scale counter.
+            counters = [vco_frequency / (input_frequency_exact * ratio) for ratio in ratios]
+            if not all(c.denominator == 1 and 1 <= c <= COUNTER_MAX for c in counters):
+                continue
+
+            if best is None or vco_frequency > best[2]:
+                best = (m, n, vco_frequency)
+
+    if best is None:
+        wanted = ", ".join(f"{name}={frequency / 1e6:g} MHz" for name, frequency, _ in requests)
+        raise PLLConfigurationError(f"no legal Cyclone IV PLL configuration generates {wanted} "
+            f"from {input_frequency / 1e6:g} MHz")
+
+    m, n, vco_frequency = best
+
+    generated = []
+    for index, ((name, frequency, phase), ratio) in enumerate(zip(requests, ratios)):
+        actual_frequency = float(input_frequency_exact * ratio)
+        phase_shift      = round(phase / 360 * 1e12 / actual_frequency)
+
+        # The PLL can shift outputs in steps of 1/8th of a VCO period.
+        phase_step_ps = 1e12 / (float(vco_frequency) * 8)
+        actual_phase  = round(phase_shift / phase_step_ps) * phase_step_ps * actual_frequency / 1e12 * 360
+
+        generated.append(ALTPLLOutput(name, index, ratio.numerator, ratio.denominator, phase_shift,
+            actual_frequency, actual_phase % 360, frequency, phase))
+
+    return ALTPLLConfig(input_frequency, m, n, float(vco_frequency), tuple(generated))
+
+
+def altpll_parameters(config, *, inclk, clk, locked=None, reset=None, compensate_clock=None,
+        self_reset_on_loss_lock=False, device_family="Cyclone IV E"):
+    """ Returns the Instance arguments for an ALTPLL implementing the given configuration.
+
+    Every optional port we don't connect is marked ``PORT_UNUSED``.
+
+    Parameters
+    ----------
+    config: ALTPLLConfig
+        The configuration to implement; as returned by :func:`solve_altpll`.
+    inclk:
+        The PLL's input clock.
+    clk:
+        The value driven by the PLL's ``clk`` port; e.g. a ``Cat()`` of the output clocks,
+        in order of their output counters.
+    locked:
+        If provided, the signal driven by the PLL's ``locked`` output.
+    reset:
+        If provided, the signal driving the PLL's asynchronous reset.
+    compensate_clock: str
+        The name of the output whose phase should be compensated; defaults to the first output.
+    self_reset_on_loss_lock: bool
+        If True, the PLL resets itself when it loses lock.
+    device_family: str
+        The Quartus device family being targeted.
+    """
+
+    compensated = config.outputs[0] if compensate_clock is None else config.output(compensate_clock)
+    used_ports  = {"inclk0", *(f"clk{output.index}" for output in config.outputs)}
+
+    parameters = dict(
+        p_bandwidth_type          = "AUTO",
+        p_compensate_clock        = f"CLK{compensated.index}",
+        p_inclk0_input_frequency  = round(1e12 / config.input_frequency),
+        p_intended_device_family  = device_family,
+        p_lpm_type                = "altpll",
+        p_operation_mode          = "NORMAL",
+        p_pll_type                = "AUTO",
+        p_self_reset_on_loss_lock = "ON" if self_reset_on_loss_lock else "OFF",
+        p_width_clock             = OUTPUT_COUNT,
+
+        i_inclk                   = inclk,
+        o_clk                     = clk,
+    )
+
+    for output in config.outputs:
+        parameters[f"p_clk{output.index}_multiply_by"] = output.multiply_by
+        parameters[f"p_clk{output.index}_divide_by"]   = output.divide_by
+        parameters[f"p_clk{output.index}_duty_cycle"]  = 50
+        parameters[f"p_clk{output.index}_phase_shift"] = str(output.phase_shift)
+
+    if locked is not None:
+        parameters["o_locked"] = locked
+        used_ports.add("locked")
+
+    if reset is not None:
+        parameters["i_areset"] = reset
+        used_ports.add("areset")
+
+    for port in OPTIONAL_PORTS:
+        parameters[f"p_port_{port}"] = "PORT_USED" if port in used_ports else "PORT_UNUSED"
+
+    return parameters
+
+
+def evaluate_altpll(parameters, input_frequency):
+    """ Computes the clocks an existing ALTPLL instance produces; e.g. for reporting.
+
+    Parameters
+    ----------
+    parameters: dict
+        The instance's parameters, without their ``p_`` prefixes; in either case.
+    input_frequency: float
+        The frequency of the clock on ``inclk0``, in Hz.
+
+    Returns a tuple of ``(vco_frequency, outputs)``, where ``outputs`` maps each configured bit of
+    the ``clk`` port (e.g. ``clk[2]``) onto the ``(frequency, phase)`` it produces. As Quartus picks
+    the internal counters itself, the VCO frequency is always None.
+    """
+
+    parameters = {name.lower(): value for name, value in parameters.items()}
+
+    outputs = {}
+    for index in range(OUTPUT_COUNT + 1):
+        if f"clk{index}_multiply_by" not in parameters and f"clk{index}_divide_by" not in parameters:
+            continue
+
+        multiply_by = int(parameters.get(f"clk{index}_multiply_by", 1))
+        divide_by   = int(parameters.get(f"clk{index}_divide_by", 1))
+        frequency   = input_frequency * multiply_by / divide_by
+
+        phase_shift = float(parameters.get(f"clk{index}_phase_shift", 0))
+        outputs[f"clk[{index}]"] = (frequency, (phase_shift * 1e-12 * frequency * 360) % 360)
+
+    return None, outputs
@@ -0,0 +1,338 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Configuration solver for the Xilinx 7-series PLLE2 and MMCME2 clock managers.
+
+    >>> config = solve_xilinx_pll(100e6, (("usb", 12e6), ("usb_io", 48e6)), speed_grade=platform.speed)
+    >>> m.submodules.pll = Instance(f"{config.primitive}_ADV", **xilinx_pll_parameters(config,
+    ...     clkin=clk100, feedback=Signal(), locked=locked,
+    ...     clocks={"usb": ClockSignal("usb"), "usb_io": ClockSignal("usb_io")}))
+"""
+
+import functools
+
+from collections import namedtuple
+
+from . import PLLConfigurationError
+
+
+__all__ = ["XilinxPLLOutput", "XilinxPLLConfig", "solve_xilinx_pll", "xilinx_pll_parameters", "evaluate_xilinx_pll"]
+
+
+_Limits = namedtuple("_Limits",
+    ["vco_range", "pfd_range", "output_max", "mult_range", "divclk_max", "output_div_max", "outputs"])
+
+
+# Operating limits for each primitive, by speed grade; from the Artix-7 and Kintex-7 datasheets
+# (DS181, DS182). Higher speed grades widen the VCO and PFD ranges.
+LIMITS = {
+    "PLLE2": {
+        1: _Limits((800e6, 1600e6), (19e6, 450e6), 800e6,  (2, 64), 56,  128, 6),
+        2: _Limits((800e6, 1866e6), (19e6, 500e6), 933e6,  (2, 64), 56,  128, 6),
+        3: _Limits((800e6, 2133e6), (19e6, 550e6), 1066e6, (2, 64), 56,  128, 6),
+    },
+    "MMCME2": {
+        1: _Limits((600e6, 1200e6), (10e6, 450e6), 800e6,  (2, 64), 106, 128, 7),
+        2: _Limits((600e6, 1440e6), (10e6, 500e6), 933e6,  (2, 64), 106, 128, 7),
+        3: _Limits((600e6, 1600e6), (10e6, 550e6), 1066e6, (2, 64), 106, 128, 7),
+    },
+}
+
+# The MMCME2 can multiply (and divide on CLKOUT0) in steps of 1/8th.
+MMCM_FRACTIONAL_STEPS = 8
+
+
+class XilinxPLLOutput(namedtuple("XilinxPLLOutput",
+        ["name", "index", "divide", "frequency", "phase", "requested_frequency", "requested_phase"])):
+    """ A single clock produced by a PLLE2 or MMCME2.
+
+    Attributes
+    ----------
+    name: str
+        The name of the requested clock; typically the LUNA domain it drives.
+    index: int
+        The clock's output index; it's generated on ``CLKOUT<index>``.
+    divide: float
+        The output's divider. Only an MMCME2's CLKOUT0 divider can be fractional.
+    frequency, phase: float
+        The frequency (in Hz) and phase (in degrees) actually produced.
+    requested_frequency, requested_phase: float
+        The frequency and phase that were asked for.
+    """
+
+    @property
+    def error(self):
+        """ The output's frequency error, relative to the requested frequency. """
+        return (self.frequency - self.requested_frequency) / self.requested_frequency
+
+
+class XilinxPLLConfig(namedtuple("XilinxPLLConfig",
+        ["primitive", "input_frequency", "divclk_divide", "clkfbout_mult", "vco_frequency", "outputs"])):
+    """ A complete, legal PLLE2 or MMCME2 configuration; as returned by :func:`solve_xilinx_pll`.
+
+    Attributes
+    ----------
+    primitive: str
+        The clock manager to use: "PLLE2" or "MMCME2".
+    input_frequency: float
+        The frequency of the clock on CLKIN1, in Hz.
+    divclk_divide: int
+        The input divider.
+    clkfbout_mult: float
+        The feedback multiplier; only fractional when using an MMCME2.
+    vco_frequency: float
+        The resulting VCO frequency, in Hz.
+    outputs: tuple of XilinxPLLOutput
+        The generated clocks, in the order they were requested.
+    """
+
+    @property
+    def max_error(self):
+        """ The largest relative frequency error of any output. """
+        return max(abs(output.error) for output in self.outputs)
+
+
+    def output(self, name):
+        """ Returns the XilinxPLLOutput that generates the clock with the given name. """
+        for output in self.outputs:
+            if output.name == name:
+                return output
+
+        raise KeyError(name)
+
+
+def speed_grade_number(speed_grade):
+    """ Converts a platform ``speed`` (e.g. "2", "-1", "1L") into the numeric speed grade. """
+    return int(str(speed_grade).lstrip("-")[0])
+
+
+def _normalize_request(request):
+    """ Converts a (name, frequency[, phase]) request into a (name, frequency, phase) tuple. """
+    name, frequency, *phase = request
+    return name, float(frequency), float(phase[0]) % 360 if phase else 0.0
+
+
+def _closest_divide(vco_frequency, frequency, limits, steps=1):
+    """ Returns the legal output divider that best generates a frequency from the VCO; or None. """
+    smallest = 2 if steps > 1 else 1
+    divide   = min(max(round(vco_frequency / frequency * steps) / steps, smallest), limits.output_div_max)
+    if vco_frequency / divide > limits.output_max:
+        return None
+    return divide
+
+
+def _solve(primitive, input_frequency, requests, speed_grade):
+    """ Finds the best configuration for a single primitive; returning (error, config) or None. """
+
+    limits     = LIMITS[primitive][speed_grade]
+    fractional = (primitive == "MMCME2")
+    steps      = MMCM_FRACTIONAL_STEPS if fractional else 1
+
+    if len(requests) > limits.outputs:
+        return None
+
+    # On an MMCME2, only CLKOUT0 has a fractional divider; so we try placing each request there.
+    if fractional:
+        orderings = [(i,) + tuple(j for j in range(len(requests)) if j != i) for i in range(len(requests))]
+    else:
+        orderings = [tuple(range(len(requests)))]
+
+    mult_low, mult_high = limits.mult_range
+
+    best, best_key = None, None
+    for divclk_divide in range(1, limits.divclk_max + 1):
+        pfd_frequency = input_frequency / divclk_divide
+        if pfd_frequency < limits.pfd_range[0]:
+            break
+        if pfd_frequency > limits.pfd_range[1]:
+            continue
+
+        for mult_steps in range(mult_low * steps, mult_high * steps + 1):
+            clkfbout_mult = mult_steps / steps
+            vco_frequency = pfd_frequency * clkfbout_mult
+            if vco_frequency < limits.vco_range[0]:
+                continue
+            if vco_frequency > limits.vco_range[1]:
+                break
+
+            for ordering in orderings:
+                divides = []
+                for position, request_index in enumerate(ordering):
+                    frequency = requests[request_index][1]
+                    divide    = _closest_divide(vco_frequency, frequency, limits,
+                        steps if position == 0 else 1)
+                    if divide is None:
+                        break
+                    divides.append(divide)
+                else:
+                    error = max(abs(vco_frequency / d - requests[i][1]) / requests[i][1]
+                        for d, i in zip(divides, ordering))
+
+                    # Prefer exact results; then a fast VCO; then integer multipliers.
+                    key = (error, -vco_frequency, clkfbout_mult != int(clkfbout_mult), divclk_divide)
+                    if best_key is None or key < best_key:
+                        best_key = key
+                        best     = (divclk_divide, clkfbout_mult, vco_frequency, ordering, divides)
+
+    if best is None:
+        return None
+
+    divclk_divide, clkfbout_mult, vco_frequency, ordering, divides = best
+
+    generated = [None] * len(requests)
+    for index, (request_index, divide) in enumerate(zip(ordering, divides)):
+        name, frequency, phase = requests[request_index]
+
+        # Output phases can be adjusted in steps of 1/8th of a VCO period.
+        phase_step   = 45 / divide
+        actual_phase = (round(phase / phase_step) * phase_step) % 360
+
+        generated[request_index] = XilinxPLLOutput(name, index, divide if fractional and index == 0 else int(divide),
+            vco_frequency / divide, actual_phase, frequency, phase)
+
+    config = XilinxPLLConfig(primitive, input_frequency, divclk_divide,
+        clkfbout_mult if fractional else int(clkfbout_mult), vco_frequency, tuple(generated))
+    return best_key[0], config
+
+
+@functools.lru_cache(maxsize=None)
+def solve_xilinx_pll(input_frequency, outputs, *, speed_grade=1, primitive=None, tolerance=1e-3):
+    """ Finds a PLLE2 or MMCME2 configuration that generates a set of clocks from a single input.
+
+    A PLLE2 is used whenever one can generate the requested clocks within ``tolerance``; otherwise,
+    we fall back to an MMCME2, whose fractional multiplier and CLKOUT0 divider can often do better.
+    Among equally accurate configurations, the one with the highest VCO frequency is chosen.
+    Results are memoized.
+
+    Parameters
+    ----------
+    input_frequency: float
+        The frequency of the clock provided on CLKIN1, in Hz.
+    outputs: tuple
+        A tuple of ``(name, frequency)`` or ``(name, frequency, phase)`` requests; one per clock
+        to be generated. Frequencies are in Hz; phases are in degrees.
+    speed_grade: int or str
+        The device's speed grade; typically ``platform.speed``. This determines the VCO and PFD limits.
+    primitive: str
+        If provided, forces the use of either "PLLE2" or "MMCME2".
+    tolerance: float
+        The largest relative frequency error acceptable on any output.
+
+    Raises PLLConfigurationError if no legal configuration meets the given tolerance.
+    """
+
+    requests    = tuple(_normalize_request(request) for request in outputs)
+    speed_grade = speed_grade_number(speed_grade)
+    primitives  = [primitive] if primitive else ["PLLE2", "MMCME2"]
+
+    if not requests:
+        raise PLLConfigurationError("a 7-series clock manager must generate at least one clock")
+    if len({name for name, _, _ in requests}) != len(requests):
+        raise PLLConfigurationError("7-series clock manager output names must be unique")
+    if speed_grade not in LIMITS["PLLE2"]:
+        raise PLLConfigurationError(f"unsupported 7-series speed grade {speed_grade}")
+    for candidate in primitives:
+        if candidate not in LIMITS:
+            raise PLLConfigurationError(f"unknown 7-series clock manager {candidate!r}")
+
+    for candidate in primitives:
+        result = _solve(candidate, input_frequency, requests, speed_grade)
+        if result is not None and result[0] <= tolerance:
+            return result[1]
+
+    wanted = ", ".join(f"{name}={frequency / 1e6:g} MHz" for name, frequency, _ in requests)
+    raise PLLConfigurationError(f"no {' or '.join(primitives)} configuration generates {wanted} "
+        f"from {input_frequency / 1e6:g} MHz within {tolerance:.2%} (speed grade -{speed_grade})")
+
+
+def xilinx_pll_parameters(config, *, clkin, clocks, locked, feedback, reset=None, variant="ADV"):
+    """ Returns the Instance arguments for a clock manager implementing the given configuration.
+
+    The primitive to instantiate is ``f"{config.primitive}_{variant}"``.
+
+    Parameters
+    ----------
+    config: XilinxPLLConfig
+        The configuration to implement; as returned by :func:`solve_xilinx_pll`.
+    clkin:
+        The clock manager's input clock.
+    clocks: dict
+        Maps each requested clock's name to the signal it should drive.
+    locked:
+        The signal driven by the clock manager's LOCKED output.
+    feedback:
+        A signal used to route CLKFBOUT back to CLKFBIN.
+    reset:
+        If provided, the signal that resets the clock manager.
+    variant: str
+        The primitive variant being instantiated: "ADV" or "BASE".
+    """
+
+    mmcm = (config.primitive == "MMCME2")
+
+    parameters = dict(
+        p_BANDWIDTH            = "OPTIMIZED",
+        p_STARTUP_WAIT         = "FALSE",
+        p_REF_JITTER1          = 0.01,
+        p_CLKIN1_PERIOD        = round(1e9 / config.input_frequency, 3),
+        p_DIVCLK_DIVIDE        = config.divclk_divide,
+        p_CLKFBOUT_PHASE       = 0.000,
+
+        i_CLKIN1               = clkin,
+        i_CLKFBIN              = feedback,
+        o_CLKFBOUT             = feedback,
+        o_LOCKED               = locked,
+        i_RST                  = 0 if reset is None else reset,
+    )
+
+    if variant == "ADV":
+        parameters["p_COMPENSATION"] = "ZHOLD"
+
+    if mmcm:
+        parameters["p_CLKFBOUT_MULT_F"] = float(config.clkfbout_mult)
+    else:
+        parameters["p_CLKFBOUT_MULT"]   = config.clkfbout_mult
+
+    for output in config.outputs:
+        if mmcm and output.index == 0:
+            parameters["p_CLKOUT0_DIVIDE_F"] = float(output.divide)
+        else:
+            parameters[f"p_CLKOUT{output.index}_DIVIDE"] = output.divide
+
+        parameters[f"p_CLKOUT{output.index}_PHASE"]      = round(output.phase, 3)
+        parameters[f"p_CLKOUT{output.index}_DUTY_CYCLE"] = 0.500
+        parameters[f"o_CLKOUT{output.index}"]            = clocks[output.name]
+
+    return parameters
+
+
+def evaluate_xilinx_pll(parameters, input_frequency):
+    """ Computes the clocks an existing PLLE2 or MMCME2 instance produces; e.g. for reporting.
+
+    Parameters
+    ----------
+    parameters: dict
+        The instance's parameters, without their ``p_`` prefixes.
+    input_frequency: float
+        The frequency of the clock on CLKIN1, in Hz.
+
+    Returns a tuple of ``(vco_frequency, outputs)``, where ``outputs`` maps each configured
+    ``CLKOUT<n>`` port onto the ``(frequency, phase)`` it produces.
+    """
+
+    multiplier    = float(parameters.get("CLKFBOUT_MULT_F", parameters.get("CLKFBOUT_MULT", 5)))
+    vco_frequency = input_frequency * multiplier / int(parameters.get("DIVCLK_DIVIDE", 1))
+
+    outputs = {}
+    for index in range(7):
+        divide = parameters.get(f"CLKOUT{index}_DIVIDE_F", parameters.get(f"CLKOUT{index}_DIVIDE"))
+        if divide is None:
+            continue
+
+        phase = float(parameters.get(f"CLKOUT{index}_PHASE", 0))
+        outputs[f"CLKOUT{index}"] = (vco_frequency / float(divide), phase % 360)
+
+    return vco_frequency, outputs
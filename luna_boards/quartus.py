@@ -0,0 +1,170 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Quartus build profiles for the luna_boards Intel platforms.
+
+Each build uses a profile; a set of Quartus settings that trades compile time against fmax. The profile
+is selected with ``LUNA_QUARTUS_PROFILE``:
+
+    > LUNA_QUARTUS_PROFILE=fast python my_design.py
+
+    default -- the settings these boards have always used
+    fast    -- the quickest compiles; for iterating on a design
+    fmax    -- the most effort towards timing closure; for release builds
+
+The ``fast`` profile also turns on smart recompilation and incremental compilation. The design's USB I/O
+blocks -- the parts of the hierarchy that match the platform's ``quartus_partitions`` patterns -- are
+each placed in a design partition whose placement and routing are preserved; and everything else is
+left in the top-level (user logic) partition, which is recompiled from source. Since Quartus keeps
+its database in the build directory, reuse the same build directory between builds to benefit.
+Incremental compilation needs a Quartus edition that supports design partitions.
+
+Quartus uses every processor it can find by default; set ``LUNA_QUARTUS_THREADS`` to limit it. Any
+settings given in the ``add_settings`` override are applied after the profile's, and take precedence.
+"""
+
+import os
+import fnmatch
+import logging
+
+from collections import namedtuple
+
+
+__all__ = ["QuartusProfile", "QUARTUS_PROFILES", "QuartusProfileMixin", "quartus_profile_overrides"]
+
+
+class QuartusProfile(namedtuple("QuartusProfile", ["settings", "incremental"])):
+    """ A set of Quartus settings, and whether builds should be incremental.
+
+    Parameters
+    ----------
+    settings: dict
+        A mapping of global assignment names onto their values.
+    incremental: bool
+        True iff smart recompilation and incremental compilation should be used.
+    """
+
+
+QUARTUS_PROFILES = {
+    "default": QuartusProfile(incremental=False, settings={
+        "OPTIMIZATION_MODE":                         '"Aggressive Performance"',
+        "FITTER_EFFORT":                             '"Standard Fit"',
+        "PHYSICAL_SYNTHESIS_EFFORT":                 '"Extra"',
+    }),
+    "fast": QuartusProfile(incremental=True, settings={
+        "OPTIMIZATION_MODE":                         '"Balanced"',
+        "FITTER_EFFORT":                             '"Fast Fit"',
+        "PHYSICAL_SYNTHESIS_EFFORT":                 '"Fast"',
+    }),
+    "fmax": QuartusProfile(incremental=False, settings={
+        "OPTIMIZATION_MODE":                         '"Aggressive Performance"',
+        "FITTER_EFFORT":                             '"Standard Fit"',
+        "PHYSICAL_SYNTHESIS_EFFORT":                 '"Extra"',
+        "PHYSICAL_SYNTHESIS_COMBO_LOGIC":            "ON",
+        "PHYSICAL_SYNTHESIS_REGISTER_DUPLICATION":   "ON",
+        "PHYSICAL_SYNTHESIS_REGISTER_RETIMING":      "ON",
+        "ROUTER_TIMING_OPTIMIZATION_LEVEL":          "MAXIMUM",
+    }),
+}
+
+
+def _hierarchy(fragment, path=()):
+    """ Yields the hierarchical path of each subfragment of a fragment, parents first. """
+    # Newer versions of Amaranth also record where each subfragment was added.
+    for entry in fragment.subfragments:
+        subfragment, name = entry[0], entry[1]
+        if name is None:
+            continue
+        yield path + (name,)
+        yield from _hierarchy(subfragment, path + (name,))
+
+
+def _partitions(fragment, patterns):
+    """ Returns a mapping of partition names onto the hierarchy paths that should be partitioned.
+
+    Each partition covers the outermost parts of the hierarchy whose name matches one of its patterns;
+    the I/O buffers the platform adds (``pin_*``) are left alone.
+    """
+
+    partitions = {}
+    for partition, partition_patterns in patterns.items():
+        matches = []
+        for path in _hierarchy(fragment):
+            if path[0].startswith("pin_") or any(path[:len(match)] == match for match in matches):
+                continue
+            if any(fnmatch.fnmatchcase(path[-1], pattern) for pattern in partition_patterns):
+                matches.append(path)
+
+        # Each partition must be a single instance; so number them if we matched several.
+        for index, path in enumerate(matches):
+            name = partition if len(matches) == 1 else f"{partition}_{index}"
+            partitions[name] = path
+
+    return partitions
+
+
+def quartus_profile_overrides(platform, fragment, overrides):
+    """ Adds the selected Quartus profile's settings to a build's overrides.
+
+    Parameters
+    ----------
+    platform:
+        The platform being built for.
+    fragment: Fragment
+        The elaborated design, as passed to ``toolchain_prepare``.
+    overrides: dict
+        The overrides that will be passed to ``toolchain_prepare``.
+
+    Returns the overrides to use instead.
+    """
+
+    profile_name = os.environ.get("LUNA_QUARTUS_PROFILE", "default")
+    try:
+        profile = QUARTUS_PROFILES[profile_name]
+    except KeyError:
+        raise ValueError(f"unknown Quartus profile '{profile_name}'; "
+            f"expected one of: {', '.join(QUARTUS_PROFILES)}") from None
+
+    settings = {
+        **profile.settings,
+        "NUM_PARALLEL_PROCESSORS": os.environ.get("LUNA_QUARTUS_THREADS") or "ALL",
+    }
+    lines = [f"set_global_assignment -name {name} {value}" for name, value in settings.items()]
+
+    if profile.incremental:
+        lines += [
+            "set_global_assignment -name SMART_RECOMPILE ON",
+            "set_global_assignment -name INCREMENTAL_COMPILATION FULL_INCREMENTAL_COMPILATION",
+        ]
+
+        # Preserve the placement and routing of our I/O blocks; and recompile everything else.
+        partitions = _partitions(fragment, getattr(platform, "quartus_partitions", {}))
+        for partition, path in partitions.items():
+            lines += [
+                f'set_instance_assignment -name PARTITION_HIERARCHY {partition} -to "{"|".join(path)}" -section_id {partition}',
+                f"set_global_assignment -name PARTITION_NETLIST_TYPE POST_FIT -section_id {partition}",
+                f"set_global_assignment -name PARTITION_FITTER_PRESERVATION_LEVEL PLACEMENT_AND_ROUTING -section_id {partition}",
+            ]
+        if partitions:
+            logging.info(f"Partitioning {', '.join('|'.join(path) for path in partitions.values())} for incremental compilation.")
+
+    # Anything explicitly requested -- as a keyword argument or environment variable -- comes last, so it wins.
+    existing = overrides.get("add_settings", os.environ.get("AMARANTH_add_settings"))
+    return {**overrides, "add_settings": "\n".join(filter(None, ["\n".join(lines), existing]))}
+
+
+class QuartusProfileMixin:
+    """ Platform mixin that applies the Quartus profile selected by ``LUNA_QUARTUS_PROFILE``.
+
+    Platforms can set ``quartus_partitions`` to a mapping of partition names onto the hierarchy
+    name patterns to be placed in each; these are used by incremental profiles.
+    """
+
+    quartus_partitions = {}
+
+    def toolchain_prepare(self, fragment, name, **kwargs):
+        kwargs = quartus_profile_overrides(self, fragment, kwargs)
+        return super().toolchain_prepare(fragment, name, **kwargs)
@@ -0,0 +1,165 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Import-free registry of the platforms provided by luna_boards.
+
+Every board module pulls in Amaranth, amaranth-boards and LUNA gateware when it's imported,
+which is slow. This registry describes each platform statically, so boards can be listed and
+looked up without importing any of them; the platform class itself is only imported when it's
+first requested:
+
+    >>> from luna_boards import get_platform
+    >>> platform = get_platform("ULX3S_85F_Platform")()
+"""
+
+import importlib
+import functools
+
+from collections import namedtuple
+
+
+__all__ = ["PlatformInfo", "PLATFORMS", "list_platforms", "get_platform_info", "get_platform"]
+
+
+class PlatformInfo(namedtuple("PlatformInfo",
+        ["name", "path", "family", "device", "package", "toolchain", "default_usb_connection"])):
+    """ Static description of a luna_boards platform.
+
+    Attributes
+    ----------
+    name: str
+        The platform's human-readable name, as exposed in its ``name`` attribute.
+    path: str
+        The platform's location, in the ``module:Class`` form used by ``LUNA_PLATFORM``.
+    family: str
+        The FPGA family targeted: one of "ecp5", "ice40", "xc7", "spartan6" or "cyclone4".
+    device: str
+        The FPGA device targeted by the platform.
+    package: str
+        The FPGA package targeted by the platform.
+    toolchain: str
+        The Amaranth toolchain used to build for the platform by default.
+    default_usb_connection: str
+        The name of the resource used for USB2 by default; or None if the platform has none.
+    """
+
+    @property
+    def module_name(self):
+        return self.path.split(":")[0]
+
+    @property
+    def class_name(self):
+        return self.path.split(":")[1]
+
+
+def _platform(path, name, family, device, package, default_usb_connection):
+    toolchain = {
+        "ecp5":     "Trellis",
+        "ice40":    "IceStorm",
+        "xc7":      "Vivado",
+        "spartan6": "ISE",
+        "cyclone4": "Quartus",
+    }[family]
+
+    return PlatformInfo(name, path, family, device, package, toolchain, default_usb_connection)
+
+
+#: All platforms provided by luna_boards, keyed by class name.
+PLATFORMS = {info.class_name: info for info in [
+    _platform("luna_boards.amalthea:AmaltheaPlatformRev0D1",    "Amalthea r0.1",
+        "ecp5", "LFE5U-12F", "BG256", "host_phy"),
+    _platform("luna_boards.arty_a7:ArtyA7Platform",             "Arty A7",
+        "xc7", "xc7a35ti", "csg324", "usb_pmod_b"),
+    _platform("luna_boards.daisho:DaishoPlatform",              "Daisho",
+        "cyclone4", "EP4CE30", "F29", "ulpi"),
+    _platform("luna_boards.de0_nano:DE0NanoPlatform",           "de0_nano",
+        "cyclone4", "EP4CE22", "F17", "ulpi"),
+    _platform("luna_boards.ecpix5:ECPIX5_45F_Platform",         "ECPIX-5 (45F)",
+        "ecp5", "LFE5UM5G-45F", "BG554", "ulpi"),
+    _platform("luna_boards.ecpix5:ECPIX5_85F_Platform",         "ECPIX-5 (85F)",
+        "ecp5", "LFE5UM5G-85F", "BG554", "ulpi"),
+    _platform("luna_boards.fomu:FomuHackerPlatform",            "Fomu Hacker",
+        "ice40", "iCE40UP5K", "UWG30", "usb"),
+    _platform("luna_boards.fomu:FomuPVT",                       "Fomu PVT/Production",
+        "ice40", "iCE40UP5K", "UWG30", "usb"),
+    _platform("luna_boards.fomu:FomuEVTPlatform",               "Fomu EVT",
+        "ice40", "iCE40UP5K", "SG48", "usb"),
+    _platform("luna_boards.genesys2:Genesys2Platform",          "Genesys2",
+        "xc7", "xc7k325t", "ffg900", "usb"),
+    _platform("luna_boards.hackaday:Supercon19BadgePlatform",   "HAD Supercon 2019 Badge",
+        "ecp5", "LFE5U-45F", "BG381", "usb"),
+    _platform("luna_boards.icebreaker:IceBreakerPlatform",      "iCEBreaker",
+        "ice40", "iCE40UP5K", "SG48", "usb_pmod_1a"),
+    _platform("luna_boards.icebreaker:IceBreakerBitsyPlatform", "iCEBreaker Bitsy",
+        "ice40", "iCE40UP5K", "SG48", "usb"),
+    _platform("luna_boards.lambdaconcept:USB2SnifferPlatform",  "LambdaConcept USB2Sniffer",
+        "xc7", "xc7a35t", "fgg484", "target_phy"),
+    _platform("luna_boards.lambdaconcept:ECPIX5PlatformRev02",  "ECPIX-5 R02",
+        "ecp5", "LFE5UM5G-85F", "BG554", "ulpi"),
+    _platform("luna_boards.logicbone:LogicbonePlatform",        "Logicbone",
+        "ecp5", "LFE5UM5G-45F", "BG381", "usb"),
+    _platform("luna_boards.logicbone:Logicbone85FPlatform",     "Logicbone (85F)",
+        "ecp5", "LFE5UM5G-85F", "BG381", "usb"),
+    _platform("luna_boards.netv2:NeTV2Platform",                "NeTV2",
+        "xc7", "xc7a35t", "fgg484", "usb"),
+    _platform("luna_boards.nexys_video:NexysVideoPlatform",     "Nexys Video",
+        "xc7", "xc7a200t", "sbg484", "usb"),
+    _platform("luna_boards.openvizsla:OpenVizslaPlatform",      "OpenVizsla",
+        "spartan6", "xc6slx9", "tqg144", "target_phy"),
+    _platform("luna_boards.orangecrab:OrangeCrabPlatformR0D1",  "OrangeCrab r0.1",
+        "ecp5", "LFE5U-25F", "MG285", "usb"),
+    _platform("luna_boards.orangecrab:OrangeCrabPlatformR0D2",  "OrangeCrab r0.2",
+        "ecp5", "LFE5U-25F", "MG285", "usb"),
+    _platform("luna_boards.tinyfpga:TinyFPGABxPlatform",        "TinyFPGA Bx",
+        "ice40", "iCE40LP8K", "CM81", "usb"),
+    _platform("luna_boards.ulx3s:ULX3S_12F_Platform",           "ULX3S (12F)",
+        "ecp5", "LFE5U-12F", "BG381", "usb"),
+    _platform("luna_boards.ulx3s:ULX3S_25F_Platform",           "ULX3S (25F)",
+        "ecp5", "LFE5U-25F", "BG381", "usb"),
+    _platform("luna_boards.ulx3s:ULX3S_45F_Platform",           "ULX3S (45F)",
+        "ecp5", "LFE5U-45F", "BG381", "usb"),
+    _platform("luna_boards.ulx3s:ULX3S_85F_Platform",           "ULX3S (85F)",
+        "ecp5", "LFE5U-85F", "BG381", "usb"),
+    _platform("luna_boards.versa:ECP5Versa_5G_Platform",        "ECP5 Versa 5G",
+        "ecp5", "LFE5UM5G-45F", "BG381", None),
+]}
+
+
+def list_platforms(family=None):
+    """ Returns the PlatformInfo for every registered platform; optionally restricted to one FPGA family. """
+    return [info for info in PLATFORMS.values() if family is None or info.family == family]
+
+
+def get_platform_info(spec):
+    """ Looks up a platform's PlatformInfo without importing it.
+
+    Parameters
+    ----------
+    spec: str
+        A platform class name (``ULX3S_85F_Platform``), a ``LUNA_PLATFORM``-style path
+        (``luna_boards.ulx3s:ULX3S_85F_Platform``), or a platform's human-readable name
+        (``ULX3S (85F)``).
+    """
+
+    if spec in PLATFORMS:
+        return PLATFORMS[spec]
+
+    for info in PLATFORMS.values():
+        if spec in (info.path, info.name):
+            return info
+
+    raise KeyError(f"no luna_boards platform matches {spec!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def get_platform(spec):
+    """ Returns the platform class described by ``spec``; importing its board module on first use.
+
+    Accepts any of the forms understood by :func:`get_platform_info`.
+    """
+    info = get_platform_info(spec)
+    module = importlib.import_module(info.module_name)
+    return getattr(module, info.class_name)
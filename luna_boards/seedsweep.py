@@ -0,0 +1,176 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" nextpnr seed sweeps for the luna_boards ECP5 and iCE40 platforms.
+
+nextpnr's placement is seeded; and on designs with marginal timing -- such as the 240 MHz ``fast``
+domain of our USB3 designs -- whether a build meets timing can come down to the seed. When
+``LUNA_NEXTPNR_SEEDS`` is set, builds for the ECP5 and iCE40 platforms instead run that many seeds
+in parallel, and keep the bitstream with the best worst-case slack:
+
+    > LUNA_NEXTPNR_SEEDS=8 python my_design.py
+
+Each seed is built in its own ``seed-<n>`` subdirectory of the build directory. If ``LUNA_BUILD_CACHE``
+is also set, the winning seed is recorded in the build cache; later builds of the same design use
+that seed directly, rather than sweeping again.
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .buildcache import BuildCache, toolchain_versions
+from .timing     import parse_nextpnr_log
+
+
+__all__ = ["NextpnrSeedSweepMixin", "seed_sweep_build_plan"]
+
+
+def _nextpnr_tool(platform):
+    """ Returns the name of the nextpnr executable a platform's toolchain uses; or None. """
+    for tool in getattr(platform, "required_tools", ()):
+        if tool.startswith("nextpnr"):
+            return tool
+    return None
+
+
+def _worst_slack(build_dir, name):
+    """ Returns the worst slack of any clock in a completed nextpnr build; or None if it's unknown. """
+    try:
+        clocks = parse_nextpnr_log(os.path.join(build_dir, f"{name}.tim"))
+    except OSError:
+        return None
+
+    slacks = [clock.slack for clock in clocks if clock.slack is not None]
+    return min(slacks) if slacks else None
+
+
+def seed_sweep_build_plan(platform, plan, name, prepare, options=None):
+    """ Wraps a BuildPlan so that executing it locally sweeps nextpnr seeds, as ``LUNA_NEXTPNR_SEEDS`` requests.
+
+    Returns the plan unchanged if no sweep is requested, or if the platform doesn't use nextpnr.
+
+    Parameters
+    ----------
+    platform:
+        The platform the plan was prepared by.
+    plan: BuildPlan
+        The plan returned by the platform's ``toolchain_prepare``.
+    name: str
+        The name of the design being built.
+    prepare: callable
+        Prepares the build again, returning a new BuildPlan; called once per seed.
+    options: str or list of str, optional
+        The ``nextpnr_opts`` override the plan was prepared with, if any.
+    """
+
+    seeds = int(os.environ.get("LUNA_NEXTPNR_SEEDS", 0) or 0)
+    tool  = _nextpnr_tool(platform)
+    if seeds < 1 or tool is None:
+        return plan
+
+    from amaranth.build.run import BuildPlan, LocalBuildProducts
+
+    # Amaranth renders its nextpnr options into the build script; so each seed gets a plan of its own,
+    # prepared with the seed added to its ``nextpnr_opts``. As in Amaranth, the environment's options
+    # take precedence over the platform's.
+    if not isinstance(options, (str, type(None))):
+        options = " ".join(options)
+    options = os.environ.get("AMARANTH_nextpnr_opts", options)
+
+    def prepare_seed(seed):
+        """ Prepares the build with the given nextpnr seed. """
+
+        environment = dict(os.environ)
+        os.environ["AMARANTH_nextpnr_opts"] = " ".join(filter(None, [options, f"--seed {seed}"]))
+        try:
+            return prepare()
+        finally:
+            os.environ.clear()
+            os.environ.update(environment)
+
+
+    def run_seed(root, seed, seeded_plan):
+        """ Extracts and runs a seed's build in its own directory. """
+
+        build_dir = os.path.join(root, f"seed-{seed}")
+        seeded_plan.execute_local(build_dir, run_script=False)
+
+        if sys.platform.startswith("win32"):
+            command = ["cmd", "/c", f"call {seeded_plan.script}.bat"]
+        else:
+            command = ["sh", f"{seeded_plan.script}.sh"]
+
+        with open(os.path.join(build_dir, f"{name}-seed.log"), "w") as log:
+            result = subprocess.run(command, cwd=build_dir, stdout=log, stderr=subprocess.STDOUT)
+
+        return seed, build_dir, result.returncode, _worst_slack(build_dir, name)
+
+
+    class SeedSweepBuildPlan(BuildPlan):
+        """ A BuildPlan that builds with several nextpnr seeds, and keeps the one with the best timing. """
+
+        def execute_local(self, root="build", *, run_script=True, **kwargs):
+            if not run_script:
+                return plan.execute_local(root, run_script=run_script, **kwargs)
+
+            # If we've swept this design before, just use the seed that won.
+            cache = key = None
+            if os.environ.get("LUNA_BUILD_CACHE"):
+                cache = BuildCache(os.environ["LUNA_BUILD_CACHE"])
+                key   = cache.key(self, name, versions=toolchain_versions(platform))
+                known = cache.load_seed(key)
+                if known is not None:
+                    logging.info(f"Building '{name}' with nextpnr seed {known}, which was best last time.")
+                    candidates = [known]
+                else:
+                    candidates = list(range(1, seeds + 1))
+            else:
+                candidates = list(range(1, seeds + 1))
+
+            os.makedirs(root, exist_ok=True)
+            seeded_plans = [prepare_seed(seed) for seed in candidates]
+            with ThreadPoolExecutor(min(len(candidates), os.cpu_count() or 1)) as executor:
+                results = list(executor.map(lambda args: run_seed(root, *args), zip(candidates, seeded_plans)))
+
+            succeeded = [result for result in results if result[2] == 0]
+            if not succeeded:
+                seed, build_dir, returncode, _ = results[0]
+                raise subprocess.CalledProcessError(returncode, f"{plan.script} (seed {seed}; see {build_dir})")
+
+            # Prefer the seed with the best worst-case slack; falling back to the first that built.
+            timed = [result for result in succeeded if result[3] is not None]
+            seed, build_dir, _, slack = max(timed, key=lambda result: result[3]) if timed else succeeded[0]
+
+            with open(os.path.join(root, f"{name}.seeds.json"), "w") as f:
+                json.dump([{"seed": seed, "exit_status": returncode, "worst_slack": worst_slack}
+                    for seed, _, returncode, worst_slack in results], f, indent=2)
+            logging.info(f"nextpnr seed {seed} gave '{name}' the best worst-case slack ({slack} ns).")
+
+            # Promote the winning build into the build directory itself.
+            shutil.copytree(build_dir, root, dirs_exist_ok=True)
+            if cache is not None and slack is not None:
+                cache.store_seed(key, seed, slack)
+
+            return LocalBuildProducts(os.path.abspath(root))
+
+    swept = SeedSweepBuildPlan(plan.script)
+    swept.files = plan.files
+    return swept
+
+
+class NextpnrSeedSweepMixin:
+    """ Platform mixin that sweeps nextpnr seeds when ``LUNA_NEXTPNR_SEEDS`` is set. """
+
+    def toolchain_prepare(self, fragment, name, **kwargs):
+        plan    = super().toolchain_prepare(fragment, name, **kwargs)
+        prepare = lambda: super(NextpnrSeedSweepMixin, self).toolchain_prepare(fragment, name, **kwargs)
+        return seed_sweep_build_plan(self, plan, name, prepare, kwargs.get("nextpnr_opts"))
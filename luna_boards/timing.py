@@ -0,0 +1,413 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Unified timing reports for luna_boards builds.
+
+After a build, the timing results of whichever toolchain ran -- nextpnr's log, Vivado's
+``report_timing_summary`` output, or Quartus' STA report -- are parsed, and each clock is mapped back
+onto the LUNA clock domain it drives. Given the platform that was built for, each domain's achieved
+fmax and slack are shown next to the frequency its domain generator configured:
+
+    > python -m luna_boards.timing build/ --platform ECPIX5_85F_Platform
+    > python -m luna_boards.timing build/ --platform ECPIX5_85F_Platform --clock-frequency fast=250
+
+Parsing build outputs requires only the standard library; finding each domain's configured
+frequency elaborates the platform's domain generator, which requires Amaranth, amaranth-boards and LUNA.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+
+from collections import namedtuple
+
+
+__all__ = ["ClockTiming", "DomainTiming", "parse_nextpnr_log", "parse_vivado_timing_summary",
+    "parse_quartus_sta_report", "timing_report", "format_timing_report"]
+
+
+#: The timing outputs produced by each toolchain's Amaranth build script; in order of preference.
+TIMING_REPORTS = [
+    # (filename,               parser name)
+    ("{name}_timing.rpt",      "parse_vivado_timing_summary"),
+    ("{name}.sta.rpt",         "parse_quartus_sta_report"),
+    ("{name}.tim",             "parse_nextpnr_log"),
+]
+
+
+class ClockTiming(namedtuple("ClockTiming", ["clock", "target_frequency", "achieved_frequency", "slack"])):
+    """ The timing of a single clock, as reported by a toolchain.
+
+    Attributes
+    ----------
+    clock: str
+        The clock's name, as the toolchain reports it.
+    target_frequency: float
+        The frequency the clock was constrained to, in Hz; or None if it isn't known.
+    achieved_frequency: float
+        The highest frequency the clock's paths can run at, in Hz; or None if it has no timed paths.
+    slack: float
+        The worst setup slack of the clock's paths, in ns; or None if it isn't known.
+    """
+
+
+class DomainTiming(namedtuple("DomainTiming",
+        ["domain", "clock", "configured_frequency", "target_frequency", "achieved_frequency", "slack"])):
+    """ The timing of a single clock domain.
+
+    Attributes
+    ----------
+    domain: str
+        The LUNA domain the clock drives; or None if it couldn't be identified.
+    clock: str
+        The clock's name, as the toolchain reports it.
+    configured_frequency: float
+        The frequency the platform's domain generator configured for the domain, in Hz; or None.
+    target_frequency, achieved_frequency, slack:
+        As in :class:`ClockTiming`.
+    """
+
+    @property
+    def headroom(self):
+        """ How much faster than its configured (or constrained) frequency the domain could run; e.g. 0.2 for 20%. """
+        frequency = self.configured_frequency or self.target_frequency
+        if not frequency or not self.achieved_frequency:
+            return None
+        return self.achieved_frequency / frequency - 1
+
+
+    @property
+    def passed(self):
+        """ True iff the domain meets timing; or None if that isn't known. """
+        if self.slack is not None:
+            return self.slack >= 0
+        if self.achieved_frequency and (self.configured_frequency or self.target_frequency):
+            return self.headroom >= 0
+        return None
+
+
+TimingReport = namedtuple("TimingReport", ["source", "domains"])
+
+
+def _read(path):
+    with open(path, errors="replace") as f:
+        return f.read()
+
+
+#
+# Toolchain report parsers.
+#
+
+NEXTPNR_FMAX = re.compile(
+    r"Max frequency for clock\s+'(?P<clock>[^']+)':\s+(?P<fmax>[\d.]+) MHz\s+\((?P<status>PASS|FAIL) at (?P<target>[\d.]+) MHz\)")
+
+
+def parse_nextpnr_log(path):
+    """ Parses the clock summaries in a nextpnr log; returning a list of ClockTiming.
+
+    nextpnr reports each clock's fmax both before and after routing; the last (post-route) figures are used.
+    """
+
+    clocks = {}
+    for match in NEXTPNR_FMAX.finditer(_read(path)):
+        fmax, target = float(match.group("fmax")) * 1e6, float(match.group("target")) * 1e6
+        slack = 1e9 / target - 1e9 / fmax
+        clocks[match.group("clock")] = ClockTiming(match.group("clock"), target, fmax, slack)
+
+    return list(clocks.values())
+
+
+def _vivado_table(report, title):
+    """ Returns the header and rows of a table in a Vivado report section; or (None, []). """
+
+    lines = report.splitlines()
+    for index, line in enumerate(lines):
+        if line.strip() == f"| {title}":
+            break
+    else:
+        return None, []
+
+    # Skip to the table's header, which is underlined column-by-column; unlike the section's banner.
+    def underline(line):
+        return line.lstrip().startswith("-----") and " " in line.strip()
+
+    index += 1
+    while index + 1 < len(lines) and not underline(lines[index + 1]):
+        index += 1
+    if index + 1 >= len(lines):
+        return None, []
+
+    header = lines[index]
+    rows   = []
+    for line in lines[index + 2:]:
+        if not line.strip():
+            break
+        rows.append(line)
+
+    return header, rows
+
+
+def _vivado_column(header, row, column):
+    """ Extracts a right-aligned column from a row of a Vivado table; or returns None if it's empty.
+
+    Values are aligned to the right edge of their column's name, and can be empty; so they're
+    extracted by position. The first column (the row's name) is skipped.
+    """
+
+    name  = row.split()[0]
+    row   = row.replace(name, " " * len(name), 1)
+
+    start = len(header[:header.index(column)].rstrip())
+    end   = header.index(column) + len(column)
+    value = row[start:end].strip()
+    return float(value) if value else None
+
+
+def parse_vivado_timing_summary(path):
+    """ Parses the output of Vivado's ``report_timing_summary``; returning a list of ClockTiming. """
+
+    report = _read(path)
+
+    periods = {}
+    _, rows = _vivado_table(report, "Clock Summary")
+    for row in rows:
+        match = re.match(r"\s*(\S+)\s+\{[^}]*\}\s+([\d.]+)", row)
+        if match:
+            periods[match.group(1)] = float(match.group(2))
+
+    slacks = {}
+    header, rows = _vivado_table(report, "Intra Clock Table")
+    for row in rows:
+        slacks[row.split()[0]] = _vivado_column(header, row, "WNS(ns)")
+
+    clocks = []
+    for clock, period in periods.items():
+        slack = slacks.get(clock)
+        fmax  = 1e9 / (period - slack) if slack is not None and period > slack else None
+        clocks.append(ClockTiming(clock, 1e9 / period, fmax, slack))
+
+    return clocks
+
+
+def _quartus_tables(report, title_suffix):
+    """ Yields the rows (as lists of cells) of every Quartus report table whose title ends with a suffix. """
+
+    lines = report.splitlines()
+    for index, line in enumerate(lines):
+        if not (line.startswith(";") and line.rstrip(" ;").endswith(title_suffix)):
+            continue
+
+        rows = []
+        for row in lines[index + 1:]:
+            if row.startswith("+"):
+                continue
+            if not row.startswith(";"):
+                break
+            rows.append([cell.strip() for cell in row.strip().strip(";").split(";")])
+
+        # The first row holds the column names.
+        if rows:
+            yield [dict(zip(rows[0], row)) for row in rows[1:]]
+
+
+def parse_quartus_sta_report(path):
+    """ Parses a Quartus TimeQuest (``quartus_sta``) report; returning a list of ClockTiming.
+
+    Quartus analyses several timing models (e.g. slow 85C, slow 0C and fast 0C); the worst fmax and
+    slack of any model are used.
+    """
+
+    report = _read(path)
+
+    fmax = {}
+    for table in _quartus_tables(report, "Model Fmax Summary"):
+        for row in table:
+            frequency = row.get("Restricted Fmax") or row.get("Fmax")
+            if not frequency:
+                continue
+            value = float(frequency.split()[0]) * 1e6
+            clock = row["Clock Name"]
+            fmax[clock] = min(value, fmax.get(clock, value))
+
+    slacks = {}
+    for table in _quartus_tables(report, "Model Setup Summary"):
+        for row in table:
+            if not row.get("Slack"):
+                continue
+            value = float(row["Slack"])
+            clock = row["Clock"]
+            slacks[clock] = min(value, slacks.get(clock, value))
+
+    clocks = []
+    for clock in dict.fromkeys([*fmax, *slacks]):
+        achieved, slack = fmax.get(clock), slacks.get(clock)
+        target = 1e9 / (1e9 / achieved + slack) if achieved and slack is not None else None
+        clocks.append(ClockTiming(clock, target, achieved, slack))
+
+    return clocks
+
+
+#
+# Mapping clocks onto domains.
+#
+
+def _clock_leaf(clock):
+    """ Strips the hierarchy and buffer decorations from a toolchain's clock name. """
+    leaf = re.split(r"[/|.]", clock)[-1].split("$")[-1]
+    return re.sub(r"_(BUFG|bufg|buf)$", "", leaf)
+
+
+def _domain_of(clock, domains=None):
+    """ Returns the name of the domain a clock drives; guessing from its name, as Amaranth names clocks.
+
+    Parameters
+    ----------
+    clock: str
+        The clock name reported by the toolchain.
+    domains: dict
+        If provided, maps the names of the domains that exist to the source of each domain's clock
+        (e.g. "pll.CLKOS"); as reported by :mod:`luna_boards.clocktree`.
+    """
+
+    leaf = _clock_leaf(clock)
+
+    if leaf == "clk":
+        candidate = "sync"
+    elif leaf.endswith("_clk"):
+        candidate = leaf[:-len("_clk")]
+    elif leaf.startswith("clk_"):
+        candidate = leaf[len("clk_"):]
+    else:
+        candidate = leaf
+
+    if domains is None:
+        return candidate if candidate != leaf else None
+    if candidate in domains:
+        return candidate
+
+    # Otherwise, the clock may be named for the PLL output that generates it; e.g. "pll|...|clk[1]".
+    for domain, source in domains.items():
+        if source and source.rsplit(".", 1)[-1] == leaf:
+            return domain
+
+    return None
+
+
+def timing_report(build_dir, name="top", *, platform=None, clock_frequencies=None):
+    """ Parses the timing results of a completed build; mapping each clock onto the domain it drives.
+
+    Parameters
+    ----------
+    build_dir: str
+        The directory the build was run in.
+    name: str
+        The name of the top-level design.
+    platform:
+        If provided, an instance of the platform built for; its domain generator is elaborated to
+        find each domain's configured frequency.
+    clock_frequencies: dict
+        The ``clock_frequencies`` the design requested of the domain generator, in MHz; if any.
+
+    Returns a TimingReport: with the report file parsed, and a list of DomainTiming.
+    """
+
+    for filename, parser in TIMING_REPORTS:
+        path = os.path.join(build_dir, filename.format(name=name))
+        if os.path.exists(path):
+            clocks = globals()[parser](path)
+            break
+    else:
+        raise FileNotFoundError(f"no timing report for '{name}' in {build_dir}")
+
+    domains = configured = None
+    if platform is not None:
+        from .clocktree import clock_tree
+
+        tree       = clock_tree(platform, clock_frequencies=clock_frequencies)
+        domains    = {domain.name: domain.source for domain in tree.domains}
+        configured = {domain.name: domain.frequency for domain in tree.domains}
+
+    results = []
+    for clock in clocks:
+        domain = _domain_of(clock.clock, domains)
+        results.append(DomainTiming(domain, clock.clock, (configured or {}).get(domain), *clock[1:]))
+
+    # Domains that share a clock with another domain (e.g. ``fast`` and ``sync`` at the same
+    # frequency) have the same timing as the domain whose clock they share.
+    if domains is not None:
+        timed = {result.domain: result for result in results if result.domain}
+        for domain, source in domains.items():
+            if domain in timed:
+                continue
+            for other, result in list(timed.items()):
+                if domains[other] == source and source != "external":
+                    results.append(result._replace(domain=domain, configured_frequency=configured[domain]))
+                    break
+
+    return TimingReport(path, results)
+
+
+def format_timing_report(report):
+    """ Formats a TimingReport as a human-readable table. """
+
+    def mhz(frequency):
+        return f"{frequency / 1e6:.2f}" if frequency else "-"
+
+    lines = [report.source, f"  {'domain':14} {'clock':28} {'config':>8} {'target':>8} {'fmax':>8} {'slack':>8} {'headroom':>9}"]
+    for domain in sorted(report.domains, key=lambda domain: (domain.domain is None, domain.domain or domain.clock)):
+        slack    = f"{domain.slack:.3f}" if domain.slack is not None else "-"
+        headroom = f"{domain.headroom:+.1%}" if domain.headroom is not None else "-"
+        status   = {True: "", False: "  FAIL", None: ""}[domain.passed]
+        lines.append(f"  {domain.domain or '?':14} {domain.clock:28} {mhz(domain.configured_frequency):>8} "
+            f"{mhz(domain.target_frequency):>8} {mhz(domain.achieved_frequency):>8} {slack:>8} {headroom:>9}{status}")
+
+    return "\n".join(lines)
+
+
+def _parse_clock_frequency(text):
+    domain, _, frequency = text.partition("=")
+    try:
+        return domain, float(frequency)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected DOMAIN=MHZ; got {text!r}") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the achieved timing of a luna_boards build, by clock domain.")
+    parser.add_argument("build_dir", nargs="?", default="build", help="the build directory (default: build)")
+    parser.add_argument("--name", default="top", help="the name of the top-level design")
+    parser.add_argument("--platform", help="the platform built for; to report each domain's configured frequency")
+    parser.add_argument("--clock-frequency", "-f", metavar="DOMAIN=MHZ", action="append",
+        type=_parse_clock_frequency, default=[], help="a domain frequency the design requested")
+    parser.add_argument("--json", action="store_true", help="emit the report as JSON")
+    args = parser.parse_args()
+
+    platform = None
+    if args.platform:
+        from .registry import get_platform
+        platform = get_platform(args.platform)()
+
+    report = timing_report(args.build_dir, args.name, platform=platform,
+        clock_frequencies=dict(args.clock_frequency) or None)
+
+    if args.json:
+        json.dump({
+            "source":  report.source,
+            "domains": [dict(domain._asdict(), headroom=domain.headroom, passed=domain.passed)
+                for domain in report.domains],
+        }, sys.stdout, indent=2)
+        print()
+    else:
+        print(format_timing_report(report))
+
+    if any(domain.passed is False for domain in report.domains):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
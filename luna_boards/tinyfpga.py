@@ -15,21 +15,39 @@ This is a non-core platform. To use it, you'll need to set your LUNA_PLATFORM va
 import os
 import subprocess
 
-from amaranth import Elaboratable, ClockDomain, Module, ClockSignal, Instance, Signal, Const, ResetSignal
+from amaranth import Elaboratable, ClockDomain, Module, ClockSignal, Instance, Signal, ResetSignal
 from amaranth.build import Resource, Subsignal, Pins, Attrs, Clock, Connector, PinsN
 from amaranth_boards.tinyfpga_bx import TinyFPGABXPlatform as _TinyFPGABXPlatform
 
 from luna.gateware.platform.core import LUNAPlatform
 
+from .pll import domain_frequencies, shared_clocks, solve_sb_pll40, sb_pll40_parameters
+from .buildstats import BuildStatsMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+
 
 class TinyFPGABxDomainGenerator(Elaboratable):
     """ Creates clock domains for the TinyFPGA Bx. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # With only two PLL outputs -- both needed by the full-speed PHY -- sync and fast
+    # can only run at 48 MHz or 12 MHz.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   48,
+        "sync":   48,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
     def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
-        pass
+        self.clock_frequencies = clock_frequencies
 
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("usb_io", "usb"))
         locked = Signal()
 
         # Create our domains...
@@ -39,38 +57,24 @@ class TinyFPGABxDomainGenerator(Elaboratable):
         m.domains.fast   = ClockDomain()
 
         # ... create our 48 MHz IO and 12 MHz USB clock...
-        clk48  = Signal()
-        clk12  = Signal()
-        m.submodules.pll = Instance("SB_PLL40_2F_CORE",
-            i_REFERENCECLK  = platform.request(platform.default_clk),
-            i_RESETB        = Const(1),
-            i_BYPASS        = Const(0),
-
-            o_PLLOUTCOREA   = clk48,
-            o_PLLOUTCOREB   = clk12,
-            o_LOCK          = locked,
-
-            # Create a 48 MHz PLL clock...
-            p_FEEDBACK_PATH = "SIMPLE",
-            p_PLLOUT_SELECT_PORTA = "GENCLK",
-            p_PLLOUT_SELECT_PORTB = "SHIFTREG_0deg",
-            p_DIVR          = 0,
-            p_DIVF          = 47,
-            p_DIVQ          = 4,
-            p_FILTER_RANGE  = 1,
-        )
+        requests, aliases = shared_clocks(frequencies, ("usb_io", "usb", "sync", "fast"))
+        clocks = {domain: Signal(name=f"clk_{domain}") for domain, _ in requests}
+
+        pll_config = solve_sb_pll40(platform.default_clk_frequency, requests)
+        m.submodules.pll = Instance(pll_config.primitive, **sb_pll40_parameters(pll_config,
+            reference = platform.request(platform.default_clk),
+            clocks    = clocks,
+            locked    = locked,
+        ))
 
         # ... and constrain them to their new frequencies.
-        platform.add_clock_constraint(clk48, 48e6)
-        platform.add_clock_constraint(clk12, 12e6)
+        for domain, clock in clocks.items():
+            platform.add_clock_constraint(clock, pll_config.output(domain).frequency)
 
         # We'll use our 48MHz clock for everything _except_ the usb domain...
+        m.d.comb += [ClockSignal(domain).eq(clock) for domain, clock in clocks.items()]
+        m.d.comb += [ClockSignal(domain).eq(clocks[source]) for domain, source in aliases.items()]
         m.d.comb += [
-            ClockSignal("usb")     .eq(clk12),
-            ClockSignal("sync")    .eq(clk48),
-            ClockSignal("usb_io")  .eq(clk48),
-            ClockSignal("fast")    .eq(clk48),
-
             ResetSignal("usb")     .eq(~locked),
             ResetSignal("sync")    .eq(~locked),
             ResetSignal("usb_io")  .eq(~locked),
@@ -80,7 +84,7 @@ class TinyFPGABxDomainGenerator(Elaboratable):
         return m
 
 
-class TinyFPGABxPlatform(_TinyFPGABXPlatform, LUNAPlatform):
+class TinyFPGABxPlatform(BuildStatsMixin, NextpnrSeedSweepMixin, _TinyFPGABXPlatform, LUNAPlatform):
     name                   = "TinyFPGA Bx"
     clock_domain_generator = TinyFPGABxDomainGenerator
     default_usb_connection = "usb"
@@ -26,12 +26,34 @@ import amaranth_boards.ulx3s as _ulx3s
 
 from luna.gateware.platform.core import LUNAPlatform
 
+from .pll import domain_frequencies, shared_clocks, solve_ehxplll, ehxplll_parameters
+from .buildstats import BuildStatsMixin
+from .seedsweep  import NextpnrSeedSweepMixin
+from .ecppack    import ECP5BitstreamMixin, ECP5BitstreamProfile
+
 
 class ULX3SDomainGenerator(Elaboratable):
     """ Clock domain generator that creates the domain clocks for the ULX3S. """
 
+    #
+    # Default clock frequencies for each of our clock domains.
+    #
+    # usb_io and usb are fixed by our full-speed PHY. Our PLL has three outputs besides its feedback;
+    # so sync and fast can't both be moved away from 48 MHz unless they match each other.
+    #
+    DEFAULT_CLOCK_FREQUENCIES_MHZ = {
+        "fast":   48,
+        "sync":   48,
+        "usb_io": 48,
+        "usb":    12,
+    }
+
+    def __init__(self, *, clock_frequencies=None, clock_signal_name=None):
+        self.clock_frequencies = clock_frequencies
+
     def elaborate(self, platform):
         m = Module()
+        frequencies = domain_frequencies(self, platform, fixed=("usb_io", "usb"))
 
         # Grab our default input clock.
         input_clock = platform.request(platform.default_clk, dir="i")
@@ -45,64 +67,20 @@ class ULX3SDomainGenerator(Elaboratable):
         feedback = Signal()
         locked   = Signal()
 
-        m.submodules.pll = Instance("EHXPLLL",
-            i_RST=1,
-            i_STDBY=0,
-            i_CLKI=input_clock.i,
-            i_PHASESEL0=0,
-            i_PHASESEL1=0,
-            i_PHASEDIR=1,
-            i_PHASESTEP=1,
-            i_PHASELOADREG=1,
-            i_PLLWAKESYNC=0,
-            i_ENCLKOP=0,
-            i_CLKFB=feedback,
-
-            o_LOCK=locked,
-            o_CLKOP=feedback,
-            o_CLKOS=ClockSignal("sync"),
-            o_CLKOS2=ClockSignal("usb"),
-
-            p_PLLRST_ENA="DISABLED",
-            p_INTFB_WAKE="DISABLED",
-            p_STDBY_ENABLE="DISABLED",
-            p_DPHASE_SOURCE="DISABLED",
-            p_OUTDIVIDER_MUXA="DIVA",
-            p_OUTDIVIDER_MUXB="DIVB",
-            p_OUTDIVIDER_MUXC="DIVC",
-            p_OUTDIVIDER_MUXD="DIVD",
-            p_CLKI_DIV=5,
-            p_CLKOP_ENABLE="ENABLED",
-            p_CLKOS2_ENABLE="ENABLED",
-            p_CLKOP_DIV=48,
-            p_CLKOP_CPHASE=9,
-            p_CLKOP_FPHASE=0,
-            p_CLKOS_ENABLE="ENABLED",
-            p_CLKOS_DIV=10,
-            p_CLKOS_CPHASE=0,
-            p_CLKOS_FPHASE=0,
-            p_CLKOS2_DIV=40,
-            p_CLKOS2_CPHASE=0,
-            p_CLKOS2_FPHASE=0,
-            p_FEEDBK_PATH="CLKOP",
-            p_CLKFB_DIV=2,
-
-            a_FREQUENCY_PIN_CLKI="25",
-            a_FREQUENCY_PIN_CLKOP="48",
-            a_FREQUENCY_PIN_CLKOS="48",
-            a_FREQUENCY_PIN_CLKOS2="12",
-            a_ICP_CURRENT="12",
-            a_LPF_RESISTOR="8",
-            a_MFG_ENABLE_FILTEROPAMP="1",
-            a_MFG_GMCREF_SEL="2",
-
-        )
-
-        # We'll use our 48MHz clock for everything _except_ the usb domain...
-        m.d.comb += [
-            ClockSignal("usb_io")  .eq(ClockSignal("sync")),
-            ClockSignal("fast")    .eq(ClockSignal("sync")),
+        # Domains that run at the same frequency share a clock; so only distinct frequencies need PLL outputs.
+        requests, aliases = shared_clocks(frequencies, ("sync", "usb", "usb_io", "fast"))
 
+        pll_config = solve_ehxplll(platform.default_clk_frequency, requests)
+        m.submodules.pll = Instance("EHXPLLL", **ehxplll_parameters(pll_config,
+            clki=input_clock.i,
+            clocks={domain: ClockSignal(domain) for domain, _ in requests},
+            feedback=feedback,
+            locked=locked,
+        ))
+
+        # By default, we'll use our 48MHz clock for everything _except_ the usb domain...
+        m.d.comb += [ClockSignal(domain).eq(ClockSignal(source)) for domain, source in aliases.items()]
+        m.d.comb += [
             ResetSignal("sync")    .eq(~locked),
             ResetSignal("fast")    .eq(~locked),
             ResetSignal("usb")     .eq(~locked),
@@ -112,25 +90,29 @@ class ULX3SDomainGenerator(Elaboratable):
         return m
 
 
-class ULX3S_12F_Platform(_ulx3s.ULX3S_12F_Platform, LUNAPlatform):
+class ULX3S_12F_Platform(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _ulx3s.ULX3S_12F_Platform, LUNAPlatform):
     name                   = "ULX3S (12F)"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi", "qspi"))
     default_usb_connection = "usb"
     clock_domain_generator = ULX3SDomainGenerator
 
 
-class ULX3S_25F_Platform(_ulx3s.ULX3S_25F_Platform, LUNAPlatform):
+class ULX3S_25F_Platform(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _ulx3s.ULX3S_25F_Platform, LUNAPlatform):
     name                   = "ULX3S (25F)"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi", "qspi"))
     default_usb_connection = "usb"
     clock_domain_generator = ULX3SDomainGenerator
 
 
-class ULX3S_45F_Platform(_ulx3s.ULX3S_45F_Platform, LUNAPlatform):
+class ULX3S_45F_Platform(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _ulx3s.ULX3S_45F_Platform, LUNAPlatform):
     name                   = "ULX3S (45F)"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi", "qspi"))
     default_usb_connection = "usb"
     clock_domain_generator = ULX3SDomainGenerator
 
 
-class ULX3S_85F_Platform(_ulx3s.ULX3S_85F_Platform, LUNAPlatform):
+class ULX3S_85F_Platform(BuildStatsMixin, NextpnrSeedSweepMixin, ECP5BitstreamMixin, _ulx3s.ULX3S_85F_Platform, LUNAPlatform):
     name                   = "ULX3S (85F)"
+    ecp5_bitstream         = ECP5BitstreamProfile(spi_mode="dual-spi", spi_modes=("fast-read", "dual-spi", "qspi"))
     default_usb_connection = "usb"
     clock_domain_generator = ULX3SDomainGenerator
@@ -0,0 +1,414 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Vivado build flow extensions for the luna_boards 7-series platforms.
+
+Incremental implementation: when ``LUNA_VIVADO_INCREMENTAL`` names a directory, each build saves its
+routed design checkpoint there -- per board and design name -- and the next build of the same design
+passes that checkpoint to ``read_checkpoint -incremental``. Placement and routing then only redo the
+parts of the design that changed:
+
+    > LUNA_VIVADO_INCREMENTAL=~/.cache/luna-vivado python my_design.py
+
+Designs that share a board and a design name share a checkpoint; give unrelated designs distinct names
+(or distinct directories) to get the most reuse.
+
+Out-of-context modules: blocks that rarely change -- such as the transceiver PHYs of the Genesys2 and
+NeTV2 -- can be wrapped in :class:`OutOfContextModule`. When ``LUNA_VIVADO_OOC`` names a directory,
+each configuration of such a block is synthesized on its own once, and cached there as a design
+checkpoint; builds then treat the block as a black box, and link the cached checkpoint in after
+synthesis:
+
+    > LUNA_VIVADO_OOC=~/.cache/luna-ooc python my_usb3_design.py
+
+Bitstream profiles: each platform describes how its bitstreams should be configured -- compression,
+SPI bus width, configuration clock rate and flash size -- in a :class:`VivadoBitstreamProfile`. These
+set the bitstream's configuration properties, and generate a ``{name}.bin`` flash image alongside it;
+so our boards configure (and our USB devices enumerate) quickly after power-on. ``LUNA_XILINX_BITSTREAM``
+adjusts the profile at build time; either to ``safe`` (uncompressed, x1, default clock), or with a
+comma-separated list of changes:
+
+    > LUNA_XILINX_BITSTREAM="configrate=50,compress=no" python my_design.py
+"""
+
+import os
+import re
+import shutil
+import hashlib
+import subprocess
+
+from collections import namedtuple
+
+from .buildcache import toolchain_versions
+
+
+__all__ = ["VivadoIncrementalMixin", "vivado_incremental_overrides", "append_override",
+    "merge_overrides", "VivadoBitstreamProfile", "VivadoBitstreamMixin", "vivado_bitstream_overrides",
+    "OutOfContextModule", "out_of_context_overrides"]
+
+
+def append_override(overrides, name, script):
+    """ Returns a copy of a toolchain overrides dict, with a script appended to one of its overrides.
+
+    Any value already provided -- as a keyword argument or as an ``AMARANTH_<name>`` environment
+    variable -- is kept, and runs first.
+    """
+    existing = overrides.get(name, os.environ.get(f"AMARANTH_{name}"))
+    return {**overrides, name: "\n".join(filter(None, [existing, script]))}
+
+
+def merge_overrides(overrides, requested):
+    """ Returns a board's own toolchain overrides, combined with those requested of its build.
+
+    Requested scripts are appended to the board's own, rather than replacing them; so that
+    e.g. a thread setting passed to ``platform.build()`` doesn't drop a board's constraints.
+    """
+    merged = dict(overrides)
+    for name, value in requested.items():
+        if isinstance(merged.get(name), str) and isinstance(value, str):
+            value = "\n".join(filter(None, [merged[name], value]))
+        merged[name] = value
+    return merged
+
+
+def _tcl_path(path):
+    """ Quotes a filesystem path for use in a Vivado Tcl script. """
+    return "{" + os.path.abspath(path).replace("\\", "/") + "}"
+
+
+def vivado_incremental_overrides(platform, name, overrides):
+    """ Adds incremental implementation to a Vivado build's overrides, if ``LUNA_VIVADO_INCREMENTAL`` is set.
+
+    Parameters
+    ----------
+    platform:
+        The platform being built for.
+    name: str
+        The name of the design being built.
+    overrides: dict
+        The overrides that will be passed to ``toolchain_prepare``.
+
+    Returns the overrides to use instead.
+    """
+
+    directory = os.environ.get("LUNA_VIVADO_INCREMENTAL")
+    if not directory:
+        return overrides
+
+    checkpoint_dir = os.path.join(os.path.expanduser(directory), type(platform).__name__)
+    checkpoint     = os.path.join(checkpoint_dir, f"{name}_routed.dcp")
+
+    # Reuse the previous build's routed design, if there is one...
+    overrides = append_override(overrides, "script_after_synth", "\n".join([
+        f"if {{[file exists {_tcl_path(checkpoint)}]}} {{",
+        f"    read_checkpoint -incremental {_tcl_path(checkpoint)}",
+        "}",
+    ]))
+
+    # ... and save this build's routed design for next time.
+    overrides = append_override(overrides, "script_after_route", "\n".join([
+        f"file mkdir {_tcl_path(checkpoint_dir)}",
+        f"write_checkpoint -force {_tcl_path(checkpoint)}",
+    ]))
+
+    return overrides
+
+
+class VivadoIncrementalMixin:
+    """ Platform mixin that enables incremental implementation when ``LUNA_VIVADO_INCREMENTAL`` is set. """
+
+    def toolchain_prepare(self, fragment, name, **kwargs):
+        kwargs = vivado_incremental_overrides(self, name, kwargs)
+        return super().toolchain_prepare(fragment, name, **kwargs)
+
+
+# The master configuration clock rates (in MHz) 7-series devices can generate internally.
+CONFIG_RATES = (3, 6, 9, 12, 16, 22, 26, 33, 40, 50, 66)
+
+
+class VivadoBitstreamProfile(namedtuple("VivadoBitstreamProfile",
+        ["compress", "bus_width", "config_rate", "external_cclk", "flash_size"])):
+    """ Describes how a board's 7-series bitstreams should be configured.
+
+    Parameters
+    ----------
+    compress: bool
+        True iff bitstreams should be compressed.
+    bus_width: int
+        The width of the SPI bus to the configuration flash; 1, 2 or 4.
+    config_rate: int
+        The master configuration clock rate, in MHz; or None for the device's default.
+    external_cclk: bool
+        True iff the board provides an external configuration clock on EMCCLK, which should be used
+        instead of the internal oscillator.
+    flash_size: int
+        The size of the board's configuration flash, in MiB; or None if no flash image should be generated.
+    """
+
+    def __new__(cls, compress=True, bus_width=4, config_rate=33, external_cclk=False, flash_size=16):
+        return super().__new__(cls, compress, bus_width, config_rate, external_cclk, flash_size)
+
+
+    def adjusted(self, changes):
+        """ Returns a copy of this profile, with changes given as a ``LUNA_XILINX_BITSTREAM`` string applied. """
+
+        if changes.strip() == "safe":
+            return self._replace(compress=False, bus_width=1, config_rate=None, external_cclk=False)
+
+        profile = self
+        for change in filter(None, (change.strip() for change in changes.split(","))):
+            key, _, value = change.partition("=")
+            key, value    = key.strip(), value.strip()
+
+            if key in ("compress", "emcclk") and value in ("yes", "on", "1", "no", "off", "0"):
+                field = "compress" if key == "compress" else "external_cclk"
+                profile = profile._replace(**{field: value in ("yes", "on", "1")})
+            elif key == "buswidth" and value in ("1", "2", "4"):
+                if int(value) > self.bus_width:
+                    raise ValueError(f"this board's flash only supports SPI bus widths up to x{self.bus_width}")
+                profile = profile._replace(bus_width=int(value))
+            elif key == "configrate" and value.isdigit() and int(value) in CONFIG_RATES:
+                profile = profile._replace(config_rate=int(value))
+            else:
+                raise ValueError(f"invalid Xilinx bitstream setting '{change}'; expected 'safe', or a list of "
+                    f"compress=yes|no, emcclk=yes|no, buswidth=1|2|4, or configrate={'|'.join(map(str, CONFIG_RATES))}")
+
+        return profile
+
+
+    def properties(self):
+        """ Returns the Tcl that applies this profile's configuration properties to the current design. """
+
+        properties = {
+            "BITSTREAM.GENERAL.COMPRESS":    "TRUE" if self.compress else "FALSE",
+            "BITSTREAM.CONFIG.SPI_BUSWIDTH": self.bus_width,
+        }
+        if self.external_cclk:
+            properties["BITSTREAM.CONFIG.EXTMASTERCCLK_EN"] = "div-1"
+        elif self.config_rate is not None:
+            properties["BITSTREAM.CONFIG.CONFIGRATE"] = self.config_rate
+
+        # At higher clock rates, sample the flash's data on the falling edge; giving it a full cycle.
+        if self.external_cclk or (self.config_rate or 0) >= 50:
+            properties["BITSTREAM.CONFIG.SPI_FALL_EDGE"] = "YES"
+
+        return "\n".join(f"set_property {name} {value} [current_design]" for name, value in properties.items())
+
+
+    def flash_image(self, name):
+        """ Returns the Tcl that writes a flash image of the design's bitstream; or None if we shouldn't. """
+
+        if self.flash_size is None:
+            return None
+
+        return (f"write_cfgmem -force -format bin -interface spix{self.bus_width} -size {self.flash_size} "
+            f"-loadbit \"up 0x0 {name}.bit\" -file {name}.bin")
+
+
+def vivado_bitstream_overrides(platform, name, overrides):
+    """ Adds the platform's bitstream profile, as adjusted by ``LUNA_XILINX_BITSTREAM``, to a Vivado build's overrides.
+
+    Parameters
+    ----------
+    platform:
+        The platform being built for; its ``bitstream_profile`` is used.
+    name: str
+        The name of the design being built.
+    overrides: dict
+        The overrides that will be passed to ``toolchain_prepare``.
+
+    Returns the overrides to use instead.
+    """
+
+    profile = getattr(platform, "bitstream_profile", VivadoBitstreamProfile())
+    profile = profile.adjusted(os.environ.get("LUNA_XILINX_BITSTREAM", ""))
+
+    # Apply our properties first; so anything the caller provides takes precedence.
+    existing  = overrides.get("script_before_bitstream", os.environ.get("AMARANTH_script_before_bitstream"))
+    overrides = {**overrides, "script_before_bitstream": "\n".join(filter(None, [profile.properties(), existing]))}
+
+    flash_image = profile.flash_image(name)
+    if flash_image is not None:
+        overrides = append_override(overrides, "script_after_bitstream", flash_image)
+
+    return overrides
+
+
+class VivadoBitstreamMixin:
+    """ Platform mixin that configures bitstreams according to the platform's ``bitstream_profile``. """
+
+    bitstream_profile = VivadoBitstreamProfile()
+
+    def toolchain_prepare(self, fragment, name, **kwargs):
+        kwargs = vivado_bitstream_overrides(self, name, kwargs)
+        return super().toolchain_prepare(fragment, name, **kwargs)
+
+
+class OutOfContextModule:
+    """ Wraps an elaboratable, so Vivado builds link a pre-synthesized checkpoint of it instead.
+
+    Unless ``LUNA_VIVADO_OOC`` is set, the wrapped elaboratable is used as-is. Otherwise, it's elaborated
+    and converted on its own; its boundary is made up of the signals in its attributes, anything it uses
+    but doesn't drive, and the clocks and resets of any domains it uses but doesn't define. That
+    Verilog is synthesized out-of-context -- once per configuration -- and replaced in the design
+    by a black-box instance, which the platform fills with the cached checkpoint after synthesis.
+
+    Any domains the wrapped elaboratable defines must be local to it; and none of the signals at its
+    boundary may be bidirectional.
+
+    Parameters
+    ----------
+    elaboratable:
+        The block to synthesize out-of-context.
+    name: str
+        A name for the block's module; a hash of its configuration is appended.
+    """
+
+    def __init__(self, elaboratable, *, name):
+        self.elaboratable = elaboratable
+        self.name         = name
+
+
+    @staticmethod
+    def _interface_signals(elaboratable):
+        """ Yields the signals stored in an elaboratable's attributes; flattening any records. """
+
+        from amaranth.hdl import Signal
+
+        def leaves(value):
+            if isinstance(value, Signal):
+                yield value
+            elif hasattr(value, "fields"):
+                for field in value.fields.values():
+                    yield from leaves(field)
+
+        for value in vars(elaboratable).values():
+            yield from leaves(value)
+
+
+    def _synthesize(self, platform, module, verilog):
+        """ Synthesizes a module out-of-context; returning the path of its (possibly cached) checkpoint. """
+
+        part       = f"{platform.device}{platform.package}-{platform.speed}"
+        directory  = os.path.join(os.path.expanduser(os.environ["LUNA_VIVADO_OOC"]), module)
+        checkpoint = os.path.join(directory, f"{module}.dcp")
+        if os.path.exists(checkpoint):
+            return os.path.abspath(checkpoint)
+
+        temporary = f"{directory}.tmp-{os.getpid()}"
+        os.makedirs(temporary, exist_ok=True)
+        try:
+            with open(os.path.join(temporary, f"{module}.v"), "w") as f:
+                f.write(verilog)
+            with open(os.path.join(temporary, f"{module}.tcl"), "w") as f:
+                f.write("\n".join([
+                    f"read_verilog {module}.v",
+                    f"synth_design -mode out_of_context -top {module} -part {part}",
+                    f"write_checkpoint -force {module}.dcp",
+                ]) + "\n")
+
+            vivado = os.environ.get("VIVADO", "vivado")
+            subprocess.check_call([vivado, "-mode", "batch", "-nojournal", "-log", f"{module}.log",
+                "-source", f"{module}.tcl"], cwd=temporary)
+
+            try:
+                os.replace(temporary, directory)
+            except OSError:
+                # Another build synthesized the same configuration first.
+                if not os.path.exists(checkpoint):
+                    raise
+        finally:
+            shutil.rmtree(temporary, ignore_errors=True)
+
+        return os.path.abspath(checkpoint)
+
+
+    def elaborate(self, platform):
+        if not os.environ.get("LUNA_VIVADO_OOC"):
+            return self.elaboratable
+
+        from amaranth      import Module, Signal, Instance, ClockDomain, ClockSignal, ResetSignal
+        from amaranth.back import rtlil, verilog
+        from amaranth.hdl  import Fragment
+
+        # Elaborate our block on its own, once. Preparing a copy of it finds its boundary, and the domains
+        # it uses but doesn't define; the converters prepare the block itself, later.
+        given_domains = []
+        def missing_domain(name):
+            domain = ClockDomain(name)
+            given_domains.append(domain)
+            return domain
+
+        fragment = Fragment.get(self.elaboratable, platform)
+        prepared = fragment.prepare(ports=list(self._interface_signals(self.elaboratable)),
+            missing_domain=missing_domain)
+
+        # The design's own clocks and resets drive those of any domains our block was given.
+        domain_signals = {}
+        for domain in given_domains:
+            domain_signals[id(domain.clk)] = ClockSignal(domain.name)
+            if domain.rst is not None:
+                domain_signals[id(domain.rst)] = ResetSignal(domain.name)
+
+        # Give each signal at the boundary a port of its own, with a name we choose; so our black-box
+        # declaration doesn't depend on how the converter names the block's signals.
+        keywords = {"i": "input", "o": "output"}
+        boundary = []
+        for index, (signal, direction) in enumerate(prepared.ports.items()):
+            if direction not in keywords:
+                raise ValueError(f"out-of-context module '{self.name}' can't have bidirectional port {signal.name}")
+            port = Signal(len(signal), name=f"{re.sub(r'[^A-Za-z0-9_]', '_', signal.name)}_{index}")
+            boundary.append((port, signal, direction))
+
+        # Our wrapper defines the domains our block was given; so their clocks and resets are driven by ports.
+        wrapper = Module()
+        wrapper.submodules.block = fragment
+        for domain in given_domains:
+            wrapper.domains += domain
+        for port, signal, direction in boundary:
+            wrapper.d.comb += signal.eq(port) if direction == "i" else port.eq(signal)
+        ports = [port for port, _, _ in boundary]
+
+        # Name the module for its configuration -- and for the part and Vivado it's built for --
+        # so each gets its own checkpoint.
+        digest = hashlib.sha256()
+        digest.update(rtlil.convert(wrapper, name=self.name, ports=ports, emit_src=False).encode("utf-8"))
+        digest.update(f"{platform.device}{platform.package}-{platform.speed}".encode("utf-8"))
+        digest.update(str(toolchain_versions(platform).get("vivado")).encode("utf-8"))
+        module = f"{self.name}_{digest.hexdigest()[:12]}"
+
+        checkpoint = self._synthesize(platform, module,
+            verilog.convert(wrapper, name=module, ports=ports, strip_internal_attrs=True))
+
+        # Give synthesis a black-box declaration of the module; and record the checkpoint that fills it.
+        stub = []
+        for port, _, direction in boundary:
+            width = f"[{len(port) - 1}:0] " if len(port) > 1 else ""
+            stub.append(f"    {keywords[direction]} {width}{port.name}")
+        platform.add_file(f"{module}_stub.v",
+            f"(* black_box *)\nmodule {module}(\n" + ",\n".join(stub) + "\n);\nendmodule\n")
+        if not hasattr(platform, "ooc_checkpoints"):
+            platform.ooc_checkpoints = {}
+        platform.ooc_checkpoints[module] = checkpoint
+
+        m = Module()
+        m.submodules.ooc = Instance(module, **{f"{direction}_{port.name}": domain_signals.get(id(signal), signal)
+            for port, signal, direction in boundary})
+        return m
+
+
+def out_of_context_overrides(platform, overrides):
+    """ Adds the linking of any out-of-context checkpoints to a Vivado build's overrides.
+
+    This must be called from ``toolchain_prepare``; after the design has been elaborated. The checkpoints
+    recorded while elaborating the design are consumed; so each build links only its own.
+    """
+
+    for module, checkpoint in vars(platform).pop("ooc_checkpoints", {}).items():
+        overrides = append_override(overrides, "script_after_synth",
+            f"read_checkpoint -cell [get_cells -hierarchical -filter {{REF_NAME == {module}}}] {_tcl_path(checkpoint)}")
+
+    return overrides
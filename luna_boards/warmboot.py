@@ -0,0 +1,170 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Multi-image warmboot bundles for the luna_boards iCE40 platforms.
+
+The iCE40 can hold up to four bitstreams in its configuration flash, behind a small header, and switch
+between them at runtime with its ``SB_WARMBOOT`` primitive; reconfiguring in milliseconds, rather
+than the seconds taken to reflash. This module builds up to four LUNA designs for one board, bundles
+them with ``icemulti``, and flashes the bundle:
+
+    > python -m luna_boards.warmboot IceBreakerPlatform my_analyzer:Analyzer my_device:Device --flash
+
+Each design can include a :class:`WarmbootTrigger` to jump to another image; images are numbered
+in the order they're given. The power-on image is the first, unless ``--power-on`` says otherwise.
+
+Warmboot reads its header from the start of flash; so bundles always replace anything already there.
+On boards that keep a DFU bootloader there (the Fomu PVT, Fomu Hacker and iCEBreaker Bitsy), that
+includes the bootloader; so flashing them requires ``--replace-bootloader``, and an external programmer.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+from .registry import get_platform
+
+
+__all__ = ["WarmbootTrigger", "ICE40MultibootMixin", "build_multiboot"]
+
+
+# The number of images an iCE40 multi-boot header can select between.
+MAX_IMAGES = 4
+
+
+class WarmbootTrigger:
+    """ Gateware that reconfigures the FPGA from another image in its warmboot bundle.
+
+    Attributes
+    ----------
+    image: Signal(2), input
+        The index of the image to boot.
+    boot: Signal(), input
+        Strobe high to reconfigure the FPGA from ``image``.
+    """
+
+    def __init__(self):
+        from amaranth import Signal
+
+        self.image = Signal(2)
+        self.boot  = Signal()
+
+
+    def elaborate(self, platform):
+        from amaranth import Module, Instance
+
+        m = Module()
+        m.submodules.warmboot = Instance("SB_WARMBOOT",
+            i_BOOT = self.boot,
+            i_S1   = self.image[1],
+            i_S0   = self.image[0],
+        )
+        return m
+
+
+def build_multiboot(platform, designs, *, name="multiboot", build_dir="build", power_on=0, **kwargs):
+    """ Builds several designs for an iCE40 platform, and bundles them into a single warmboot image.
+
+    Parameters
+    ----------
+    platform: type
+        The platform class to build for; a new instance is created for each design.
+    designs: sequence of Elaboratable
+        The designs to build, in the order their images should be numbered.
+    name: str
+        The name of the bundle; each image is built as ``{name}_{index}``.
+    build_dir: str
+        Where to build; each image gets its own ``image-<index>`` subdirectory.
+    power_on: int
+        The index of the image to boot on power-on.
+
+    Any other keyword arguments are passed to each build. Returns the path of the bundle.
+    """
+
+    if not 1 <= len(designs) <= MAX_IMAGES:
+        raise ValueError(f"a warmboot bundle holds between 1 and {MAX_IMAGES} images; got {len(designs)}")
+    if not 0 <= power_on < len(designs):
+        raise ValueError(f"power-on image {power_on} isn't one of the {len(designs)} images being built")
+
+    bitstreams = []
+    for index, design in enumerate(designs):
+        image_name = f"{name}_{index}"
+        image_dir  = os.path.join(build_dir, f"image-{index}")
+        platform().build(design, name=image_name, build_dir=image_dir, do_program=False, **kwargs)
+        bitstreams.append(os.path.abspath(os.path.join(image_dir, f"{image_name}.bin")))
+
+    # Align each image to a 64 KiB flash block, so images can be rewritten individually.
+    bundle   = os.path.abspath(os.path.join(build_dir, f"{name}.bin"))
+    icemulti = os.environ.get("ICEMULTI", "icemulti")
+    subprocess.check_call([icemulti, "-v", "-a16", f"-p{power_on}", "-o", bundle, *bitstreams])
+
+    return bundle
+
+
+class ICE40MultibootMixin:
+    """ Platform mixin that lets an iCE40 platform flash warmboot bundles.
+
+    Platforms set ``multiboot_flash_command`` to the command that writes a file to the start of their
+    configuration flash (or None if they need an external programmer); and ``multiboot_replaces_bootloader``
+    if that's where their bootloader lives.
+    """
+
+    multiboot_flash_command       = None
+    multiboot_replaces_bootloader = False
+
+    def toolchain_flash_multiboot(self, bundle, *, replace_bootloader=False):
+        """ Writes a warmboot bundle, as built by :func:`build_multiboot`, to this board's flash. """
+
+        if self.multiboot_replaces_bootloader and not replace_bootloader:
+            raise RuntimeError(f"flashing a warmboot bundle to the {self.name} replaces its bootloader; "
+                "pass replace_bootloader=True (--replace-bootloader) if that's what you want")
+        if self.multiboot_flash_command is None:
+            raise RuntimeError(f"the {self.name} can't write the start of its flash itself; "
+                f"write {bundle} to offset 0 with an external SPI flash programmer")
+
+        # Find our tool as Amaranth does; so e.g. ICEPROG can override it.
+        tool, *arguments = self.multiboot_flash_command
+        tool = os.environ.get(tool.upper().replace("-", "_"), tool)
+        subprocess.check_call([tool, *arguments, bundle])
+
+
+def main():
+    from .buildmatrix import _load_design
+
+    parser = argparse.ArgumentParser(description="Build several designs into a single iCE40 warmboot bundle.")
+    parser.add_argument("platform", help="the iCE40 platform to build for; as a class name or module:Class path")
+    parser.add_argument("designs", nargs="+", help="the designs to bundle, as module:name; in image order")
+    parser.add_argument("--power-on", type=int, default=0, help="the index of the image to boot on power-on")
+    parser.add_argument("--build-dir", default="build", help="where to build each image, and the bundle")
+    parser.add_argument("--name", default="multiboot", help="the name of the bundle")
+    parser.add_argument("--flash", action="store_true", help="write the bundle to the board's flash once built")
+    parser.add_argument("--replace-bootloader", action="store_true",
+        help="allow flashing over the board's bootloader, on boards that have one")
+    args = parser.parse_args()
+
+    try:
+        platform = get_platform(args.platform)
+    except KeyError as e:
+        parser.error(e.args[0])
+    if not hasattr(platform, "toolchain_flash_multiboot"):
+        parser.error(f"{platform.__name__} doesn't support warmboot bundles")
+
+    designs = [_load_design(design)() for design in args.designs]
+    try:
+        bundle = build_multiboot(platform, designs,
+            name=args.name, build_dir=args.build_dir, power_on=args.power_on)
+        print(f"Built {len(designs)}-image warmboot bundle {bundle}.", file=sys.stderr)
+
+        if args.flash:
+            platform().toolchain_flash_multiboot(bundle, replace_bootloader=args.replace_bootloader)
+    except (ValueError, RuntimeError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
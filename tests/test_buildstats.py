@@ -0,0 +1,62 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Tests for build statistics collection; run against a fake toolchain. """
+
+import os
+import json
+import tempfile
+import unittest
+
+try:
+    from amaranth.build.run import BuildPlan
+except ImportError:
+    BuildPlan = None
+
+from luna_boards.buildstats import STATS_FILENAME, instrumented_build_plan
+
+
+class FakePlatform:
+    name           = "fake"
+    toolchain      = None
+    required_tools = ["fake-tool"]
+
+
+@unittest.skipIf(BuildPlan is None, "Amaranth is not installed")
+@unittest.skipIf(os.name == "nt", "the fake toolchain is a POSIX shell script")
+class InstrumentedBuildPlanTest(unittest.TestCase):
+
+    def test_records_quoted_tool(self):
+        with tempfile.TemporaryDirectory() as root:
+            # A stand-in for a real toolchain executable; which leaves its arguments behind.
+            tool = os.path.join(root, "fake-tool")
+            with open(tool, "w") as f:
+                f.write(f"#!/bin/sh\necho \"$@\" > {root}/arguments\n")
+            os.chmod(tool, 0o755)
+
+            # Like Amaranth's own build scripts, run the tool from its (quoted) environment variable.
+            plan = BuildPlan("build_top")
+            plan.add_file("build_top.sh", '"$FAKE_TOOL" --flag "two words"\n')
+
+            os.environ["FAKE_TOOL"] = tool
+            try:
+                instrumented_build_plan(FakePlatform(), plan, "top").execute_local(os.path.join(root, "build"))
+            finally:
+                del os.environ["FAKE_TOOL"]
+
+            with open(os.path.join(root, "arguments")) as f:
+                self.assertEqual(f.read(), "--flag two words\n")
+            with open(os.path.join(root, "build", STATS_FILENAME.format(name="top"))) as f:
+                stats = json.load(f)
+
+        self.assertTrue(stats["success"])
+        self.assertEqual([stage["stage"] for stage in stats["stages"]], ["fake-tool"])
+        self.assertEqual(stats["stages"][0]["exit_status"], 0)
+        self.assertNotIn("FAKE_TOOL", os.environ)
+
+
+if __name__ == "__main__":
+    unittest.main()
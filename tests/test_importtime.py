@@ -0,0 +1,72 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Tests that board modules only import their SerDes/PIPE gateware once a PHY is asked for. """
+
+import sys
+import unittest
+import subprocess
+
+try:
+    import luna
+except ImportError:
+    luna = None
+
+from luna_boards.importtime import DEFERRED_MODULES, _IMPORTTIME_LINE, board_modules, measure_import
+
+
+# The lazily-imported PHY each board module provides; accessing it should pull its gateware in.
+LAZY_PHYS = {
+    "luna_boards.ecpix5":      "ECPIX5SuperSpeedPHY",
+    "luna_boards.genesys2":    "Genesys2GTXSuperSpeedPHY",
+    "luna_boards.logicbone":   "LogicboneSuperSpeedPHY",
+    "luna_boards.netv2":       "NeTV2SuperSpeedPHY",
+    "luna_boards.nexys_video": "NexysVideoAB07SuperspeedPHY",
+    "luna_boards.versa":       "VersaSuperSpeedPHY",
+}
+
+
+def _deferred_imports(statement):
+    """ Runs a statement in a fresh ``python -X importtime``; and returns the deferred modules it imported. """
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return None
+
+    imported = {match.group(4) for match in map(_IMPORTTIME_LINE.match, result.stderr.splitlines()) if match}
+    return [name for name in DEFERRED_MODULES if name in imported]
+
+
+@unittest.skipIf(luna is None, "LUNA isn't installed")
+class DeferredImportTest(unittest.TestCase):
+
+    def test_board_modules_defer_phys(self):
+        for module_name in board_modules():
+            with self.subTest(module=module_name):
+                result = measure_import(module_name)
+                if result["cumulative_us"] is None:
+                    self.skipTest(f"{module_name} can't be imported here:\n{result['error']}")
+
+                self.assertEqual(result["deferred_imports"], [])
+
+
+    def test_phy_access_imports_gateware(self):
+        for module_name, attribute in LAZY_PHYS.items():
+            with self.subTest(module=module_name):
+                deferred = _deferred_imports(f"import {module_name}")
+                if deferred is None:
+                    self.skipTest(f"{module_name} can't be imported here")
+                self.assertEqual(deferred, [])
+
+                # Once the PHY is asked for, its gateware is imported; so the check above can see it.
+                deferred = _deferred_imports(f"import {module_name}; {module_name}.{attribute}")
+                self.assertIsNotNone(deferred)
+                self.assertNotEqual(deferred, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Tests for native 7-series JTAG programming; against a modeled TAP, and a fake FTDI adapter. """
+
+import sys
+import types
+import unittest
+
+from unittest import mock
+
+from luna_boards.jtag import IDCODE, CFG_IN, JPROGRAM, JSTART, JTAGError, MPSSETransport, \
+    SimulatedTransport, Xilinx7SeriesJTAGProgrammer, bitstream_payload
+
+
+def _bit_file(payload):
+    """ Wraps configuration data in a Vivado .bit file header. """
+
+    def field(key, value):
+        return key + len(value).to_bytes(2, "big") + value
+
+    return (b"\x00\x09" + b"\x0f\xf0" * 4 + b"\x00" + b"\x00\x01" +
+        field(b"a", b"top;UserID=0XFFFFFFFF\0") + field(b"b", b"7a35tcsg324\0") +
+        field(b"c", b"2020/01/01\0") + field(b"d", b"12:00:00\0") +
+        b"e" + len(payload).to_bytes(4, "big") + payload)
+
+
+# Configuration data: dummy words, bus width detection, and the sync word; then some arbitrary frames.
+PAYLOAD = (b"\xff" * 8 + b"\x00\x00\x00\xbb\x11\x22\x00\x44" + b"\xff" * 4 + b"\xaa\x99\x55\x66" +
+    bytes(range(256)) * 2)
+
+
+class SimulatedProgrammingTest(unittest.TestCase):
+
+    def test_bitstream_payload(self):
+        self.assertEqual(bitstream_payload(_bit_file(PAYLOAD)), PAYLOAD)
+        self.assertEqual(bitstream_payload(PAYLOAD), PAYLOAD)
+
+
+    def test_read_idcode(self):
+        programmer = Xilinx7SeriesJTAGProgrammer(SimulatedTransport(idcode=0x13631093))
+        self.assertEqual(programmer.read_idcode(), 0x13631093)
+
+
+    def test_configure(self):
+        transport = SimulatedTransport()
+        Xilinx7SeriesJTAGProgrammer(transport).configure(_bit_file(PAYLOAD))
+
+        self.assertEqual(transport.configuration, PAYLOAD)
+        self.assertTrue(transport.done)
+        self.assertEqual(transport.state, "Run-Test/Idle")
+        for instruction in (IDCODE, JPROGRAM, CFG_IN, JSTART):
+            self.assertIn(instruction, transport.instructions)
+
+
+    def test_configure_without_sync_word(self):
+        transport = SimulatedTransport()
+        with self.assertRaisesRegex(JTAGError, "didn't finish configuring"):
+            Xilinx7SeriesJTAGProgrammer(transport).configure(b"\xff" * 64)
+
+        self.assertFalse(transport.done)
+
+
+class FakeFtdi:
+    """ Stands in for pyftdi's Ftdi; recording the MPSSE commands written, and returning canned reads. """
+
+    def __init__(self):
+        self.written  = bytearray()
+        self.response = b""
+        self.url      = None
+
+    def open_mpsse_from_url(self, url, *, direction, initial, frequency):
+        self.url = url
+        return frequency
+
+    def write_data(self, data):
+        self.written += data
+
+    def read_data_bytes(self, size, attempt=1):
+        data, self.response = self.response[:size], self.response[size:]
+        return data
+
+    def close(self):
+        pass
+
+
+class MPSSETransportTest(unittest.TestCase):
+
+    def setUp(self):
+        ftdi = types.ModuleType("pyftdi.ftdi")
+        ftdi.Ftdi = FakeFtdi
+        patcher = mock.patch.dict(sys.modules, {"pyftdi": types.ModuleType("pyftdi"), "pyftdi.ftdi": ftdi})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.transport = MPSSETransport("ftdi://0x0403:0x6011/1", frequency=10e6)
+        self.ftdi      = self.transport._ftdi
+
+
+    def test_open(self):
+        self.assertEqual(self.ftdi.url, "ftdi://0x0403:0x6011/1")
+        self.assertEqual(self.transport.frequency, 10e6)
+
+
+    def test_tms_and_idle(self):
+        self.transport.tms(0b11111, 5)
+        self.transport.idle(20)
+        self.transport.flush()
+
+        # TMS out; then two clock-only bytes, and four clock-only bits.
+        self.assertEqual(self.ftdi.written.hex(), "4b049f" "8f0100" "8e03")
+
+
+    def test_shift(self):
+        self.ftdi.response = bytes([0x55, 0x55, 0b10100000, 0x80])
+        value = self.transport.shift(bytes([0xaa, 0xbb, 0x05]), 20, read=True)
+
+        # Two whole bytes, three bits, and the last bit with TMS; then a request to send the results now.
+        self.assertEqual(self.ftdi.written.hex(), "390100aabb" "3b0205" "6b0001" "87")
+        self.assertEqual(value, 0xd5555)
+
+
+    def test_shift_without_read(self):
+        self.assertIsNone(self.transport.shift(bytes([0x81]), 8))
+        self.transport.flush()
+        self.assertEqual(self.ftdi.written.hex(), "1b0681" "4b0081")
+
+
+    def test_short_read(self):
+        self.ftdi.response = b"\x00"
+        with mock.patch("luna_boards.jtag.time.monotonic", side_effect=[0, 0, 10]):
+            with self.assertRaisesRegex(JTAGError, "only 1 of 2 bytes"):
+                self.transport.shift(bytes([0x01, 0x00]), 9, read=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Tests for the shipped platform manifest; which must be usable without Amaranth. """
+
+import unittest
+
+from luna_boards.manifest import board_metadata, find_boards, load_manifest, stale_entries
+from luna_boards.registry import PLATFORMS
+
+
+class ManifestTest(unittest.TestCase):
+
+    def test_manifest_is_current(self):
+        self.assertEqual(stale_entries(), [])
+
+
+    def test_board_metadata(self):
+        board = board_metadata("NeTV2Platform")
+        self.assertEqual(board["device"], "xc7a35t")
+        self.assertEqual(board["default_usb3_phy"], "luna_boards.netv2:NeTV2SuperSpeedPHY")
+
+
+    def test_find_boards(self):
+        self.assertEqual(sorted(find_boards(family="ice40")),
+            sorted(name for name, info in PLATFORMS.items() if info.family == "ice40"))
+        self.assertIn("NeTV2Platform", find_boards(usb3=True))
+        self.assertNotIn("FomuHackerPlatform", find_boards(usb3=True))
+
+
+    def test_stale_entries(self):
+        manifest = load_manifest()
+        boards   = dict(manifest["boards"])
+        del boards["NeTV2Platform"]
+        changed  = {**boards["FomuHackerPlatform"], "device": "iCE40UP3K"}
+
+        problems = stale_entries({**manifest, "boards": {**boards, "FomuHackerPlatform": changed}})
+        self.assertIn("NeTV2Platform is missing from the manifest", problems)
+        self.assertTrue(any(problem.startswith("FomuHackerPlatform.device") for problem in problems))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Tests for our OpenOCD TCL client and servers; run against a fake OpenOCD. """
+
+import os
+import sys
+import json
+import socket
+import tempfile
+import threading
+import unittest
+import socketserver
+
+from unittest import mock
+
+from luna_boards import openocd
+from luna_boards.openocd import COMMAND_TOKEN, OpenOCDClient, OpenOCDError, run_openocd
+
+
+class FakeOpenOCD(socketserver.ThreadingTCPServer):
+    """ Speaks just enough of OpenOCD's TCL protocol for our client: ``catch``, ``set`` and ``version``.
+
+    Commands starting with ``fail`` fail; all others succeed, and return their own text. Every command
+    received is recorded in ``commands``.
+    """
+
+    daemon_threads      = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        self.commands  = []
+        self.variables = {}
+        super().__init__(("localhost", port), FakeOpenOCDHandler)
+
+
+    def evaluate(self, command):
+        self.commands.append(command)
+
+        if command == "version":
+            return "Open On-Chip Debugger 0.12.0"
+        if command.startswith("catch {"):
+            body, _, variable = command[len("catch {"):].rpartition("} ")
+            failed = body.startswith("fail")
+            self.variables[variable] = f"{body} went wrong" if failed else f"ran {body}"
+            return "1" if failed else "0"
+        if command.startswith("set "):
+            return self.variables.get(command[len("set "):], "")
+
+        return ""
+
+
+class FakeOpenOCDHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        buffer = b""
+        while True:
+            data = self.request.recv(4096)
+            if not data:
+                return
+            buffer += data
+
+            while COMMAND_TOKEN in buffer:
+                command, _, buffer = buffer.partition(COMMAND_TOKEN)
+                response = self.server.evaluate(command.decode("utf-8"))
+                self.request.sendall(response.encode("utf-8") + COMMAND_TOKEN)
+
+
+# Stands in for the OpenOCD executable; serving our fake on the TCL port it's given.
+FAKE_OPENOCD_EXECUTABLE = """#!{python}
+import sys
+sys.path[:0] = {paths!r}
+from test_openocd import FakeOpenOCD
+port = int(sys.argv[sys.argv.index("-c") + 1].split(";")[0].split()[1])
+FakeOpenOCD(port).serve_forever()
+"""
+
+
+class OpenOCDTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOpenOCD()
+        self.port   = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def test_run(self):
+        with OpenOCDClient("localhost", self.port) as client:
+            self.assertEqual(client.run("pld load 0 top.bit"), "ran pld load 0 top.bit")
+
+        self.assertEqual(self.server.commands, ["catch {pld load 0 top.bit} luna_result", "set luna_result"])
+
+
+    def test_run_error(self):
+        with OpenOCDClient("localhost", self.port) as client:
+            with self.assertRaisesRegex(OpenOCDError, "failing command went wrong"):
+                client.run("failing command")
+
+            # The connection is still usable after an error.
+            self.assertEqual(client.run("scan_chain"), "ran scan_chain")
+
+
+    def test_run_openocd_with_server(self):
+        with mock.patch.dict(os.environ, {"LUNA_OPENOCD_SERVER": f"localhost:{self.port}"}):
+            run_openocd("unused.cfg", ["fpga_program", "pld load 0 top.bit"])
+
+        self.assertEqual(self.server.commands[0::2], ["catch {fpga_program} luna_result",
+            "catch {pld load 0 top.bit} luna_result"])
+
+        with mock.patch.dict(os.environ, {"LUNA_OPENOCD_SERVER": f"localhost:{self.port}"}):
+            with self.assertRaises(OpenOCDError):
+                run_openocd("unused.cfg", ["fail to program"])
+
+
+@unittest.skipIf(os.name == "nt", "the fake OpenOCD is started as a script")
+class OpenOCDDaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(openocd, "_state_dir", lambda: self.state.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.openocd = os.path.join(self.state.name, "fake-openocd")
+        with open(self.openocd, "w") as f:
+            paths = [os.path.dirname(os.path.abspath(__file__)), os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+            f.write(FAKE_OPENOCD_EXECUTABLE.format(python=sys.executable, paths=paths))
+        os.chmod(self.openocd, 0o755)
+
+
+    def tearDown(self):
+        openocd.stop_openocd_servers()
+        self.state.cleanup()
+
+
+    def test_daemon_is_reused(self):
+        port = openocd._daemon(self.openocd, "adapter speed 1000\n", "")
+        self.assertEqual(openocd._daemon(self.openocd, "adapter speed 1000\n", ""), port)
+
+
+    def test_stale_daemon_is_replaced(self):
+        openocd._daemon(self.openocd, "adapter speed 1000\n", "")
+        openocd.stop_openocd_servers()
+
+        # Record a daemon whose process ID is alive -- it's ours -- but with no OpenOCD listening.
+        with socket.socket() as s:
+            s.bind(("localhost", 0))
+            closed_port = s.getsockname()[1]
+        key   = next(filename for filename in os.listdir(self.state.name) if filename.endswith(".cfg"))[:-len(".cfg")]
+        state = os.path.join(self.state.name, f"{key}.json")
+        with open(state, "w") as f:
+            json.dump({"pid": os.getpid(), "port": closed_port, "log": "unused"}, f)
+
+        port = openocd._daemon(self.openocd, "adapter speed 1000\n", "")
+        self.assertNotEqual(port, closed_port)
+        with OpenOCDClient("localhost", port) as client:
+            self.assertEqual(client.run("init"), "ran init")
+
+
+if __name__ == "__main__":
+    unittest.main()
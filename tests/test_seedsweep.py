@@ -0,0 +1,105 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Tests for nextpnr seed sweeps; run against a fake IceStorm toolchain. """
+
+import os
+import json
+import tempfile
+import unittest
+
+try:
+    from amaranth import Elaboratable, Module, Signal
+    from amaranth.build import Clock, Pins, Resource
+    from amaranth.vendor import LatticeICE40Platform
+except ImportError:
+    LatticeICE40Platform = None
+
+from luna_boards.seedsweep import NextpnrSeedSweepMixin
+
+
+# Stands in for nextpnr; reporting an fmax that improves with the seed, and recording the options it was run with.
+FAKE_NEXTPNR = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/nextpnr-invocations"
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --seed) seed="$2"; shift ;;
+        --log)  log="$2";  shift ;;
+    esac
+    shift
+done
+echo "Info: Max frequency for clock 'clk': $((10 + seed)).00 MHz (PASS at 12.00 MHz)" > "$log"
+"""
+
+# Stands in for the tools around nextpnr, which only need to succeed.
+FAKE_TOOL = "#!/bin/sh\nexit 0\n"
+
+
+if LatticeICE40Platform is not None:
+
+    class SweptPlatform(NextpnrSeedSweepMixin, LatticeICE40Platform):
+        device      = "iCE40UP5K"
+        package     = "SG48"
+        default_clk = "clk"
+        resources   = [Resource("clk", 0, Pins("35", dir="i"), Clock(12e6))]
+        connectors  = []
+
+
+    class Counter(Elaboratable):
+        def elaborate(self, platform):
+            m = Module()
+            count = Signal(8)
+            m.d.sync += count.eq(count + 1)
+            return m
+
+
+@unittest.skipIf(LatticeICE40Platform is None, "Amaranth is not installed")
+@unittest.skipIf(os.name == "nt", "the fake toolchain is made of POSIX shell scripts")
+class SeedSweepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tools       = tempfile.TemporaryDirectory()
+        self.environment = dict(os.environ)
+
+        for tool, script in [("yosys", FAKE_TOOL), ("nextpnr-ice40", FAKE_NEXTPNR), ("icepack", FAKE_TOOL)]:
+            path = os.path.join(self.tools.name, tool)
+            with open(path, "w") as f:
+                f.write(script)
+            os.chmod(path, 0o755)
+            os.environ[tool.upper().replace("-", "_")] = path
+
+        os.environ.pop("AMARANTH_nextpnr_opts", None)
+        os.environ.pop("LUNA_BUILD_CACHE", None)
+        os.environ["LUNA_NEXTPNR_SEEDS"] = "3"
+
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environment)
+        self.tools.cleanup()
+
+
+    def test_sweep_keeps_best_seed(self):
+        with tempfile.TemporaryDirectory() as root:
+            SweptPlatform().build(Counter(), build_dir=root, nextpnr_opts="--timing-allow-fail")
+
+            with open(os.path.join(root, "top.seeds.json")) as f:
+                results = json.load(f)
+            with open(os.path.join(self.tools.name, "nextpnr-invocations")) as f:
+                invocations = f.read().splitlines()
+
+        self.assertEqual([result["seed"] for result in results], [1, 2, 3])
+        self.assertTrue(all(result["exit_status"] == 0 for result in results))
+        self.assertEqual(max(results, key=lambda result: result["worst_slack"])["seed"], 3)
+
+        # Each seed is added to the platform's own nextpnr options; rather than replacing them.
+        self.assertEqual(len(invocations), 3)
+        for seed in (1, 2, 3):
+            self.assertTrue(any(f"--timing-allow-fail --seed {seed}" in line for line in invocations))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Tests for the unified timing reports; run against excerpts of each toolchain's output. """
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from luna_boards.clocktree import ClockTreeReport, DomainReport
+from luna_boards.timing    import timing_report
+
+
+# An excerpt of Vivado's ``report_timing_summary``; clk100 has no timed paths of its own.
+VIVADO_TIMING_SUMMARY = """\
+------------------------------------------------------------------------------------------------
+| Clock Summary
+| -------------
+------------------------------------------------------------------------------------------------
+
+Clock         Waveform(ns)         Period(ns)      Frequency(MHz)
+-----         ------------         ----------      --------------
+clk100        {0.000 5.000}        10.000          100.000
+  clk_sync    {0.000 4.000}        8.000           125.000
+  clk_fast    {0.000 2.000}        4.000           250.000
+usb_clk       {0.000 8.333}        16.667          60.000
+
+
+------------------------------------------------------------------------------------------------
+| Intra Clock Table
+| -----------------
+------------------------------------------------------------------------------------------------
+
+Clock               WNS(ns)      TNS(ns)      TNS Failing Endpoints      TNS Total Endpoints      WHS(ns)      THS(ns)
+-----               -------      -------      ---------------------      -------------------      -------      -------
+clk100
+  clk_sync            1.250        0.000                          0                     1024        0.052        0.000
+  clk_fast           -0.500       -3.000                         10                      200        0.100        0.000
+usb_clk               6.667        0.000                          0                      300        0.080        0.000
+
+"""
+
+# An excerpt of a Quartus ``.sta.rpt``; with two timing models, of which the worst figures count.
+QUARTUS_STA_REPORT = """\
++--------------------------------------------------------------------------------------------+
+; Slow 1200mV 85C Model Fmax Summary                                                         ;
++-----------+-----------------+-------------------------------------------------+------------+
+; Fmax      ; Restricted Fmax ; Clock Name                                      ; Note       ;
++-----------+-----------------+-------------------------------------------------+------------+
+; 95.32 MHz ; 95.32 MHz       ; pll|altpll_component|auto_generated|pll1|clk[0] ;            ;
+; 150.0 MHz ; 150.0 MHz       ; clk_usb                                         ;            ;
++-----------+-----------------+-------------------------------------------------+------------+
+
+
++-------------------------------------------------------------------------------+
+; Slow 1200mV 85C Model Setup Summary                                           ;
++-------------------------------------------------+-------+---------------------+
+; Clock                                           ; Slack ; End Point TNS       ;
++-------------------------------------------------+-------+---------------------+
+; pll|altpll_component|auto_generated|pll1|clk[0] ; 6.175 ; 0.000               ;
+; clk_usb                                         ; 9.999 ; 0.000               ;
++-------------------------------------------------+-------+---------------------+
+
+
++--------------------------------------------------------------------------------------------+
+; Slow 1200mV 0C Model Fmax Summary                                                          ;
++-----------+-----------------+-------------------------------------------------+------------+
+; Fmax      ; Restricted Fmax ; Clock Name                                      ; Note       ;
++-----------+-----------------+-------------------------------------------------+------------+
+; 104.1 MHz ; 104.1 MHz       ; pll|altpll_component|auto_generated|pll1|clk[0] ;            ;
+; 160.0 MHz ; 160.0 MHz       ; clk_usb                                         ;            ;
++-----------+-----------------+-------------------------------------------------+------------+
+
+
++-------------------------------------------------------------------------------+
+; Slow 1200mV 0C Model Setup Summary                                            ;
++-------------------------------------------------+-------+---------------------+
+; Clock                                           ; Slack ; End Point TNS       ;
++-------------------------------------------------+-------+---------------------+
+; pll|altpll_component|auto_generated|pll1|clk[0] ; 7.061 ; 0.000               ;
+; clk_usb                                         ; 10.41 ; 0.000               ;
++-------------------------------------------------+-------+---------------------+
+"""
+
+# An excerpt of a nextpnr log; which reports each clock before and after routing.
+NEXTPNR_LOG = """\
+Info: Max frequency for clock '$glbnet$clk_sync': 140.11 MHz (PASS at 120.00 MHz)
+Info: Max frequency for clock '$glbnet$clk_usb': 72.35 MHz (PASS at 60.00 MHz)
+Info: Routing..
+Info: Max frequency for clock '$glbnet$clk_sync': 112.50 MHz (FAIL at 120.00 MHz)
+Info: Max frequency for clock '$glbnet$clk_usb': 70.01 MHz (PASS at 60.00 MHz)
+"""
+
+
+def _clock_tree(*domains):
+    """ Returns a stand-in ClockTreeReport, with the given ``(name, frequency in MHz, source)`` domains. """
+    return ClockTreeReport("fake", "FakeDomainGenerator", [],
+        [DomainReport(name, frequency and frequency * 1e6, 0.0, source, "none") for name, frequency, source in domains])
+
+
+class TimingReportTest(unittest.TestCase):
+
+    def report(self, filename, contents, tree=None):
+        """ Returns the timing report of a build directory holding only a single report file. """
+
+        with tempfile.TemporaryDirectory() as build_dir:
+            with open(os.path.join(build_dir, filename), "w") as f:
+                f.write(contents)
+
+            if tree is None:
+                return timing_report(build_dir)
+
+            with mock.patch("luna_boards.clocktree.clock_tree", return_value=tree):
+                return timing_report(build_dir, platform=object())
+
+
+    def assertDomains(self, report, expected):
+        """ Checks the domain, configured frequency, fmax and slack (in MHz and ns) of each clock in a report. """
+
+        def rounded(value, scale=1):
+            return None if value is None else round(value / scale, 2)
+
+        self.assertEqual(
+            {(domain.domain, domain.clock): (rounded(domain.configured_frequency, 1e6),
+                rounded(domain.achieved_frequency, 1e6), rounded(domain.slack)) for domain in report.domains},
+            expected)
+
+
+    def test_vivado(self):
+        report = self.report("top_timing.rpt", VIVADO_TIMING_SUMMARY)
+        self.assertDomains(report, {
+            (None,   "clk100"):   (None, None,   None),
+            ("sync", "clk_sync"): (None, 148.15, 1.25),
+            ("fast", "clk_fast"): (None, 222.22, -0.5),
+            ("usb",  "usb_clk"):  (None, 100.0,  6.67),
+        })
+
+        timings = {domain.clock: domain for domain in report.domains}
+        self.assertEqual(timings["clk_fast"].target_frequency, 250e6)
+        self.assertIs(timings["clk_fast"].passed, False)
+        self.assertIs(timings["clk_sync"].passed, True)
+        self.assertIsNone(timings["clk100"].passed)
+
+
+    def test_vivado_with_clock_tree(self):
+        tree = _clock_tree(("sync", 125, "pll.CLKOUT0"), ("ss", 125, "pll.CLKOUT0"),
+            ("fast", 250, "pll.CLKOUT1"), ("usb", None, "external"))
+
+        # The ss domain shares its clock with sync; so it has the same timing.
+        self.assertDomains(self.report("top_timing.rpt", VIVADO_TIMING_SUMMARY, tree), {
+            (None,   "clk100"):   (None, None,   None),
+            ("sync", "clk_sync"): (125,  148.15, 1.25),
+            ("ss",   "clk_sync"): (125,  148.15, 1.25),
+            ("fast", "clk_fast"): (250,  222.22, -0.5),
+            ("usb",  "usb_clk"):  (None, 100.0,  6.67),
+        })
+
+
+    def test_quartus(self):
+        report = self.report("top.sta.rpt", QUARTUS_STA_REPORT)
+
+        # Without a clock tree, a clock named for its PLL output can't be mapped onto a domain.
+        self.assertDomains(report, {
+            (None,  "pll|altpll_component|auto_generated|pll1|clk[0]"): (None, 95.32, 6.17),
+            ("usb", "clk_usb"):                                         (None, 150.0, 10.0),
+        })
+
+        timings = {domain.clock: domain for domain in report.domains}
+        self.assertAlmostEqual(timings["clk_usb"].target_frequency / 1e6, 60, places=2)
+
+
+    def test_quartus_with_clock_tree(self):
+        tree = _clock_tree(("sync", 60, "pll.clk[0]"), ("fast", 60, "pll.clk[0]"), ("usb", None, "external"))
+
+        self.assertDomains(self.report("top.sta.rpt", QUARTUS_STA_REPORT, tree), {
+            ("sync", "pll|altpll_component|auto_generated|pll1|clk[0]"): (60, 95.32, 6.17),
+            ("fast", "pll|altpll_component|auto_generated|pll1|clk[0]"): (60, 95.32, 6.17),
+            ("usb",  "clk_usb"):                                         (None, 150.0, 10.0),
+        })
+
+
+    def test_nextpnr(self):
+        report = self.report("top.tim", NEXTPNR_LOG)
+
+        # Only the post-route figures count.
+        self.assertDomains(report, {
+            ("sync", "$glbnet$clk_sync"): (None, 112.5, -0.56),
+            ("usb",  "$glbnet$clk_usb"):  (None, 70.01, 2.38),
+        })
+
+
+    def test_nextpnr_with_clock_tree(self):
+        tree = _clock_tree(("sync", 120, "pll.CLKOS"), ("fast", 120, "pll.CLKOS"), ("usb", 60, "fs_pll.CLKOP"))
+
+        self.assertDomains(self.report("top.tim", NEXTPNR_LOG, tree), {
+            ("sync", "$glbnet$clk_sync"): (120, 112.5, -0.56),
+            ("fast", "$glbnet$clk_sync"): (120, 112.5, -0.56),
+            ("usb",  "$glbnet$clk_usb"):  (60,  70.01, 2.38),
+        })
+
+
+    def test_missing_report(self):
+        with tempfile.TemporaryDirectory() as build_dir:
+            with self.assertRaises(FileNotFoundError):
+                timing_report(build_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2020 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Tests for our Vivado build flow extensions; run against a fake Vivado. """
+
+import os
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+try:
+    from amaranth.hdl import Fragment
+
+    from luna_boards.genesys2      import Genesys2Platform
+    from luna_boards.netv2         import NeTV2Platform
+    from luna_boards.phy.genesys2  import Genesys2GTXSuperSpeedPHY
+    from luna_boards.phy.netv2     import NeTV2SuperSpeedPHY
+except ImportError:
+    Fragment = None
+
+from luna_boards.vivado import out_of_context_overrides
+
+
+# Stands in for Vivado; "synthesizing" a module by writing the checkpoint its script asks for.
+FAKE_VIVADO = """#!{python}
+import re, sys
+with open(sys.argv[sys.argv.index("-source") + 1]) as f:
+    checkpoint = re.search(r"write_checkpoint -force (\\S+)", f.read()).group(1)
+open(checkpoint, "w").close()
+"""
+
+
+@unittest.skipIf(Fragment is None, "Amaranth, LUNA or a 7-series Amaranth platform is not available")
+@unittest.skipIf(os.name == "nt", "the fake Vivado is started as a script")
+class OutOfContextModuleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        vivado = os.path.join(self.directory.name, "vivado")
+        with open(vivado, "w") as f:
+            f.write(FAKE_VIVADO.format(python=sys.executable))
+        os.chmod(vivado, 0o755)
+
+        self.checkpoints = os.path.join(self.directory.name, "ooc")
+        patcher = mock.patch.dict(os.environ, {"VIVADO": vivado, "LUNA_VIVADO_OOC": self.checkpoints})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def check_phy(self, platform_class, phy_class, name):
+        platform = platform_class()
+        Fragment.get(phy_class(platform), platform)
+
+        # Our block has been replaced by a black box...
+        stubs = [filename for filename in platform.extra_files if filename.startswith(name)]
+        self.assertEqual(len(stubs), 1)
+        module = stubs[0][:-len("_stub.v")]
+        stub   = platform.extra_files[stubs[0]]
+        self.assertTrue(stub.startswith(f"(* black_box *)\nmodule {module}("))
+        self.assertRegex(stub, r"input clk_\d+")
+        self.assertRegex(stub, r"output \[15:0\] rx_data_\d+")
+
+        # ... whose cached checkpoint is linked in after synthesis; once.
+        checkpoint = os.path.join(self.checkpoints, module, f"{module}.dcp")
+        self.assertTrue(os.path.exists(checkpoint))
+        overrides = out_of_context_overrides(platform, {})
+        self.assertEqual(overrides["script_after_synth"],
+            f"read_checkpoint -cell [get_cells -hierarchical -filter {{REF_NAME == {module}}}] {{{checkpoint}}}")
+        self.assertEqual(out_of_context_overrides(platform, {}), {})
+
+
+    def test_genesys2_gtx_phy(self):
+        self.check_phy(Genesys2Platform, Genesys2GTXSuperSpeedPHY, "genesys2_gtx_serdes_")
+
+
+    def test_netv2_phy(self):
+        self.check_phy(NeTV2Platform, NeTV2SuperSpeedPHY, "netv2_gtp_serdes_")
+
+
+if __name__ == "__main__":
+    unittest.main()